@@ -1,26 +1,38 @@
-from tools import use_gemini, use_deepseek
-from config import llms_config
-from langchain_core.messages import AIMessage, SystemMessage
-import streamlit as st
+import asyncio
+import os
+import time
+import uuid
+from dataclasses import dataclass, field
+from tools import use_gemini, use_deepseek, use_sympy, agemini, adeepseek, asympy, astream_gemini, astream_deepseek, astream_sympy, gemini_prompt, deepseek_prompt
+from async_utils import run_sync, iter_sync
+from config import llms_config, SYSTEM_PROMPT
+from latex_utils import StreamingLatexFormatter, normalize_latex, split_blocks
+from answer_cache import answer_cache, normalize_question, CACHE_ENABLED, CACHED_TOOLS
+from context_window import build_context, estimate_tokens
+from router import route_question, RouteDecision, ROUTER_CONFIDENCE_THRESHOLD
+from speculation import Speculation, hedged_stream, speculation_stats, SPECULATE, SPECULATE_MIN_CONFIDENCE, HEDGE_AFTER
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+import status
+import metrics
+import resilience
+import compute
+import scheduler
+from knowledge_index import knowledge_index
 
-# --- Load LLMs & bind tools once ---
-llm_gemini, llm_deepseek = llms_config.get_llms()
-tools = [use_gemini, use_deepseek]
-agent = llm_gemini.bind_tools(tools)
+# --- Tools are bound lazily, once per process ---
+tools = [use_gemini, use_deepseek, use_sympy]
 
-def clean_latex_with_gemini(text: str) -> str:
-    """Uses Gemini to fix unformatted LaTeX expressions."""
-
-    if 'loading_placeholder' in st.session_state:
-        st.session_state.loading_placeholder.markdown("✨ **Formatting ...**")
+def get_agent():
+    """Gemini with the tools bound, shared through the model registry."""
+    return llms_config.get_or_create("agent", lambda: llms_config.get_gemini().bind_tools(tools))
 
-    try:
-        # Vérifier si le texte est trop long pour le nettoyage
-        if len(text) > 8000:  # Limite de sécurité
-            st.warning("Response too long for LaTeX cleaning, returning original.")
-            return text
+# --- LaTeX cleanup ---
+CLEANUP_CHUNK_CHARS = 3000   # Suspect blocks are grouped up to this size per LLM call
+CLEANUP_MAX_CHARS = 8000     # Limite de sécurité: a single block above this is left as is
+CLEANUP_PARALLELISM = 4
 
-        cleaning_prompt = f"""
+def cleaning_prompt(text: str) -> str:
+    return f"""
 Role:
 You are a post-processing assistant. You are given a math explanation that may contain LaTeX expressions that are not properly formatted.
 
@@ -36,78 +48,330 @@ Here is the original text:
 
 {text}
 """
-        response = llm_gemini.invoke(cleaning_prompt)
+
+def _cleanup_chunks(text: str):
+    """Splits `text` at safe boundaries into `(chunk, balanced)` pairs; neighbouring suspect blocks are grouped."""
+    chunks = []
+    for block in split_blocks(text):
+        balanced = normalize_latex(block).balanced
+        if chunks and not balanced and not chunks[-1][1] and len(chunks[-1][0]) + len(block) <= CLEANUP_CHUNK_CHARS:
+            chunks[-1] = (chunks[-1][0] + block, False)
+        else:
+            chunks.append((block, balanced))
+    return chunks
+
+async def _aclean_chunk(chunk: str) -> str:
+    """Cleans one chunk with Gemini; the original is kept if the result fails validation."""
+    # Vérifier si le bloc est trop long pour le nettoyage
+    if len(chunk) > CLEANUP_MAX_CHARS:
+        status.warning("A block is too long for LaTeX cleaning, keeping it as is.")
+        metrics.inc("euclidia_latex_cleanup_total", result="too_long")
+        return chunk
+
+    try:
+        with metrics.span("latex_cleanup_llm", chars=len(chunk)) as record:
+            llm = llms_config.get_gemini()
+            prompt = cleaning_prompt(chunk)
+            response = await resilience.call("gemini", lambda: llm.ainvoke(prompt), record=record, tokens=estimate_tokens(prompt))
+            metrics.record_tokens(record, "gemini", response)
+        cleaned = response.content.strip() if isinstance(response.content, str) else ""
 
         # Vérifier que la réponse n'est pas vide ou tronquée
-        if not response.content or len(response.content.strip()) < len(text) * 0.5:
-            st.warning("LaTeX cleaning may have truncated the response, returning original.")
-            return text
+        if not cleaned or len(cleaned) < len(chunk.strip()) * 0.5:
+            status.warning("LaTeX cleaning may have truncated a block, keeping the original.")
+            metrics.inc("euclidia_latex_cleanup_total", result="truncated")
+            return chunk
+
+        if not normalize_latex(cleaned).balanced:
+            metrics.inc("euclidia_latex_cleanup_total", result="unbalanced")
+            return chunk
 
-        return response.content.strip()
+        metrics.inc("euclidia_latex_cleanup_total", result="llm")
+        # Keep the surrounding whitespace so the blocks stitch back together
+        leading = chunk[:len(chunk) - len(chunk.lstrip())]
+        trailing = chunk[len(chunk.rstrip()):]
+        return leading + cleaned + trailing
 
     except Exception as e:
-        st.warning(f"LaTeX cleaning failed: {e}. Returning original text.")
-        return text
+        status.warning(f"LaTeX cleaning failed: {e}. Keeping the original block.")
+        metrics.inc("euclidia_latex_cleanup_total", result="failed")
+        return chunk
+
+async def aclean_latex_with_gemini(text: str) -> str:
+    """Uses Gemini to fix unformatted LaTeX expressions.
+
+    The text is split at blank lines outside math and environments; only the blocks
+    the local pass cannot balance are sent, in parallel, so latency follows the
+    largest suspect block rather than the whole answer.
+    """
+
+    status.set_status("✨ **Formatting ...**")
+
+    try:
+        slots = asyncio.Semaphore(CLEANUP_PARALLELISM)
+
+        async def clean(chunk, balanced):
+            if balanced:
+                return chunk
+            async with slots:
+                return await _aclean_chunk(chunk)
+
+        parts = await asyncio.gather(*(clean(chunk, balanced) for chunk, balanced in _cleanup_chunks(text)))
+        return "".join(parts)
     finally:
-        if 'loading_placeholder' in st.session_state:
-            st.session_state.loading_placeholder.empty()
+        status.clear_status()
+
+async def aclean_latex(text: str) -> str:
+    """Normalizes LaTeX delimiters locally, falling back to Gemini only if they can't be balanced."""
+    with metrics.span("latex_cleanup"):
+        check = normalize_latex(text)
+    if check.balanced:
+        metrics.inc("euclidia_latex_cleanup_total", result="local")
+        return check.text
+
+    # The local pass found delimiters it can't fix: let the LLM rewrite the faulty blocks
+    return normalize_latex(await aclean_latex_with_gemini(text)).text
+
+def clean_latex_with_gemini(text: str) -> str:
+    return run_sync(aclean_latex_with_gemini(text))
+
+def clean_latex(text: str) -> str:
+    return run_sync(aclean_latex(text))
 
 # --- Agent logic ---
-def prompt_ai(messages):
-    """Handles tool call and returns the tool output directly (no synthesis)."""
-    max_history = 15
-    system_msgs = [msg for msg in messages if isinstance(msg, SystemMessage)]
-
-    # Logique de troncature corrigée
-    if len(messages) <= max_history:
-        recent_msgs = messages
-    else:
-        # Garder tous les messages système + les derniers messages non-système
-        non_system_msgs = [msg for msg in messages if not isinstance(msg, SystemMessage)]
-        max_non_system = max(1, max_history - len(system_msgs))  # Au moins 1 message non-système
-        recent_msgs = system_msgs + non_system_msgs[-max_non_system:]
+def _last_question(messages):
+    """Returns the content of the last HumanMessage, or an empty string."""
+    for msg in reversed(messages):
+        if isinstance(msg, HumanMessage):
+            return msg.content.strip() if isinstance(msg.content, str) else ""
+    return ""
+
+def _is_follow_up(messages):
+    """True when the last question may depend on earlier turns."""
+    return sum(1 for msg in messages if isinstance(msg, HumanMessage)) > 1
+
+def _cached_message(entry, source):
+    """Builds the AIMessage returned for a cache hit."""
+    return AIMessage(content=entry.answer, response_metadata={
+        "route": {"tool": entry.tool, "confidence": 1.0, "source": source, "reasons": []},
+        "cache": "hit",
+    })
 
+def _local_decision(messages):
+    question = _last_question(messages)
+    return route_question(question, has_history=_is_follow_up(messages)) if question else RouteDecision()
+
+async def _route(messages, usage, decision=None):
+    """Picks the tool, locally when the router is confident, otherwise through the agent.
+
+    Returns `(tool_name, question, decision)` when a tool should run, otherwise an
+    AIMessage that should be returned to the user as-is. Token accounting for the
+    routing call is added to `usage`.
+    """
+    question = _last_question(messages)
+    if decision is None:
+        decision = _local_decision(messages)
+    if decision.tool and decision.confidence >= ROUTER_CONFIDENCE_THRESHOLD:
+        return decision.tool, question, decision
+
+    context, stats = build_context(messages)
+    usage["router"] = stats.as_dict()
     try:
-        response = agent.invoke(recent_msgs)
+        with metrics.span("route_llm", input_tokens_estimate=stats.input_tokens) as record:
+            agent = get_agent()
+            response = await resilience.call("gemini", lambda: agent.ainvoke(context), timeout=resilience.ROUTER_TIMEOUT,
+                                             record=record, tokens=stats.input_tokens)
+            metrics.record_tokens(record, "gemini", response)
+    except Exception as e:
+        if not decision.tool:
+            raise
+        # Degrade to the local router's best guess rather than failing the question
+        status.warning(f"Routing agent unavailable ({e}), using the local router.")
+        resilience.note_fallback("route", "agent", "local", e)
+        return decision.tool, question, RouteDecision(tool=decision.tool, confidence=decision.confidence, source="local-fallback", reasons=decision.reasons)
+
+    # Check if the response has valid tool calls
+    if not hasattr(response, "tool_calls") or not isinstance(response.tool_calls, list) or not response.tool_calls:
+        return response  # No tool call detected, return the agent's response directly
+
+    # Warn the user if multiple tool calls are detected and handle only the first one
+    if len(response.tool_calls) > 1:
+        return AIMessage(content="⚠️ Multiple tool calls detected. Only the first one will be processed.")
+
+    tool_call = response.tool_calls[0]
+
+    # Safely access 'name' and 'args'
+    tool_name = tool_call.get("name", None)
+
+    args = tool_call.get("args", {})
+
+    if not tool_name:
+        return AIMessage(content="❌ Invalid tool call: missing 'name' key.")
+
+
+    question = args.get("question", "").strip()
+    if not question:
+        return AIMessage(content="❌ Invalid tool call: missing or empty 'question' argument.")
+
+    if tool_name not in ("use_gemini", "use_deepseek", "use_sympy"):
+        return AIMessage(content=f"❌ Unknown tool '{tool_name}'.")
+
+    # Report how much the local router agreed with the agent's choice
+    if decision.tool is None:
+        local_confidence = 0.0
+    elif decision.tool == tool_name:
+        local_confidence = decision.confidence
+    else:
+        local_confidence = 1 - decision.confidence
+    return tool_name, question, RouteDecision(tool=tool_name, confidence=local_confidence, source="agent", reasons=decision.reasons)
+
+TOOL_PROMPTS = {"use_gemini": gemini_prompt, "use_deepseek": deepseek_prompt}  # use_sympy sends no prompt
+TOOL_STREAMS = {"use_gemini": astream_gemini, "use_deepseek": astream_deepseek, "use_sympy": astream_sympy}
+
+def _tool_tokens(tool_name, question):
+    prompt = TOOL_PROMPTS.get(tool_name)
+    return estimate_tokens(prompt(question)) if prompt else 0
+
+def _tool_usage(usage, tool_name, question):
+    """Adds the estimated input tokens of the tool call and the per-call total."""
+    usage["tool_input_tokens"] = _tool_tokens(tool_name, question)
+    usage["input_tokens"] = usage.get("router", {}).get("input_tokens", 0) + usage["tool_input_tokens"]
+    return usage
+
+# --- Speculative and hedged tool calls ---
+def _tool_stream(tool_name, question, hedge_after=0, execution=None):
+    """Streams the tool's answer, with a backup request after `hedge_after` seconds without a token."""
+    factory = lambda: TOOL_STREAMS[tool_name](question)
+    if not hedge_after:
+        return factory()
+    return hedged_stream(factory, hedge_after, _tool_tokens(tool_name, question), execution)
+
+def _speculate(messages, decision, hedge_after):
+    """Starts the tool the local router expects while the agent is routing.
+
+    Returns None when there is no routing call to overlap (the router decided
+    locally), for follow-ups (the agent may rewrite them), or when the guess is too weak.
+    """
+    if not decision.tool or _is_follow_up(messages):
+        return None
+    if not SPECULATE_MIN_CONFIDENCE <= decision.confidence < ROUTER_CONFIDENCE_THRESHOLD:
+        return None
+    question = _last_question(messages)
+    return Speculation(decision.tool, lambda: _tool_stream(decision.tool, question, hedge_after), _tool_tokens(decision.tool, question))
+
+def _open_tool(tool_name, question, speculation, hedge_after, execution):
+    """Returns the tool's answer stream, reusing the speculative call when it guessed right."""
+    if speculation:
+        if speculation.tool_name == tool_name:
+            execution["speculation"] = speculation.keep()
+            return speculation.call.stream()
+        execution["speculation"] = speculation.discard()
+    return _tool_stream(tool_name, question, hedge_after, execution)
 
-        # Check if the response has valid tool calls
-        if not hasattr(response, "tool_calls") or not isinstance(response.tool_calls, list) or not response.tool_calls:
-            return response  # No tool call detected, return the agent's response directly
+async def _compute(messages):
+    """Answers a computational question with the local SymPy engine, before any LLM call.
 
-        # Warn the user if multiple tool calls are detected and handle only the first one
-        if len(response.tool_calls) > 1:
-            return AIMessage(content="⚠️ Multiple tool calls detected. Only the first one will be processed.")
+    Returns an AIMessage, or None when the question is not purely computational
+    (or SymPy can't answer it confidently) and should go through the tools.
+    """
+    question = _last_question(messages)
+    if not compute.COMPUTE_ENABLED or not question or compute.match_question(question) is None:
+        return None
+    with metrics.span("compute") as record:
+        result = await compute.acompute(question)
+        record["kind"] = result.kind if result else None
+    if result is None:
+        return None
+    return AIMessage(content=result.answer, response_metadata={
+        "route": {"tool": "use_sympy", "confidence": 1.0, "source": "compute", "reasons": [f"compute:{result.kind}"]},
+        "cache": "none",
+    })
 
-        tool_call = response.tool_calls[0]
+def _knowledge(question, decision):
+    """Answers a definition or a named theorem from the local knowledge index, before calling Gemini.
 
-        # Safely access 'name' and 'args'
-        tool_name = tool_call.get("name", None)
+    Returns an AIMessage, or None when the index has no confident match or the
+    local router is confident the question needs another tool.
+    """
+    if not question or (decision.tool not in (None, "use_gemini") and decision.confidence >= ROUTER_CONFIDENCE_THRESHOLD):
+        return None
+    with metrics.span("knowledge") as record:
+        match = knowledge_index.lookup(question)
+        record["entry"] = match.entry.id if match else None
+    if match is None:
+        return None
+    return AIMessage(content=match.answer, response_metadata={
+        "route": {"tool": "use_gemini", "confidence": match.score, "source": "knowledge", "reasons": [f"knowledge:{match.entry.id}"]},
+        "cache": "none",
+    })
 
-        args = tool_call.get("args", {})
+async def _cache_lookup(messages):
+    """Looks up a standalone question before routing (follow-ups need the conversation)."""
+    question = _last_question(messages)
+    if not question or _is_follow_up(messages):
+        return None
+    return await answer_cache.aget(question)
 
-        if not tool_name:
-            return AIMessage(content="❌ Invalid tool call: missing 'name' key.")
+def _needs_cache_lookup(messages, question, follow_up):
+    """Whether the routed question still has to be looked up (not when `_cache_lookup` already missed it)."""
+    return follow_up or normalize_question(question) != normalize_question(_last_question(messages))
 
+async def _prompt_ai_async(messages, use_cache, speculative, hedge_after):
+    """Untraced implementation of `prompt_ai_async`."""
+    usage = {}
+    execution = {}
+    speculation = None
+    try:
+        if use_cache:
+            entry = await _cache_lookup(messages)
+            if entry:
+                return _cached_message(entry, "cache")
+        else:
+            answer_cache.record_bypass()
+
+        computed = await _compute(messages)
+        if computed:
+            return computed
+
+        decision = _local_decision(messages)
+        follow_up = _is_follow_up(messages)
+        known = None if follow_up else _knowledge(_last_question(messages), decision)
+        if known:
+            return known
+        if speculative:
+            speculation = _speculate(messages, decision, hedge_after)
 
-        question = args.get("question", "").strip()
-        if not question:
-            return AIMessage(content="❌ Invalid tool call: missing or empty 'question' argument.")
+        route = await _route(messages, usage, decision)
+        if isinstance(route, AIMessage):
+            return route
+        tool_name, question, decision = route
+
+        # The agent may have rewritten a follow-up into a standalone question
+        if use_cache and tool_name in CACHED_TOOLS and _needs_cache_lookup(messages, question, follow_up):
+            entry = await answer_cache.aget(question, tool_name)
+            if entry:
+                return _cached_message(entry, decision.source)
+        known = _knowledge(question, decision) if follow_up and tool_name == "use_gemini" else None
+        if known:
+            return known
 
         # Safely select the appropriate tool
         selected_tool = {
-            "use_gemini": use_gemini,
-            "use_deepseek": use_deepseek,
-        }.get(tool_name)
-
-        if not selected_tool:
-            return AIMessage(content=f"❌ Unknown tool '{tool_name}'.")
+            "use_gemini": agemini,
+            "use_deepseek": adeepseek,
+            "use_sympy": asympy,
+        }[tool_name]
 
         # Invoke the tool and check its output
-        tool_output = selected_tool.invoke(question)
+        _tool_usage(usage, tool_name, question)
+        if speculation or hedge_after:
+            tool_output = "".join([chunk async for chunk in _open_tool(tool_name, question, speculation, hedge_after, execution)])
+        else:
+            tool_output = await selected_tool(question)
 
-        # If the tool was DeepSeek, clean the output via Gemini
-        if tool_name == "use_deepseek":
-            tool_output = clean_latex_with_gemini(tool_output)
+        # If the tool was DeepSeek (or SymPy, which may fall back to it), normalize its LaTeX
+        if tool_name in ("use_deepseek", "use_sympy"):
+            tool_output = await aclean_latex(tool_output)
 
         # Improved validation with better error messages
         if tool_output is None:
@@ -119,7 +383,238 @@ def prompt_ai(messages):
         if not tool_output.strip():
             return AIMessage(content="❌ Tool returned empty string after stripping whitespace.")
 
-        return AIMessage(content=tool_output)
+        if use_cache and tool_name in CACHED_TOOLS and not resilience.degraded():
+            await answer_cache.aput(question, tool_name, tool_output)
+
+        metadata = {
+            "route": decision.as_dict(),
+            "cache": "miss" if use_cache else "bypass",
+            "usage": usage,
+        }
+        if execution:
+            metadata["execution"] = execution
+        return AIMessage(content=tool_output, response_metadata=metadata)
 
     except Exception as e:
         return AIMessage(content=f"❌ An error occurred during processing: {e}")
+    finally:
+        if speculation:
+            speculation.discard()  # No-op when it was kept
+
+async def _prompt_ai_astream(messages, info, use_cache, speculative, hedge_after):
+    """Untraced implementation of `prompt_ai_astream`."""
+    speculation = None
+    try:
+        if use_cache:
+            entry = await _cache_lookup(messages)
+            if entry:
+                info.update(_cached_message(entry, "cache").response_metadata)
+                yield entry.answer
+                return
+        else:
+            answer_cache.record_bypass()
+
+        computed = await _compute(messages)
+        if computed:
+            info.update(computed.response_metadata)
+            yield computed.content
+            return
+
+        decision = _local_decision(messages)
+        follow_up = _is_follow_up(messages)
+        known = None if follow_up else _knowledge(_last_question(messages), decision)
+        if known:
+            info.update(known.response_metadata)
+            yield known.content
+            return
+
+        usage = info.setdefault("usage", {})
+        if speculative:
+            speculation = _speculate(messages, decision, hedge_after)
+
+        route = await _route(messages, usage, decision)
+        if isinstance(route, AIMessage):
+            yield route.content if isinstance(route.content, str) else str(route.content)
+            return
+        tool_name, question, decision = route
+        info["route"] = decision.as_dict()
+
+        if use_cache and tool_name in CACHED_TOOLS and _needs_cache_lookup(messages, question, follow_up):
+            entry = await answer_cache.aget(question, tool_name)
+            if entry:
+                info["cache"] = "hit"
+                yield entry.answer
+                return
+        known = _knowledge(question, decision) if follow_up and tool_name == "use_gemini" else None
+        if known:
+            info.update(known.response_metadata)
+            yield known.content
+            return
+        info["cache"] = "miss" if use_cache else "bypass"
+        _tool_usage(usage, tool_name, question)
+
+        execution = {}
+        stream = _open_tool(tool_name, question, speculation, hedge_after, execution)
+        if execution:
+            info["execution"] = execution
+
+        formatter = StreamingLatexFormatter()
+        answer = ""
+        try:
+            async for chunk in stream:
+                text = formatter.feed(chunk)
+                if text:
+                    answer += text
+                    yield text
+        finally:
+            await stream.aclose()  # Aborts the upstream call if the consumer stopped early
+        rest = formatter.flush()
+        if rest:
+            answer += rest
+            yield rest
+
+        if use_cache and tool_name in CACHED_TOOLS and not resilience.degraded():
+            await answer_cache.aput(question, tool_name, answer)
+
+    except Exception as e:
+        yield f"❌ An error occurred during processing: {e}"
+    finally:
+        if speculation:
+            speculation.discard()  # No-op when it was kept
+
+# --- Traced entry points ---
+metrics.metrics.register_collector(lambda: {f"euclidia_answer_cache_{key}": value for key, value in answer_cache.get_stats().items()})
+metrics.metrics.register_collector(lambda: {f"euclidia_speculation_{key}": value for key, value in speculation_stats.get_stats().items()})
+
+def _record_request(current, metadata, scope=None):
+    """Counts the call by route and cache result, and attaches the fallbacks and the trace summary."""
+    if scope is not None and scope.fallbacks:
+        metadata["fallbacks"] = scope.fallbacks
+    route = metadata.get("route") or {}
+    metrics.inc("euclidia_requests_total", tool=route.get("tool") or "none", source=route.get("source") or "agent", cache=metadata.get("cache") or "none")
+    if current is not None:
+        current.attrs.update({"route": route, "cache": metadata.get("cache"), "usage": metadata.get("usage"), "fallbacks": metadata.get("fallbacks")})
+        metadata["trace"] = current.summary()
+
+async def prompt_ai_async(messages, use_cache=CACHE_ENABLED, speculative=SPECULATE, hedge_after=HEDGE_AFTER):
+    """Handles tool call and returns the tool output directly (no synthesis).
+
+    The routing decision is reported in `response_metadata["route"]` and the
+    estimated input tokens in `response_metadata["usage"]`. Answers are served from
+    and stored in the shared answer cache unless `use_cache` is False.
+    With `speculative`, the likely tool starts while the agent is routing; with
+    `hedge_after`, a backup request is sent if no token arrived after that many
+    seconds. Their outcome is reported in `response_metadata["execution"]`.
+    Provider calls share the request deadline and are retried on transient errors;
+    degraded answers (Gemini standing in for DeepSeek, local routing) are listed in
+    `response_metadata["fallbacks"]`.
+    The call is traced: per-stage timings are in `response_metadata["trace"]`.
+    """
+    with metrics.trace("prompt_ai") as current, resilience.request_scope() as scope:
+        response = await _prompt_ai_async(messages, use_cache, speculative, hedge_after)
+        if response.response_metadata is None:
+            response.response_metadata = {}
+        _record_request(current, response.response_metadata, scope)
+    return response
+
+async def prompt_ai_astream(messages, info=None, use_cache=CACHE_ENABLED, speculative=SPECULATE, hedge_after=HEDGE_AFTER):
+    """Streaming version of `prompt_ai_async`: yields the answer as text chunks.
+
+    The tool output is streamed token by token; cancelling the consumer aborts the upstream call.
+    DeepSeek output goes through the local streaming LaTeX formatter instead of the
+    Gemini cleanup call, so nothing forces the answer to be buffered.
+    If `info` is a dict, the routing decision, cache status, token usage,
+    speculation/hedging outcome, fallbacks and per-stage timings are stored in it.
+    """
+    info = {} if info is None else info
+    with metrics.trace("prompt_ai_stream") as current, resilience.request_scope() as scope:
+        async for chunk in _prompt_ai_astream(messages, info, use_cache, speculative, hedge_after):
+            yield chunk
+        _record_request(current, info, scope)
+
+# --- Problem sets (independent questions answered concurrently) ---
+BATCH_CONCURRENCY = int(os.getenv("EUCLIDIA_BATCH_CONCURRENCY", "4"))
+
+@dataclass
+class BatchResult:
+    index: int          # Position of the question in the batch
+    question: str
+    answer: str
+    metadata: dict = field(default_factory=dict)  # Same keys as the `response_metadata` of `prompt_ai_async`
+    seconds: float = 0.0    # Time spent answering this question
+    finished: float = 0.0   # Time since the start of the batch
+
+    def as_dict(self):
+        return {"index": self.index, "question": self.question, "answer": self.answer, "seconds": round(self.seconds, 3),
+                "finished": round(self.finished, 3), **self.metadata}
+
+async def prompt_ai_batch_astream(questions, concurrency=BATCH_CONCURRENCY, use_cache=CACHE_ENABLED):
+    """Answers independent questions concurrently; yields a BatchResult as each one finishes.
+
+    Each question is answered on its own (system prompt + question) by `prompt_ai_async`,
+    at most `concurrency` at a time. The batch's provider calls share one fair-queuing
+    session (the caller's, if any), so a long problem set takes turns with the other
+    users instead of filling the provider queues; `concurrency` is capped at the
+    scheduler's per-session queue limit so the batch never gets its own calls rejected.
+    Warnings and errors are reported with a "Question N:" prefix. Closing the generator
+    cancels the questions still running.
+    """
+    system = SystemMessage(content=SYSTEM_PROMPT)
+    slots = asyncio.Semaphore(max(1, min(concurrency, scheduler.MAX_QUEUE_PER_SESSION)))
+    started = time.perf_counter()
+
+    async def answer(index, question):
+        async with slots:
+            item_started = time.perf_counter()
+            with status.use_reporter(status.ItemReporter(f"Question {index + 1}: ")):
+                response = await prompt_ai_async([system, HumanMessage(content=question)], use_cache=use_cache)
+            now = time.perf_counter()
+            content = response.content if isinstance(response.content, str) else str(response.content)
+            return BatchResult(index, question, content, response.response_metadata or {}, now - item_started, now - started)
+
+    with scheduler.use_session(scheduler.current_session() or f"batch-{uuid.uuid4().hex}"):
+        tasks = [asyncio.ensure_future(answer(index, question)) for index, question in enumerate(questions)]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            yield await next_done
+            metrics.inc("euclidia_batch_questions_total")
+        metrics.observe("euclidia_batch_seconds", time.perf_counter() - started)
+    finally:
+        for task in tasks:
+            task.cancel()  # No-op for the questions already answered
+
+async def prompt_ai_batch_async(questions, concurrency=BATCH_CONCURRENCY, use_cache=CACHE_ENABLED):
+    """Non-streaming `prompt_ai_batch_astream`: the results in the order of `questions`."""
+    results = [result async for result in prompt_ai_batch_astream(questions, concurrency=concurrency, use_cache=use_cache)]
+    return sorted(results, key=lambda result: result.index)
+
+# --- Synchronous API (thin wrappers running the async pipeline on the shared loop) ---
+def prompt_ai(messages, use_cache=CACHE_ENABLED, speculative=SPECULATE, hedge_after=HEDGE_AFTER):
+    """Synchronous `prompt_ai_async`."""
+    return run_sync(prompt_ai_async(messages, use_cache=use_cache, speculative=speculative, hedge_after=hedge_after))
+
+def prompt_ai_stream(messages, info=None, use_cache=CACHE_ENABLED, heartbeat=None, speculative=SPECULATE, hedge_after=HEDGE_AFTER):
+    """Synchronous `prompt_ai_astream`.
+
+    With `heartbeat`, None is yielded every `heartbeat` seconds while waiting, so the
+    caller can check whether it should stop; closing the generator cancels the call.
+    """
+    chunks = iter_sync(prompt_ai_astream(messages, info=info, use_cache=use_cache, speculative=speculative, hedge_after=hedge_after), heartbeat=heartbeat)
+    try:
+        for chunk in chunks:
+            yield chunk
+    finally:
+        chunks.close()
+
+def prompt_ai_batch(questions, concurrency=BATCH_CONCURRENCY, use_cache=CACHE_ENABLED):
+    """Synchronous `prompt_ai_batch_async`."""
+    return run_sync(prompt_ai_batch_async(questions, concurrency=concurrency, use_cache=use_cache))
+
+def prompt_ai_batch_stream(questions, concurrency=BATCH_CONCURRENCY, use_cache=CACHE_ENABLED, heartbeat=None):
+    """Synchronous `prompt_ai_batch_astream` (heartbeats and cancellation as in `prompt_ai_stream`)."""
+    results = iter_sync(prompt_ai_batch_astream(questions, concurrency=concurrency, use_cache=use_cache), heartbeat=heartbeat)
+    try:
+        for result in results:
+            yield result
+    finally:
+        results.close()
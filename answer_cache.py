@@ -0,0 +1,222 @@
+"""Answer cache shared by every Streamlit session and process.
+
+Answers are keyed on the normalized question and the tool that produced them.
+A small in-memory LRU sits in front of a SQLite file, so restarts and all
+workers on the same machine reuse what was already paid for.
+"""
+import asyncio
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from dataclasses import dataclass
+
+CACHE_ENABLED = os.getenv("EUCLIDIA_CACHE", "1") != "0"
+CACHE_PATH = os.getenv("EUCLIDIA_CACHE_PATH", ".euclidia_cache.sqlite")
+CACHE_TTL = float(os.getenv("EUCLIDIA_CACHE_TTL", str(7 * 24 * 3600)))  # seconds
+CACHE_MEMORY_ENTRIES = int(os.getenv("EUCLIDIA_CACHE_SIZE", "256"))
+CACHE_DISK_ENTRIES = int(os.getenv("EUCLIDIA_CACHE_DISK_SIZE", "20000"))
+
+# --- Question normalization ---
+MATH_SYMBOLS = {
+    "√": " sqrt ", "∛": " cbrt ", "π": " pi ", "∞": " infinity ", "∑": " sum ", "∫": " integral ",
+    "×": "*", "·": "*", "⋅": "*", "÷": "/", "−": "-", "–": "-", "—": "-",
+    "≤": "<=", "≥": ">=", "≠": "!=", "≈": "~", "→": "->",
+    "²": "^2", "³": "^3", "⁴": "^4", "ⁿ": "^n",
+}
+COMMON_TYPOS = {
+    "teorem": "theorem", "therom": "theorem", "theorm": "theorem",
+    "quadrtic": "quadratic", "quadractic": "quadratic", "pythagorian": "pythagorean",
+    "derivitive": "derivative", "derivate": "derivative", "intergral": "integral",
+    "irational": "irrational", "irrationnal": "irrational", "squre": "square",
+    "eqaution": "equation", "equasion": "equation", "proove": "prove", "demonstarte": "demonstrate",
+    "probabilty": "probability", "matrice": "matrix", "fonction": "function", "lenght": "length",
+    "root2": "root 2", "sqrt2": "sqrt 2",
+}
+ERROR_MARKERS = ("[ERROR]", "❌", "⚠️")
+CACHED_TOOLS = ("use_gemini", "use_deepseek")
+
+
+def normalize_question(question: str) -> str:
+    """Canonical form of a question: case, whitespace, unicode math symbols and common typos."""
+    text = question
+    for symbol, replacement in MATH_SYMBOLS.items():
+        text = text.replace(symbol, replacement)
+    text = unicodedata.normalize("NFKC", text).lower()
+    text = re.sub(r"\s*([=+\-*/^<>!~()])\s*", r"\1", text)   # "x ^ 2" == "x^2"
+    words = [COMMON_TYPOS.get(word, word) for word in re.split(r"\s+", text.strip())]
+    text = " ".join(words).lstrip(" ?.!")
+    trailing = re.search(r"[ ?.!]*$", text)
+    body, punctuation = text[:trailing.start()], trailing.group()
+    if re.search(r"[\d)\]}]$", body):
+        body += re.match(r"!*", punctuation).group()  # "5!" is a factorial, not an exclamation
+    return body
+
+
+@dataclass
+class CachedAnswer:
+    question: str
+    tool: str
+    answer: str
+    created: float
+
+
+class AnswerCache:
+    """Bounded LRU + TTL cache persisted to SQLite."""
+
+    def __init__(self, path=CACHE_PATH, max_entries=CACHE_MEMORY_ENTRIES, ttl=CACHE_TTL, max_disk_entries=CACHE_DISK_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_disk_entries = max_disk_entries
+        self.memory = OrderedDict()   # key -> CachedAnswer
+        self.stats = {"hits": 0, "misses": 0, "memory_hits": 0, "disk_hits": 0, "stores": 0, "bypassed": 0}
+        self.lock = threading.Lock()
+        self._db = None
+
+    # --- Storage ---
+    def _connect(self):
+        if self._db is None:
+            self._db = sqlite3.connect(self.path, check_same_thread=False, timeout=5)
+            self._db.execute("PRAGMA journal_mode=WAL")  # Concurrent readers across processes
+            self._db.execute("""
+                CREATE TABLE IF NOT EXISTS answers (
+                    key TEXT PRIMARY KEY,
+                    question TEXT NOT NULL,
+                    tool TEXT NOT NULL,
+                    answer TEXT NOT NULL,
+                    created REAL NOT NULL,
+                    last_used REAL NOT NULL
+                )""")
+            self._db.execute("CREATE INDEX IF NOT EXISTS answers_question ON answers (question, created)")
+        return self._db
+
+    @staticmethod
+    def _key(question: str, tool: str) -> str:
+        return hashlib.sha256(f"{tool}\x00{question}".encode("utf-8")).hexdigest()
+
+    def _expired(self, entry: CachedAnswer) -> bool:
+        return self.ttl > 0 and time.time() - entry.created > self.ttl
+
+    def _remember(self, key, entry):
+        self.memory[key] = entry
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.max_entries:
+            self.memory.popitem(last=False)
+
+    # --- Public API ---
+    def get(self, question: str, tool: str = None):
+        """Returns a CachedAnswer or None. Without `tool`, any tool's answer to the question matches."""
+        normalized = normalize_question(question)
+        with self.lock:
+            entry = self._get_memory(normalized, tool)
+            if entry is not None:
+                self.stats["hits"] += 1
+                self.stats["memory_hits"] += 1
+                return entry
+
+            entry = self._get_disk(normalized, tool)
+            if entry is None:
+                self.stats["misses"] += 1
+                return None
+            self._remember(self._key(normalized, entry.tool), entry)
+            self.stats["hits"] += 1
+            self.stats["disk_hits"] += 1
+            return entry
+
+    def _get_memory(self, normalized, tool):
+        tools = [tool] if tool else CACHED_TOOLS
+        for name in tools:
+            key = self._key(normalized, name)
+            entry = self.memory.get(key)
+            if entry is None:
+                continue
+            if self._expired(entry):
+                del self.memory[key]
+                continue
+            self.memory.move_to_end(key)
+            return entry
+        return None
+
+    def _get_disk(self, normalized, tool):
+        try:
+            db = self._connect()
+            query = "SELECT key, question, tool, answer, created FROM answers WHERE question = ?"
+            params = [normalized]
+            if tool:
+                query += " AND tool = ?"
+                params.append(tool)
+            if self.ttl > 0:
+                query += " AND created >= ?"
+                params.append(time.time() - self.ttl)
+            row = db.execute(query + " ORDER BY created DESC LIMIT 1", params).fetchone()
+            if row is None:
+                return None
+            db.execute("UPDATE answers SET last_used = ? WHERE key = ?", (time.time(), row[0]))
+            db.commit()
+            return CachedAnswer(question=row[1], tool=row[2], answer=row[3], created=row[4])
+        except sqlite3.Error as e:
+            print(f"⚠️ Answer cache read failed: {e}")
+            return None
+
+    def put(self, question: str, tool: str, answer: str):
+        """Stores an answer; error messages and empty answers are never cached."""
+        if not answer or not answer.strip() or answer.lstrip().startswith(ERROR_MARKERS) or "[ERROR]" in answer:
+            return
+        normalized = normalize_question(question)
+        key = self._key(normalized, tool)
+        now = time.time()
+        entry = CachedAnswer(question=normalized, tool=tool, answer=answer, created=now)
+        with self.lock:
+            self._remember(key, entry)
+            self.stats["stores"] += 1
+            try:
+                db = self._connect()
+                db.execute("INSERT OR REPLACE INTO answers VALUES (?, ?, ?, ?, ?, ?)", (key, normalized, tool, answer, now, now))
+                # Keep the file bounded: drop the least recently used rows
+                db.execute("""
+                    DELETE FROM answers WHERE key IN (
+                        SELECT key FROM answers ORDER BY last_used DESC LIMIT -1 OFFSET ?
+                    )""", (self.max_disk_entries,))
+                db.commit()
+            except sqlite3.Error as e:
+                print(f"⚠️ Answer cache write failed: {e}")
+
+    async def aget(self, question: str, tool: str = None):
+        """`get` off the event loop: the SQLite read and the `last_used` update run in a thread."""
+        return await asyncio.to_thread(self.get, question, tool)
+
+    async def aput(self, question: str, tool: str, answer: str):
+        """`put` off the event loop."""
+        await asyncio.to_thread(self.put, question, tool, answer)
+
+    def record_bypass(self):
+        with self.lock:
+            self.stats["bypassed"] += 1
+
+    def get_stats(self) -> dict:
+        """Hit/miss counters plus the current size and hit rate."""
+        with self.lock:
+            stats = dict(self.stats)
+            stats["memory_entries"] = len(self.memory)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        return stats
+
+    def clear(self):
+        with self.lock:
+            self.memory.clear()
+            try:
+                db = self._connect()
+                db.execute("DELETE FROM answers")
+                db.commit()
+            except sqlite3.Error as e:
+                print(f"⚠️ Answer cache clear failed: {e}")
+
+
+# --- Shared instance ---
+answer_cache = AnswerCache()
@@ -0,0 +1,366 @@
+"""Headless HTTP API around prompt_ai (ASGI, Starlette).
+
+Run:
+    uvicorn api:app --host 0.0.0.0 --port 8000
+    python api.py --stub            # stub LLMs, no API keys: for local load tests
+
+Endpoints:
+    POST /v1/answer         {"question": "..."} or {"messages": [{"role": "user", "content": "..."}]}
+                            optional "use_cache": false. Returns the answer as JSON.
+                            An `X-Session-Id` header groups a client's calls for fair queuing.
+    POST /v1/answer/stream  same body, answer streamed as server-sent events
+                            (status, token, warning, error, done).
+    POST /v1/batch          {"text": "1. ... 2. ..."} (a pasted problem set) or {"questions": ["...", ...]},
+                            optional "use_cache" and "concurrency". Questions are split, deduplicated
+                            and answered concurrently; returns every answer with its latency and the wall time.
+    POST /v1/batch/stream   same body, streamed as server-sent events: "questions" (the split list), one
+                            "item" per answer as soon as it is ready, then "done" with the wall time.
+    GET  /healthz           load and circuit breaker states ("degraded" while a breaker is open)
+    GET  /metrics           Prometheus text format (latency histograms, tokens, cache, routes)
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from starlette.routing import Route
+from agent_logic import prompt_ai_async, prompt_ai_astream, prompt_ai_batch_astream, BATCH_CONCURRENCY
+from config import SYSTEM_PROMPT
+from problem_set import parse_problem_set, dedupe, MAX_BATCH_QUESTIONS
+from status import CallbackReporter, use_reporter
+import scheduler
+import metrics
+import resilience
+
+MAX_CONCURRENCY = int(os.getenv("EUCLIDIA_API_CONCURRENCY", "16"))
+QUEUE_TIMEOUT = float(os.getenv("EUCLIDIA_API_QUEUE_TIMEOUT", "30"))  # seconds
+MAX_MESSAGE_CHARS = 8000
+MAX_MESSAGES = 100
+ROLES = {"system": SystemMessage, "user": HumanMessage, "human": HumanMessage, "assistant": AIMessage, "ai": AIMessage}
+
+# The pipeline runs natively on the server's event loop: slots bound the in-flight questions
+_slots = None
+_in_flight = 0
+
+
+class RequestError(ValueError):
+    pass
+
+
+def _get_slots():
+    # Created lazily so the semaphore belongs to the server's event loop
+    global _slots
+    if _slots is None:
+        _slots = asyncio.Semaphore(MAX_CONCURRENCY)
+    return _slots
+
+
+def parse_messages(payload) -> list:
+    """Builds LangChain messages from a request body; the system prompt is added if missing."""
+    if not isinstance(payload, dict):
+        raise RequestError("Body must be a JSON object.")
+
+    if isinstance(payload.get("question"), str):
+        raw = [{"role": "user", "content": payload["question"]}]
+    elif isinstance(payload.get("messages"), list):
+        raw = payload["messages"]
+    else:
+        raise RequestError("Provide either 'question' (string) or 'messages' (list).")
+
+    if not raw or len(raw) > MAX_MESSAGES:
+        raise RequestError(f"Between 1 and {MAX_MESSAGES} messages are required.")
+
+    messages = []
+    for item in raw:
+        if not isinstance(item, dict) or item.get("role") not in ROLES or not isinstance(item.get("content"), str):
+            raise RequestError("Each message needs a 'role' (system, user, assistant) and a string 'content'.")
+        if len(item["content"]) > MAX_MESSAGE_CHARS:
+            raise RequestError(f"Messages are limited to {MAX_MESSAGE_CHARS} characters.")
+        messages.append(ROLES[item["role"]](content=item["content"]))
+
+    if not isinstance(messages[-1], HumanMessage) or not messages[-1].content.strip():
+        raise RequestError("The last message must be a non-empty user message.")
+    if not any(isinstance(msg, SystemMessage) for msg in messages):
+        messages.insert(0, SystemMessage(content=SYSTEM_PROMPT))
+    return messages
+
+
+def parse_batch(payload) -> tuple:
+    """Returns `(questions, duplicates, concurrency)` from a batch request body."""
+    if not isinstance(payload, dict):
+        raise RequestError("Body must be a JSON object.")
+    if isinstance(payload.get("text"), str):
+        try:
+            questions, duplicates = parse_problem_set(payload["text"])
+        except ValueError as e:
+            raise RequestError(str(e))
+    elif isinstance(payload.get("questions"), list) and all(isinstance(item, str) for item in payload["questions"]):
+        questions, duplicates = dedupe([item.strip() for item in payload["questions"] if item.strip()])
+        if len(questions) > MAX_BATCH_QUESTIONS:
+            raise RequestError(f"Batches are limited to {MAX_BATCH_QUESTIONS} questions.")
+    else:
+        raise RequestError("Provide either 'text' (string) or 'questions' (list of strings).")
+    if not questions:
+        raise RequestError("No question found.")
+    if any(len(question) > MAX_MESSAGE_CHARS for question in questions):
+        raise RequestError(f"Questions are limited to {MAX_MESSAGE_CHARS} characters.")
+    concurrency = payload.get("concurrency", BATCH_CONCURRENCY)
+    if not isinstance(concurrency, int) or concurrency < 1:
+        raise RequestError("'concurrency' must be a positive integer.")
+    return questions, duplicates, concurrency
+
+
+def parse_use_cache(payload) -> bool:
+    """The optional "use_cache" flag: a JSON boolean, or "true" / "false" sent as a string."""
+    value = payload.get("use_cache", True)
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, str) and value.strip().lower() in ("true", "false"):
+        return value.strip().lower() == "true"
+    raise RequestError("'use_cache' must be a boolean.")
+
+
+def _session_id(request):
+    """Fair-queuing key: the client's X-Session-Id, else its address."""
+    return request.headers.get("x-session-id") or (request.client.host if request.client else None)
+
+
+async def _read_request(request):
+    """Returns `(messages, use_cache)` or raises RequestError."""
+    try:
+        payload = await request.json()
+    except (json.JSONDecodeError, UnicodeDecodeError):
+        raise RequestError("Body must be valid JSON.")
+    return parse_messages(payload), parse_use_cache(payload)
+
+
+async def _acquire_slot() -> bool:
+    """Waits for a free slot; False means the server is saturated (backpressure)."""
+    global _in_flight
+    try:
+        await asyncio.wait_for(_get_slots().acquire(), QUEUE_TIMEOUT)
+    except asyncio.TimeoutError:
+        return False
+    _in_flight += 1
+    return True
+
+
+async def _read_batch(request):
+    """Returns `(questions, duplicates, concurrency, use_cache)` or raises RequestError."""
+    try:
+        payload = await request.json()
+    except (json.JSONDecodeError, UnicodeDecodeError):
+        raise RequestError("Body must be valid JSON.")
+    return (*parse_batch(payload), parse_use_cache(payload))
+
+
+def _release_slot():
+    global _in_flight
+    _in_flight -= 1
+    _get_slots().release()
+
+
+class SlotStreamingResponse(StreamingResponse):
+    """Event stream holding a concurrency slot until the response ends.
+
+    The slot is released here rather than in the body generator: a client that
+    disconnects before the body starts would otherwise keep it forever.
+    """
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            _release_slot()
+
+
+def _event_stream(events):
+    return SlotStreamingResponse(events, media_type="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+def _busy():
+    return JSONResponse({"error": "Server busy, retry later."}, status_code=503, headers={"Retry-After": "5"})
+
+
+def _metadata(source: dict) -> dict:
+    return {key: source.get(key) for key in ("route", "cache", "usage", "execution", "fallbacks", "trace")}
+
+
+# --- Endpoints ---
+async def answer(request):
+    try:
+        messages, use_cache = await _read_request(request)
+    except RequestError as e:
+        return JSONResponse({"error": str(e)}, status_code=400)
+
+    if not await _acquire_slot():
+        return _busy()
+
+    events = []
+    reporter = CallbackReporter(lambda kind, text: events.append({"kind": kind, "text": text}) if kind in ("warning", "error") else None)
+    try:
+        with use_reporter(reporter), scheduler.use_session(_session_id(request)):
+            response = await prompt_ai_async(messages, use_cache=use_cache)
+    finally:
+        _release_slot()
+
+    content = response.content if isinstance(response.content, str) else str(response.content)
+    return JSONResponse({"answer": content, **_metadata(response.response_metadata or {}), "events": events})
+
+
+async def answer_stream(request):
+    try:
+        messages, use_cache = await _read_request(request)
+    except RequestError as e:
+        return JSONResponse({"error": str(e)}, status_code=400)
+
+    if not await _acquire_slot():
+        return _busy()
+
+    queue = asyncio.Queue()
+    session_id = _session_id(request)
+
+    def forward_status(kind, text):
+        queue.put_nowait(("status" if kind == "clear" else kind, {"text": text}))
+
+    async def run():
+        info = {}
+        try:
+            with use_reporter(CallbackReporter(forward_status)), scheduler.use_session(session_id):
+                async for chunk in prompt_ai_astream(messages, info=info, use_cache=use_cache):
+                    queue.put_nowait(("token", {"text": chunk}))
+            queue.put_nowait(("done", _metadata(info)))
+        except Exception as e:
+            queue.put_nowait(("error", {"text": str(e)}))
+        finally:
+            queue.put_nowait((None, None))
+
+    async def events():
+        task = asyncio.create_task(run())
+        try:
+            while True:
+                event, data = await queue.get()
+                if event is None:
+                    break
+                yield f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+        finally:
+            # Client went away: cancelling the task aborts the upstream call
+            task.cancel()
+
+    return _event_stream(events())
+
+
+# A batch holds one slot: its questions are bounded by its own concurrency
+async def batch(request):
+    try:
+        questions, duplicates, concurrency, use_cache = await _read_batch(request)
+    except RequestError as e:
+        return JSONResponse({"error": str(e)}, status_code=400)
+
+    if not await _acquire_slot():
+        return _busy()
+
+    events = []
+    reporter = CallbackReporter(lambda kind, text: events.append({"kind": kind, "text": text}) if kind in ("warning", "error") else None)
+    started = time.perf_counter()
+    try:
+        with use_reporter(reporter), scheduler.use_session(_session_id(request)):
+            results = [result async for result in prompt_ai_batch_astream(questions, concurrency=concurrency, use_cache=use_cache)]
+    finally:
+        _release_slot()
+
+    results.sort(key=lambda result: result.index)
+    return JSONResponse({
+        "results": [result.as_dict() for result in results],
+        "duplicates": duplicates,
+        "wall_seconds": round(time.perf_counter() - started, 3),
+        "events": events,
+    })
+
+
+async def batch_stream(request):
+    try:
+        questions, duplicates, concurrency, use_cache = await _read_batch(request)
+    except RequestError as e:
+        return JSONResponse({"error": str(e)}, status_code=400)
+
+    if not await _acquire_slot():
+        return _busy()
+
+    queue = asyncio.Queue()
+    session_id = _session_id(request)
+
+    def forward_status(kind, text):
+        if kind in ("warning", "error"):
+            queue.put_nowait((kind, {"text": text}))
+
+    async def run():
+        started = time.perf_counter()
+        try:
+            queue.put_nowait(("questions", {"questions": questions, "duplicates": duplicates}))
+            with use_reporter(CallbackReporter(forward_status)), scheduler.use_session(session_id):
+                async for result in prompt_ai_batch_astream(questions, concurrency=concurrency, use_cache=use_cache):
+                    queue.put_nowait(("item", result.as_dict()))
+            queue.put_nowait(("done", {"count": len(questions), "wall_seconds": round(time.perf_counter() - started, 3)}))
+        except Exception as e:
+            queue.put_nowait(("error", {"text": str(e)}))
+        finally:
+            queue.put_nowait((None, None))
+
+    async def events():
+        task = asyncio.create_task(run())
+        try:
+            while True:
+                event, data = await queue.get()
+                if event is None:
+                    break
+                yield f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+        finally:
+            task.cancel()  # Cancels the questions still running
+
+    return _event_stream(events())
+
+
+async def healthz(request):
+    breakers = resilience.get_states()
+    degraded = any(state["state"] != "closed" for state in breakers.values())
+    return JSONResponse({"status": "degraded" if degraded else "ok", "in_flight": _in_flight, "max_concurrency": MAX_CONCURRENCY, "breakers": breakers, "providers": scheduler.get_stats()})
+
+
+metrics.metrics.register_collector(lambda: {"euclidia_api_in_flight": _in_flight, "euclidia_api_max_concurrency": MAX_CONCURRENCY})
+
+
+async def metrics_endpoint(request):
+    return PlainTextResponse(metrics.metrics.render_prometheus(), media_type="text/plain; version=0.0.4")
+
+
+app = Starlette(routes=[
+    Route("/v1/answer", answer, methods=["POST"]),
+    Route("/v1/answer/stream", answer_stream, methods=["POST"]),
+    Route("/v1/batch", batch, methods=["POST"]),
+    Route("/v1/batch/stream", batch_stream, methods=["POST"]),
+    Route("/healthz", healthz, methods=["GET"]),
+    Route("/metrics", metrics_endpoint, methods=["GET"]),
+])
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--stub", action="store_true", help="use stub LLMs instead of the real providers")
+    args = parser.parse_args()
+
+    if args.stub:
+        import stub_llms
+        stub_llms.install()
+    else:
+        from config import check_api_keys
+        check_api_keys()
+
+    uvicorn.run(app, host=args.host, port=args.port)
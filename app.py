@@ -1,38 +1,110 @@
 import streamlit as st
-from langchain_core.messages import SystemMessage, HumanMessage
-from config import check_api_keys
-from agent_logic import prompt_ai
+from langchain_core.messages import HumanMessage, AIMessage
+from config import check_api_keys, llms_config
+from agent_logic import prompt_ai_stream, prompt_ai_batch_stream
+from problem_set import parse_problem_set
+from conversation_store import conversation_store
+from status import StatusReporter, use_reporter
+from scheduler import use_session
+import transcript
+import metrics
+from PIL import Image
 import base64
+import io
 import os
+import queue
+import re
+import time
+import uuid
 
 # --- Check API keys ---
 check_api_keys()
 
+# --- Shared clients ---
+@st.cache_resource(show_spinner=False)
+def warm_up_router():
+    """Builds the Gemini client once per server process (DeepSeek stays lazy until a proof is asked)."""
+    return llms_config.get_gemini()
+
+warm_up_router()
+
+@st.cache_resource(show_spinner=False)
+def start_metrics_server():
+    """Exposes /metrics on EUCLIDIA_METRICS_PORT (once per server process, off by default)."""
+    return metrics.serve(metrics.METRICS_PORT) if metrics.METRICS_PORT else None
+
+start_metrics_server()
+
+# --- Pipeline statuses rendered in the loading placeholder ---
+class StreamlitReporter(StatusReporter):
+    """Queues pipeline events; `render` draws them from the script thread.
+
+    The pipeline runs on a background event loop, where Streamlit calls are not allowed.
+    """
+    def __init__(self):
+        self.events = queue.SimpleQueue()
+        self.current = "⏳ **Thinking...**"
+
+    def status(self, text):
+        self.events.put(("status", text))
+
+    def clear(self):
+        self.events.put(("clear", ""))
+
+    def warning(self, text):
+        self.events.put(("warning", text))
+
+    def error(self, text):
+        self.events.put(("error", text))
+
+    def render(self):
+        while not self.events.empty():
+            kind, text = self.events.get()
+            if kind == "warning":
+                st.warning(text)
+            elif kind == "error":
+                st.error(text)
+            else:
+                self.current = text
+                self.refresh()
+
+    def refresh(self):
+        """Re-sends the current status: Streamlit checks for Stop/rerun requests on each update."""
+        if 'loading_placeholder' in st.session_state:
+            if self.current:
+                st.session_state.loading_placeholder.markdown(self.current)
+            else:
+                st.session_state.loading_placeholder.empty()
+
 # --- Streamlit UI ---
 st.set_page_config(page_title="EuclidIA | Think. Explain. Prove.", page_icon="📐")
 
-# Function to load and encode the logo
-def get_img_as_base64(file_name):
+# --- Static assets and HTML (built once per server process, not on every rerun) ---
+LOGO_FILE = "assets/euclidia_logo.png"
+
+@st.cache_resource(show_spinner=False)
+def get_img_as_base64(file_name, width):
+    """Returns `(base64_png, error)`: the logo resized for `width` px (2x for high-DPI screens)."""
     try:
         # Get absolute path of the file relative to this script
         script_dir = os.path.dirname(os.path.abspath(__file__))
         abs_path = os.path.join(script_dir, file_name)
 
-        with open(abs_path, "rb") as image_file:
-            return base64.b64encode(image_file.read()).decode()
+        with Image.open(abs_path) as image:
+            image.thumbnail((width * 2, image.height))
+            buffer = io.BytesIO()
+            image.save(buffer, format="PNG", optimize=True)
+        return base64.b64encode(buffer.getvalue()).decode(), None
     except FileNotFoundError:
-        st.warning(f"Logo file {file_name} not found. Using default display.")
-        return ""  # Return empty string for missing logo
+        return "", f"Logo file {file_name} not found. Using default display."
     except Exception as e:
-        st.warning(f"Error loading logo: {e}")
-        return ""
-
-logo_base64 = get_img_as_base64('assets/euclidia_logo.png')
+        return "", f"Error loading logo: {e}"
 
-# --- Sidebar ---
-with st.sidebar:
+@st.cache_resource(show_spinner=False)
+def sidebar_html():
+    logo_base64, _ = get_img_as_base64(LOGO_FILE, 140)
     logo_html = f'<img src="data:image/png;base64,{logo_base64}" width="140"><br>' if logo_base64 else '<h2>📐 EuclidIA</h2>'
-    st.markdown(f"""
+    return f"""
     <div style='text-align: center;'>
         {logo_html}
         <div style='font-style: italic; margin-top: 0.3rem; line-height: 1.3;'>Think. Explain. Prove.</div>
@@ -50,62 +122,91 @@ with st.sidebar:
         <div style='margin-top: 0.5rem;'><a href="https://github.com/AdelMessaoudi-13">GitHub</a></div>
         <div style='margin-top: 0.5rem;'><a href="https://huggingface.co/AdelMessaoudi-13">Hugging Face</a></div>
     </div>
-    """, unsafe_allow_html=True)
+    """
 
-# --- Header (centered, professional) ---
-header_logo = f'<img src="data:image/png;base64,{logo_base64}" style="width: 220px; margin-bottom: 1rem;">' if logo_base64 else '<h1 style="margin-bottom: 1rem;">📐 EuclidIA</h1>'
-st.markdown(f"""
+@st.cache_resource(show_spinner=False)
+def header_html():
+    logo_base64, _ = get_img_as_base64(LOGO_FILE, 220)
+    header_logo = f'<img src="data:image/png;base64,{logo_base64}" style="width: 220px; margin-bottom: 1rem;">' if logo_base64 else '<h1 style="margin-bottom: 1rem;">📐 EuclidIA</h1>'
+    return f"""
 <div style='display: flex; flex-direction: column; align-items: center; padding-top: 1rem;'>
     {header_logo}
     <div style='width: 100%; max-width: 500px;'>
-""", unsafe_allow_html=True)
-
-# --- Conversation context ---
-if "messages" not in st.session_state:
-    st.session_state.messages = [
-        SystemMessage(content="""
-# Role
-You are an AI assistant specialized in mathematics. You must answer only questions related to mathematics.
+"""
 
-# Available Tools
-You have access to two tools to answer questions:
+_, logo_error = get_img_as_base64(LOGO_FILE, 220)
+if logo_error:
+    st.warning(logo_error)
 
-- `use_gemini`: for definitions, clear explanations of mathematical concepts, established properties, formulas, or any factual response.
-- `use_deepseek`: for proofs, formal demonstrations, detailed reasoning, or problem solving that requires multiple logical steps.
+# --- Sidebar ---
+with st.sidebar:
+    st.markdown(sidebar_html(), unsafe_allow_html=True)
 
-# Guidelines
-Carefully analyze each question and choose the most appropriate tool:
-- If the question is straightforward, factual, or asks for a simple explanation → use `use_gemini`.
-- If the question requires structured reasoning, rigorous justification, or a demonstration → use `use_deepseek`.
+# --- Header (centered, professional) ---
+st.markdown(header_html(), unsafe_allow_html=True)
 
-Always use **only one** of these two tools to answer.
-""")
-    ]
+# --- Conversation context ---
+# The history lives in the conversation store; the session only keeps its id, which
+# is also put in the URL so the conversation resumes after a reload or a restart.
+# The id also queues this session's provider calls fairly against the others.
+if "session_id" not in st.session_state:
+    requested = st.query_params.get("session", "")
+    st.session_state.session_id = requested if re.fullmatch(r"[0-9a-f]{32}", requested) else uuid.uuid4().hex
+    st.query_params["session"] = st.session_state.session_id
 
 if "user_input" not in st.session_state:
     st.session_state.user_input = ""
 
-# --- Input field and buttons ---
-col1, col2, col3 = st.columns([6, 0.7, 0.7])
-with col1:
-    user_input = st.text_input(
-        label="Math question input",
-        placeholder="Ask your question...",
-        label_visibility="collapsed",
-        key="input_field"
-    )
-with col2:
-    send_clicked = st.button("➤", help="Send", use_container_width=True)
-with col3:
-    clear_clicked = st.button("🗑️", help="Clear", use_container_width=True)
-
-st.markdown("</div></div>", unsafe_allow_html=True)
+if "transcript_pages" not in st.session_state:
+    st.session_state.transcript_pages = []         # Cursors of the older pages opened (latest page: none)
+    st.session_state.expanded_messages = set()     # Keys of the long messages shown in full
+
+# --- Transcript ---
+# Messages are prepared once (keyed by their hash) and only one page of turns is drawn,
+# with long proofs collapsed until asked for, so each rerun costs the same at turn 5 or 500.
+def toggle_message(key):
+    st.session_state.expanded_messages ^= {key}
+
+def show_older(cursor):
+    st.session_state.transcript_pages.append(cursor)
+
+def show_newer():
+    st.session_state.transcript_pages.pop()
+
+def render_transcript(session_id):
+    pages = st.session_state.transcript_pages
+    turns, older = transcript.page(conversation_store, session_id, pages[-1] if pages else None)
+    if not turns:
+        return
+    st.markdown("---")
+    st.caption("🗂️ Conversation (newest first)" if not pages else f"🗂️ Conversation: older turns, page {len(pages) + 1}")
+    for seq, messages in turns:
+        for index, rendered in enumerate(messages):
+            with st.chat_message("user" if rendered.role == "human" else "assistant"):
+                expanded = rendered.key in st.session_state.expanded_messages
+                st.markdown(rendered.full if expanded else rendered.preview, unsafe_allow_html=True)
+                if rendered.collapsible:
+                    st.button("Show less" if expanded else "Show the full answer…", key=f"expand-{seq}-{index}",
+                              on_click=toggle_message, args=(rendered.key,))
+
+    col_older, col_newer = st.columns(2)
+    with col_older:
+        if older is not None:
+            st.button("⬇️ Older turns", on_click=show_older, args=(older,), use_container_width=True)
+    with col_newer:
+        if pages:
+            st.button("⬆️ Newer turns", on_click=show_newer, use_container_width=True)
 
 # --- Clear logic ---
-if clear_clicked:
+# A button callback: it runs before the fragment reruns, so the emptied field and
+# history are drawn in the same (fragment-scoped) run, without a second rerun.
+def clear_conversation(session_id):
     st.session_state.user_input = ""
-    st.session_state.messages = st.session_state.messages[:1]
+    conversation_store.clear(session_id)
+    st.session_state.transcript_pages = []
+    st.session_state.expanded_messages = set()
     st.session_state.pop("input_field", None)
+    st.session_state.pop("batch_field", None)
 
     # Clean up loading placeholder to prevent memory leaks
     if 'loading_placeholder' in st.session_state:
@@ -115,50 +216,145 @@ if clear_clicked:
             pass  # Ignore if already cleared
         del st.session_state.loading_placeholder
 
-    st.rerun()
+# --- Problem sets ---
+# Pasted questions are split, deduplicated and answered concurrently; each answer is
+# drawn in its own box as soon as it is ready, whatever the order they finish in.
+def run_problem_set(session_id, text):
+    try:
+        questions, duplicates = parse_problem_set(text)
+    except ValueError as e:
+        st.error(f"❌ {e}")
+        return
+    if not questions:
+        st.warning("No question found.")
+        return
+    skipped = f", {duplicates} duplicate{'s' if duplicates > 1 else ''} skipped" if duplicates else ""
+    st.caption(f"📚 {len(questions)} questions{skipped}")
 
-# --- Processing ---
-input_value = user_input.strip()
+    boxes = []
+    for index, question in enumerate(questions):
+        box = st.container(border=True)
+        box.markdown(f"**{index + 1}. {question}**")
+        boxes.append(box.empty())
+        boxes[-1].markdown("⏳ *Waiting...*")
 
-if send_clicked and input_value:
-    # Check anti-duplication: don't add twice the same HumanMessage
-    if not (st.session_state.messages and isinstance(st.session_state.messages[-1], HumanMessage) and st.session_state.messages[-1].content == input_value):
-        # Store the user's input in the session state (for consistency)
-        st.session_state.user_input = input_value
+    started = time.perf_counter()
+    answered = 0
+    reporter = StreamlitReporter()
+    with use_reporter(reporter), use_session(session_id):
+        for result in prompt_ai_batch_stream(questions, heartbeat=0.25):
+            reporter.render()
+            if result is None:
+                continue
+            with boxes[result.index].container():
+                st.markdown(result.answer, unsafe_allow_html=True)
+                tool = (result.metadata.get("route") or {}).get("tool") or "agent"
+                st.caption(f"⏱️ {result.seconds:.1f} s · {tool}")
+            conversation_store.append(session_id, HumanMessage(content=result.question))
+            conversation_store.append(session_id, AIMessage(content=result.answer))
+            answered += 1
+    reporter.render()
+    st.success(f"✅ {answered} answers in {time.perf_counter() - started:.1f} s")
 
-        # Create a placeholder to show the "Thinking..." indicator while processing
-        # Clear any existing placeholder first to avoid race conditions
-        if 'loading_placeholder' in st.session_state:
-            try:
-                st.session_state.loading_placeholder.empty()
-            except:
-                pass  # Ignore if already cleared
+# --- Input and answer area ---
+# A fragment: typing, sending and clearing only rerun this part of the page, so the
+# sidebar and header are not sent to the browser again on each interaction.
+@st.fragment
+def chat_area(session_id):
+    # --- Input field and buttons ---
+    batch_mode = st.toggle("📚 Problem set", key="batch_mode", help="Paste several questions (numbered, or separated by blank lines): they are answered concurrently.")
+    col1, col2, col3 = st.columns([6, 0.7, 0.7])
+    with col1:
+        if batch_mode:
+            user_input = st.text_area(
+                label="Problem set input",
+                placeholder="1. Solve 3x² − 7x + 2 = 0\n2. Prove that √2 is irrational\n...",
+                label_visibility="collapsed",
+                key="batch_field",
+                height=150
+            )
+        else:
+            user_input = st.text_input(
+                label="Math question input",
+                placeholder="Ask your question...",
+                label_visibility="collapsed",
+                key="input_field"
+            )
+    with col2:
+        send_clicked = st.button("➤", help="Send", use_container_width=True)
+    with col3:
+        st.button("🗑️", help="Clear", use_container_width=True, on_click=clear_conversation, args=(session_id,))
 
-        st.session_state.loading_placeholder = st.empty()
-        st.session_state.loading_placeholder.markdown("⏳ **Thinking...**")
+    st.markdown("</div></div>", unsafe_allow_html=True)
 
-        try:
-            st.session_state.messages.append(HumanMessage(content=input_value))
+    # --- Processing ---
+    input_value = user_input.strip()
 
-            # Call the AI agent logic (prompt_ai) with the updated conversation history
-            # The agent will handle tool calls, execution, and final synthesis by itself
-            response = prompt_ai(st.session_state.messages)
+    # The new answer goes above the earlier turns, which are drawn first (before it streams)
+    answer_area = st.container()
+    if send_clicked and input_value:
+        st.session_state.transcript_pages = []
+    render_transcript(session_id)
 
-            # Append the final AI response to the conversation history
-            st.session_state.messages.append(response)
+    if send_clicked and input_value and batch_mode:
+        with answer_area:
+            run_problem_set(session_id, input_value)
+    elif send_clicked and input_value:
+        # Check anti-duplication: don't add twice the same HumanMessage
+        last_message = conversation_store.last_message(session_id)
+        if not (isinstance(last_message, HumanMessage) and last_message.content == input_value):
+            with answer_area:
+                # Store the user's input in the session state (for consistency)
+                st.session_state.user_input = input_value
 
-            # Display the final AI response if it contains text
-            if hasattr(response, "content") and response.content:
-                st.session_state.loading_placeholder.empty()
-                st.success("Assistant's response:")
-                st.markdown(response.content, unsafe_allow_html=True)
-            else:
-                st.session_state.loading_placeholder.empty()
-                st.warning("No response was generated.")
-
-        except Exception as e:
-            st.error(f"Error: {e}")
-        finally:
-            # Cleanup the loading placeholder when done (success or error)
-            if 'loading_placeholder' in st.session_state:
-                del st.session_state.loading_placeholder
+                # Create a placeholder to show the "Thinking..." indicator while processing
+                # Clear any existing placeholder first to avoid race conditions
+                if 'loading_placeholder' in st.session_state:
+                    try:
+                        st.session_state.loading_placeholder.empty()
+                    except:
+                        pass  # Ignore if already cleared
+
+                st.session_state.loading_placeholder = st.empty()
+                st.session_state.loading_placeholder.markdown("⏳ **Thinking...**")
+
+                try:
+                    conversation_store.append(session_id, HumanMessage(content=input_value))
+
+                    # Call the AI agent logic (prompt_ai_stream) with the updated conversation history
+                    # The answer is rendered token by token as the selected tool streams it
+                    # Heartbeats (None) keep the script responsive, so Stop or a new question cancels the call
+                    answer_header = st.empty()
+                    answer_body = st.empty()
+                    answer = ""
+                    reporter = StreamlitReporter()
+                    with use_reporter(reporter), use_session(session_id):
+                        for chunk in prompt_ai_stream(conversation_store.window(session_id), heartbeat=0.25):
+                            reporter.render()
+                            if chunk is None:
+                                if not answer:
+                                    reporter.refresh()
+                                continue
+                            if not answer:
+                                reporter.current = ""
+                                st.session_state.loading_placeholder.empty()
+                                answer_header.success("Assistant's response:")
+                            answer += chunk
+                            answer_body.markdown(answer, unsafe_allow_html=True)
+                    reporter.render()
+
+                    # Append the final AI response to the conversation history (an empty one would be replayed as a turn)
+                    if answer:
+                        conversation_store.append(session_id, AIMessage(content=answer))
+                    else:
+                        st.session_state.loading_placeholder.empty()
+                        st.warning("No response was generated.")
+
+                except Exception as e:
+                    st.error(f"Error: {e}")
+                finally:
+                    # Cleanup the loading placeholder when done (success or error)
+                    if 'loading_placeholder' in st.session_state:
+                        del st.session_state.loading_placeholder
+
+chat_area(st.session_state.session_id)
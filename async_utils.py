@@ -0,0 +1,86 @@
+"""Bridge between the async pipeline and synchronous callers.
+
+All coroutines run on one long-lived event loop in a background thread, so the
+provider clients (and their async connection pools) stay bound to a single loop
+for the whole process. Context variables (e.g. the status reporter) follow the
+coroutine into that loop.
+"""
+import asyncio
+import queue
+import threading
+
+_loop = None
+_loop_thread = None
+_lock = threading.Lock()
+_DONE = object()
+
+
+def get_loop():
+    """Returns the shared background event loop, starting it on first use."""
+    global _loop, _loop_thread
+    with _lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            _loop_thread = threading.Thread(target=_loop.run_forever, name="euclidia-async", daemon=True)
+            _loop_thread.start()
+        return _loop
+
+
+def _check_thread():
+    if threading.current_thread() is _loop_thread:
+        raise RuntimeError("Synchronous EuclidIA API called from its own event loop; await the async variant instead.")
+
+
+def run_sync(coro):
+    """Runs `coro` on the shared loop and blocks until it finishes.
+
+    If the calling thread is interrupted (KeyboardInterrupt, Streamlit stopping the
+    script), the coroutine is cancelled so the upstream request is aborted too.
+    """
+    _check_thread()
+    future = asyncio.run_coroutine_threadsafe(coro, get_loop())
+    try:
+        return future.result()
+    except BaseException:
+        future.cancel()
+        raise
+
+
+def iter_sync(agen, heartbeat: float = None):
+    """Iterates an async generator from synchronous code.
+
+    Items are produced on the shared loop and handed over through a queue. When
+    `heartbeat` is set, None is yielded every `heartbeat` seconds without data so
+    the caller gets a chance to notice it should stop. Closing the returned
+    generator cancels the async one.
+    """
+    _check_thread()
+    loop = get_loop()
+    items = queue.Queue()
+
+    async def pump():
+        try:
+            async for item in agen:
+                items.put((item, None))
+        except BaseException as e:
+            items.put((_DONE, e))
+            raise
+        else:
+            items.put((_DONE, None))
+
+    future = asyncio.run_coroutine_threadsafe(pump(), loop)
+    try:
+        while True:
+            try:
+                item, error = items.get(timeout=heartbeat)
+            except queue.Empty:
+                yield None
+                continue
+            if item is _DONE:
+                if error is not None and not isinstance(error, asyncio.CancelledError):
+                    raise error
+                return
+            yield item
+    finally:
+        if not future.done():
+            future.cancel()  # Propagates CancelledError into the upstream stream
@@ -0,0 +1,124 @@
+"""Rerun cost of the Streamlit app, per interaction (stub LLMs, no API keys).
+
+Drives app.py with Streamlit's AppTest and reports, for each interaction, the
+script run time and the bytes of the messages sent to the browser. AppTest
+always reruns the whole script, so the payload produced inside fragments is
+reported separately: it is what a fragment-scoped rerun sends.
+
+Each interaction is measured on a new conversation and on one resumed with
+`--turns` earlier question/answer pairs (long LaTeX answers): the costs should
+not grow with the length of the conversation.
+
+Usage:
+    python bench_app.py                       # app.py, 10 runs per interaction, 0 and 100 earlier turns
+    python bench_app.py --app old_app.py --runs 20 --turns 0 20 200
+"""
+import argparse
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import time
+import uuid
+from unittest.mock import patch
+
+# Dummy keys and throwaway stores: the app checks the keys and persists conversations
+_workdir = tempfile.mkdtemp(prefix="euclidia-bench-app-")
+os.environ.setdefault("GOOGLE_API_KEY", "stub-google-key")
+os.environ.setdefault("DEEPSEEK_API_KEY", "stub-deepseek-key")
+os.environ["EUCLIDIA_CONVERSATIONS_PATH"] = os.path.join(_workdir, "conversations.sqlite")
+os.environ["EUCLIDIA_CACHE_PATH"] = os.path.join(_workdir, "cache.sqlite")
+
+from streamlit.runtime.forward_msg_queue import ForwardMsgQueue
+from streamlit.testing.v1 import AppTest
+import stub_llms
+
+QUESTION = "What is the derivative of sin(x)?"
+ANSWER_BLOCK = (
+    "By the chain rule, $\\frac{d}{dx} f(g(x)) = f'(g(x))\\,g'(x)$, hence\n\n"
+    "$$\\int_0^1 x^n \\, dx = \\left[\\frac{x^{n+1}}{n+1}\\right]_0^1 = \\frac{1}{n+1}$$\n\n"
+)
+
+
+class PayloadMeter:
+    """Counts the bytes of the ForwardMsgs produced during a run (total and inside fragments)."""
+
+    def __init__(self):
+        self.total = 0
+        self.fragment = 0
+        self.messages = 0
+
+    def reset(self):
+        self.total = self.fragment = self.messages = 0
+
+    def __call__(self, msg):
+        size = msg.ByteSize()
+        self.total += size
+        self.messages += 1
+        if msg.HasField("delta") and msg.delta.fragment_id:
+            self.fragment += size
+
+
+def _measure(meter, action):
+    meter.reset()
+    started = time.perf_counter()
+    action()
+    return time.perf_counter() - started, meter.total, meter.fragment
+
+
+def seed(turns: int) -> str:
+    """A stored conversation of `turns` question/answer pairs; returns its session id."""
+    from conversation_store import conversation_store
+    from langchain_core.messages import AIMessage, HumanMessage
+    session_id = uuid.uuid4().hex
+    for turn in range(turns):
+        conversation_store.append(session_id, HumanMessage(content=f"Question {turn}: prove that the integral is 1/(n+1)."))
+        conversation_store.append(session_id, AIMessage(content=ANSWER_BLOCK * (2 + turn % 20)))
+    return session_id
+
+
+def run(app_path: str, runs: int, turns: int = 0) -> dict:
+    """Median run time and payload per interaction, after `turns` earlier turns."""
+    stub_llms.install(gemini_latency=0.0, deepseek_latency=0.0, tokens_per_second=0)
+    meter = PayloadMeter()
+    # AppTest runs the script outside a ScriptRunContext; its warnings are expected here
+    logging.getLogger("streamlit.runtime.scriptrunner_utils.script_run_context").setLevel(logging.ERROR)
+    samples = {name: [] for name in ("load", "rerun", "type", "send", "clear")}
+
+    with patch.object(ForwardMsgQueue, "_before_enqueue_msg", meter):
+        for index in range(runs):
+            app = AppTest.from_file(app_path, default_timeout=30)
+            app.query_params["session"] = seed(turns)
+            samples["load"].append(_measure(meter, app.run))
+            samples["rerun"].append(_measure(meter, app.run))
+            samples["type"].append(_measure(meter, lambda: app.text_input[0].input(f"{QUESTION} ({index})").run()))
+            samples["send"].append(_measure(meter, lambda: app.button[0].click().run()))
+            samples["clear"].append(_measure(meter, lambda: app.button[1].click().run()))
+            if app.exception:
+                raise RuntimeError(f"❌ The app raised: {app.exception[0].message}")
+
+    return {
+        name: {
+            "run_ms": round(statistics.median(sample[0] for sample in values) * 1000, 1),
+            "payload_kb": round(statistics.median(sample[1] for sample in values) / 1024, 1),
+            "fragment_kb": round(statistics.median(sample[2] for sample in values) / 1024, 1),
+        }
+        for name, values in samples.items()
+    }
+
+
+def main(args) -> int:
+    print(f"{'turns':>6} {'interaction':12} {'run ms':>8} {'payload KB':>11} {'in fragment KB':>15}")
+    for turns in args.turns:
+        for name, row in run(args.app, args.runs, turns).items():
+            print(f"{turns:>6} {name:12} {row['run_ms']:>8.1f} {row['payload_kb']:>11.1f} {row['fragment_kb']:>15.1f}")
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--app", default="app.py")
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--turns", type=int, nargs="+", default=[0, 100], help="Earlier turns in the conversation")
+    sys.exit(main(parser.parse_args()))
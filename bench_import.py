@@ -0,0 +1,76 @@
+"""Import-time budget check, measured with `python -X importtime`.
+
+Each module is imported in a fresh interpreter; the cumulative import time must stay
+under its budget and provider SDKs must not be imported eagerly.
+
+Usage:
+    python bench_import.py            # exits with status 1 if a budget is exceeded
+    python bench_import.py --top 15   # also list the slowest imports
+"""
+import argparse
+import subprocess
+import sys
+
+# Cumulative import time budgets in milliseconds (cold import, CI runner)
+BUDGETS_MS = {
+    "config": 150,
+    "router": 100,
+    "latex_utils": 50,
+    "answer_cache": 100,
+    "tools": 2500,
+    "agent_logic": 3000,
+}
+
+# Heavy SDKs that must only be imported when a model is first built
+LAZY_PACKAGES = ["langchain_google_genai", "langchain_deepseek", "google.ai", "openai", "sympy", "numpy"]
+
+
+def measure(module: str):
+    """Returns `(total_ms, {imported_module: cumulative_ms})` for a cold import of `module`."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{result.stderr.strip().splitlines()[-1]}")
+
+    timings = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = (part.strip() for part in line[len("import time:"):].split("|"))
+        timings[name.strip()] = int(cumulative) / 1000
+    return timings.get(module, 0.0), timings
+
+
+def main(top: int) -> int:
+    failures = 0
+    print(f"{'module':14} {'import ms':>10} {'budget ms':>10}")
+    for module, budget in BUDGETS_MS.items():
+        try:
+            total, timings = measure(module)
+        except RuntimeError as e:
+            print(f"❌ {e}")
+            failures += 1
+            continue
+
+        status = "✅" if total <= budget else "❌"
+        failures += total > budget
+        print(f"{module:14} {total:>10.1f} {budget:>10} {status}")
+
+        eager = [name for name in LAZY_PACKAGES if name in timings]
+        if eager:
+            failures += 1
+            print(f"   ❌ imported eagerly: {', '.join(eager)}")
+
+        if top:
+            for name, ms in sorted(timings.items(), key=lambda item: -item[1])[1:top + 1]:
+                print(f"   {ms:>8.1f} ms  {name}")
+
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--top", type=int, default=0, help="show the N slowest imports of each module")
+    sys.exit(main(parser.parse_args().top))
@@ -0,0 +1,153 @@
+"""Offline benchmark of the local knowledge index: hit rate, precision and lookup latency.
+
+Each question is labeled with the corpus entry that should answer it, or None
+when it must go to the LLMs (a proof, a computation, a topic the corpus does not
+cover). A hit on a None question, or on the wrong entry, is a wrong answer
+served instantly, so precision matters more than coverage.
+
+Usage:
+    python bench_knowledge.py                          # built-in questions, current threshold
+    python bench_knowledge.py --rebuild --repeat 2000  # rebuild the index first, more timing samples
+    python bench_knowledge.py --questions my_questions.jsonl   # {"question": ..., "expected": id or null}
+"""
+import argparse
+import json
+import statistics
+import sys
+import time
+import knowledge_index
+from knowledge_index import KnowledgeIndex, build_index, is_lookup_question, CORPUS_PATH, INDEX_DIR, KNOWLEDGE_THRESHOLD, KNOWLEDGE_MARGIN
+
+# --- Held-out questions (phrasings that are not aliases of the corpus) ---
+BENCH_QUESTIONS = [
+    ("What does derivative mean?", "derivative"),
+    ("Can you explain what a derivative is, briefly?", "derivative"),
+    ("What is an antiderivative integral?", "integral"),
+    ("Explain the epsilon delta limit definition", "limit-function"),
+    ("When does a sequence converge?", "limit-sequence"),
+    ("What is continuity of a function?", "continuous-function"),
+    ("What are prime numbers?", "prime-number"),
+    ("What is an irrational number?", "irrational-number"),
+    ("Define complex number", "complex-numbers"),
+    ("What is the imaginary unit i?", "complex-numbers"),
+    ("Explain what a group is in group theory", "group"),
+    ("What is a field in abstract algebra?", "field"),
+    ("Define a vector space over a field", "vector-space"),
+    ("What is an eigenvector?", "eigenvalues"),
+    ("Explain eigenvalues and eigenvectors", "eigenvalues"),
+    ("What is an invertible matrix?", "matrix-inverse"),
+    ("What does the Pythagorean theorem say?", "pythagorean-theorem"),
+    ("What is Pythagoras' theorem?", "pythagorean-theorem"),
+    ("State the fundamental theorem of calculus", "fundamental-theorem-calculus"),
+    ("What does the mean value theorem state?", "mean-value-theorem"),
+    ("Give me the quadratic formula", "quadratic-formula"),
+    ("What is the discriminant of a quadratic?", "quadratic-formula"),
+    ("Explain the binomial theorem", "binomial-theorem"),
+    ("What is a Maclaurin series?", "taylor-series"),
+    ("What is the Laplace transform?", "laplace-transform"),
+    ("What is Bayes' formula?", "bayes-theorem"),
+    ("Explain the CLT", "central-limit-theorem"),
+    ("What is a bijection?", "bijective-function"),
+    ("What is an injection?", "injective-function"),
+    ("Define an onto function", "surjective-function"),
+    ("Permutations vs combinations", "permutation-combination"),
+    ("What is the sum of an arithmetic progression?", "arithmetic-series"),
+    ("Sum of a geometric series", "geometric-series"),
+    ("What are the log rules?", "logarithm-properties"),
+    ("What is the circumference of a circle?", "circle-area"),
+    ("What is the cosine rule?", "law-of-cosines"),
+    ("What is Euler's formula?", "euler-identity"),
+    ("What is the Euclidean algorithm?", "gcd"),
+    ("What is the scalar product of two vectors?", "dot-product"),
+    ("Explain the chain rule", "chain-rule"),
+    ("What is a factorial?", "factorial"),
+    ("Prove the Pythagorean theorem", None),
+    ("Prove that sqrt(2) is irrational", None),
+    ("Show that the composition of two bijections is a bijection", None),
+    ("What is the derivative of x^2 sin(x)?", None),
+    ("Find the eigenvalues of [[2, 1], [1, 2]]", None),
+    ("Solve x^2 - 5x + 6 = 0", None),
+    ("Calculate the area of a circle with radius 3", None),
+    ("Is 91 a prime number?", None),
+    ("Explain the Taylor series with an example", None),
+    ("What is a topological space?", None),
+    ("What is the Riemann hypothesis?", None),
+    ("What is the law of large numbers?", None),
+    ("What is a normal distribution?", None),
+    ("What is a Hilbert space?", None),
+    ("What is the difference between a group and a ring?", None),
+    ("What is the Fourier transform of a Gaussian?", None),
+    ("Who proved Fermat's last theorem?", None),
+    ("What is the weather like today?", None),
+]
+
+
+def load_questions(path: str) -> list:
+    with open(path, encoding="utf-8") as f:
+        rows = [json.loads(line) for line in f if line.strip()]
+    return [(row["question"], row.get("expected")) for row in rows]
+
+
+def evaluate(index: KnowledgeIndex, questions: list, repeat: int) -> int:
+    """Prints coverage and precision per threshold, the errors, and the lookup latency; returns the error count."""
+    ranked = [index.search(question, limit=2) if is_lookup_question(question) else [] for question, _ in questions]
+    expected_hits = sum(1 for _, expected in questions if expected)
+
+    print(f"{'threshold':>9} {'hit rate':>9} {'precision':>10} {'wrong':>6}")
+    for value in sorted({0.5, 0.6, 0.7, 0.75, 0.8, 0.9, index.threshold}):
+        served = []
+        for (question, expected), candidates in zip(questions, ranked):
+            if not candidates:
+                continue
+            score, entry = candidates[0]
+            margin = score - (candidates[1][0] if len(candidates) > 1 else 0.0)
+            if score >= value and margin >= index.margin:
+                served.append((expected, entry.id))
+        correct = sum(1 for expected, served_id in served if expected == served_id)
+        marker = "  ← current" if value == index.threshold else ""
+        print(f"{value:>9.2f} {correct / max(1, expected_hits):>9.0%} {correct / len(served) if served else 1.0:>10.0%} "
+              f"{len(served) - correct:>6}{marker}")
+
+    errors = 0
+    print("\nMistakes at the current threshold:")
+    for question, expected in questions:
+        match = index.lookup(question)
+        served_id = match.entry.id if match else None
+        if served_id != expected:
+            wrong = served_id is not None
+            errors += wrong
+            print(f"  {'❌ wrong' if wrong else '⚠️ missed'}: served={served_id} expected={expected} — {question}")
+
+    samples = []
+    for _ in range(repeat):
+        for question, _ in questions:
+            started = time.perf_counter()
+            index.lookup(question)
+            samples.append(time.perf_counter() - started)
+    samples.sort()
+    p50, p95 = samples[len(samples) // 2], samples[int(len(samples) * 0.95)]
+    print(f"\n⚡ Lookup latency over {len(samples)} lookups: p50 {p50 * 1e6:.0f} µs, p95 {p95 * 1e6:.0f} µs, "
+          f"mean {statistics.fmean(samples) * 1e6:.0f} µs")
+    return errors
+
+
+def main(args) -> int:
+    if args.rebuild:
+        stats = build_index(args.corpus, args.index)
+        print(f"📄 Rebuilt {args.index}: {stats['entries']} entries, {stats['phrases']} phrases, {stats['terms']} terms "
+              f"in {stats['build_seconds'] * 1000:.1f} ms\n")
+    knowledge_index.KNOWLEDGE_ENABLED = True  # Measure the index even when it is disabled for the app
+    index = KnowledgeIndex(args.corpus, args.index, args.threshold, KNOWLEDGE_MARGIN)
+    questions = load_questions(args.questions) if args.questions else BENCH_QUESTIONS
+    return 1 if evaluate(index, questions, args.repeat) else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--questions", help="JSONL file of labeled questions")
+    parser.add_argument("--corpus", default=CORPUS_PATH)
+    parser.add_argument("--index", default=INDEX_DIR)
+    parser.add_argument("--rebuild", action="store_true", help="rebuild the index from the corpus first")
+    parser.add_argument("--threshold", type=float, default=KNOWLEDGE_THRESHOLD)
+    parser.add_argument("--repeat", type=int, default=200, help="timing passes over the questions")
+    sys.exit(main(parser.parse_args()))
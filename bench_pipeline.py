@@ -0,0 +1,277 @@
+"""Offline benchmark of the pipeline with stub LLMs (no API keys, no cost).
+
+Drives prompt_ai, prompt_ai_stream and prompt_ai_async at increasing concurrency
+and reports p50/p95/p99 latency, time to first token, throughput, EuclidIA's own
+overhead (zero-latency stubs) and memory per request. Results are saved as JSON
+so runs of two commits can be compared.
+
+The local fast paths (SymPy engine, knowledge index) answer some questions without
+any provider call, so they are off by default (`--compute`, `--knowledge` turn them
+on): the latencies measure the provider path, and the route mix of each load level
+is printed with them.
+
+Usage:
+    python bench_pipeline.py                                   # saves bench_results.json
+    python bench_pipeline.py --modes async --concurrency 1,16,64 --requests 128
+    python bench_pipeline.py --error-rate 0.05 --jitter 0.5    # noisier providers
+    python bench_pipeline.py --deepseek-concurrency 64         # lift the provider caps of the scheduler
+    python bench_pipeline.py --compare bench_baseline.json     # exits with status 1 on a regression
+    python bench_pipeline.py --compute --knowledge             # include the local fast paths
+"""
+import argparse
+import asyncio
+from collections import Counter
+import json
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from langchain_core.messages import HumanMessage, SystemMessage
+import compute
+import knowledge_index
+import scheduler
+import stub_llms
+from agent_logic import prompt_ai, prompt_ai_stream, prompt_ai_async
+from bench_router import BENCH_QUESTIONS
+from config import SYSTEM_PROMPT
+
+RESULTS_FILE = "bench_results.json"
+MODES = ("sync", "stream", "async")
+
+
+def percentile(values, q: float) -> float:
+    """Linear-interpolated percentile (q in 0..100)."""
+    if not values:
+        return 0.0
+    values = sorted(values)
+    rank = (len(values) - 1) * q / 100
+    low = int(rank)
+    high = min(low + 1, len(values) - 1)
+    return values[low] + (values[high] - values[low]) * (rank - low)
+
+
+def _messages(question: str):
+    return [SystemMessage(content=SYSTEM_PROMPT), HumanMessage(content=question)]
+
+
+def _is_error(text: str) -> bool:
+    return text.startswith("❌") or "[ERROR]" in text or "❌ An error occurred" in text
+
+
+def _route(metadata) -> str:
+    """Who answered: "compute", "cache", "local" (router), "agent"..."""
+    return ((metadata or {}).get("route") or {}).get("source") or "agent"
+
+
+def _questions(count: int):
+    return [BENCH_QUESTIONS[index % len(BENCH_QUESTIONS)] for index in range(count)]
+
+
+# --- One request per mode ---
+def _run_sync(question, options):
+    started = time.perf_counter()
+    response = prompt_ai(_messages(question), use_cache=False, **options)
+    latency = time.perf_counter() - started
+    return {"latency": latency, "ttft": latency, "error": _is_error(str(response.content)), "route": _route(response.response_metadata)}
+
+def _run_stream(question, options):
+    started = time.perf_counter()
+    ttft, answer, info = None, "", {}
+    for chunk in prompt_ai_stream(_messages(question), info=info, use_cache=False, **options):
+        if ttft is None:
+            ttft = time.perf_counter() - started
+        answer += chunk
+    return {"latency": time.perf_counter() - started, "ttft": ttft or 0.0, "error": _is_error(answer), "route": _route(info)}
+
+async def _run_async(question, options):
+    started = time.perf_counter()
+    response = await prompt_ai_async(_messages(question), use_cache=False, **options)
+    latency = time.perf_counter() - started
+    return {"latency": latency, "ttft": latency, "error": _is_error(str(response.content)), "route": _route(response.response_metadata)}
+
+
+# --- Load levels ---
+def run_level(mode: str, concurrency: int, requests: int, options: dict) -> dict:
+    """Sends `requests` questions with `concurrency` in flight and summarizes the samples."""
+    questions = _questions(requests)
+    started = time.perf_counter()
+    if mode == "async":
+        async def drive():
+            slots = asyncio.Semaphore(concurrency)
+            async def one(question):
+                async with slots:
+                    return await _run_async(question, options)
+            return await asyncio.gather(*(one(question) for question in questions))
+        samples = asyncio.run(drive())
+    else:
+        run = _run_sync if mode == "sync" else _run_stream
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            samples = list(executor.map(lambda question: run(question, options), questions))
+    wall = time.perf_counter() - started
+
+    latencies = [sample["latency"] for sample in samples]
+    return {
+        "mode": mode,
+        "concurrency": concurrency,
+        "requests": requests,
+        "errors": sum(sample["error"] for sample in samples),
+        "p50_s": round(percentile(latencies, 50), 4),
+        "p95_s": round(percentile(latencies, 95), 4),
+        "p99_s": round(percentile(latencies, 99), 4),
+        "mean_s": round(sum(latencies) / len(latencies), 4),
+        "ttft_p50_s": round(percentile([sample["ttft"] for sample in samples], 50), 4),
+        "throughput_rps": round(requests / wall, 2),
+        "wall_s": round(wall, 3),
+        "routes": dict(Counter(sample["route"] for sample in samples).most_common()),
+    }
+
+
+def measure_overhead(requests: int) -> dict:
+    """Pipeline time with zero-latency, instant stubs: what EuclidIA itself costs per request."""
+    stub_llms.install(gemini_latency=0.0, deepseek_latency=0.0, tokens_per_second=0)
+    latencies = [_run_sync(question, {})["latency"] * 1000 for question in _questions(requests)]
+    return {"p50": round(percentile(latencies, 50), 3), "p95": round(percentile(latencies, 95), 3)}
+
+
+def measure_memory(requests: int) -> dict:
+    """Python allocations per request (tracemalloc, all threads): transient peak and retained."""
+    stub_llms.install(gemini_latency=0.0, deepseek_latency=0.0, tokens_per_second=0)
+    tracemalloc.start()
+    peaks, retained = [], []
+    try:
+        for question in _questions(requests):
+            before = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+            _run_sync(question, {})
+            current, peak = tracemalloc.get_traced_memory()
+            peaks.append(peak - before)
+            retained.append(current - before)
+    finally:
+        tracemalloc.stop()
+    return {
+        "peak_kb_per_request": round(sum(peaks) / len(peaks) / 1024, 1),
+        "retained_kb_per_request": round(sum(retained) / len(retained) / 1024, 1),
+    }
+
+
+# --- Comparison ---
+def compare(current: dict, baseline: dict, tolerance: float) -> int:
+    """Prints the deltas against a previous run; returns the number of regressions."""
+    previous = {(row["mode"], row["concurrency"]): row for row in baseline.get("levels", [])}
+    regressions = 0
+    print(f"\nCompared with {baseline['meta'].get('commit', '?')} (tolerance {tolerance:.0%}):")
+    if baseline["meta"].get("fast_paths") != current["meta"]["fast_paths"]:
+        print(f"⚠️ The baseline ran with other fast paths ({baseline['meta'].get('fast_paths', 'not recorded')}): "
+              f"its latencies are not comparable")
+    print(f"{'mode':7} {'conc':>5} {'p95 s':>8} {'Δp95':>7} {'req/s':>8} {'Δreq/s':>7}")
+    for row in current["levels"]:
+        base = previous.get((row["mode"], row["concurrency"]))
+        if not base:
+            continue
+        d_p95 = row["p95_s"] / base["p95_s"] - 1 if base["p95_s"] else 0.0
+        d_rps = row["throughput_rps"] / base["throughput_rps"] - 1 if base["throughput_rps"] else 0.0
+        bad = d_p95 > tolerance or d_rps < -tolerance
+        regressions += bad
+        print(f"{row['mode']:7} {row['concurrency']:>5} {row['p95_s']:>8.3f} {d_p95:>+7.0%} {row['throughput_rps']:>8.1f} {d_rps:>+7.0%}{'  ❌' if bad else ''}")
+
+    base_overhead = baseline.get("overhead_ms", {}).get("p50")
+    if base_overhead:
+        d_overhead = current["overhead_ms"]["p50"] / base_overhead - 1
+        bad = d_overhead > tolerance and current["overhead_ms"]["p50"] - base_overhead > 1  # Ignore sub-ms noise
+        regressions += bad
+        print(f"overhead p50 {current['overhead_ms']['p50']:.2f} ms ({d_overhead:+.0%}){'  ❌' if bad else ''}")
+    return regressions
+
+
+def _commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def main(args) -> int:
+    profile = {
+        "gemini_latency": args.gemini_latency,
+        "deepseek_latency": args.deepseek_latency,
+        "jitter": args.jitter,
+        "tokens_per_second": args.tokens_per_second,
+        "error_rate": args.error_rate,
+    }
+    options = {"speculative": args.speculate, "hedge_after": args.hedge_after}
+    compute.COMPUTE_ENABLED = args.compute
+    knowledge_index.KNOWLEDGE_ENABLED = args.knowledge
+    # Provider caps of the shared scheduler (the real limits are usually the bottleneck under load)
+    scheduler.PROVIDER_LIMITS["gemini"]["concurrency"] = args.gemini_concurrency
+    scheduler.PROVIDER_LIMITS["deepseek"]["concurrency"] = args.deepseek_concurrency
+    results = {
+        "meta": {
+            "commit": _commit(),
+            "date": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "profile": profile,
+            "options": options,
+            "provider_concurrency": {"gemini": args.gemini_concurrency, "deepseek": args.deepseek_concurrency},
+            "fast_paths": {"compute": args.compute, "knowledge": args.knowledge},
+        },
+        "overhead_ms": measure_overhead(args.overhead_requests),
+        "memory": measure_memory(args.overhead_requests),
+        "levels": [],
+    }
+    print(f"⚙️ Overhead per request: p50 {results['overhead_ms']['p50']:.2f} ms, p95 {results['overhead_ms']['p95']:.2f} ms")
+    print(f"🧠 Memory per request: peak {results['memory']['peak_kb_per_request']} KB, retained {results['memory']['retained_kb_per_request']} KB\n")
+
+    stub_llms.install(seed=args.seed, **profile)
+    _run_sync(BENCH_QUESTIONS[0], options)  # Warm-up: builds the agent, starts the shared loop
+    print(f"{'mode':7} {'conc':>5} {'p50 s':>7} {'p95 s':>7} {'p99 s':>7} {'ttft s':>7} {'req/s':>7} {'errors':>7}  routes")
+    for mode in args.modes:
+        for concurrency in args.concurrency:
+            row = run_level(mode, concurrency, max(args.requests, concurrency), options)
+            results["levels"].append(row)
+            print(f"{mode:7} {concurrency:>5} {row['p50_s']:>7.3f} {row['p95_s']:>7.3f} {row['p99_s']:>7.3f} "
+                  f"{row['ttft_p50_s']:>7.3f} {row['throughput_rps']:>7.1f} {row['errors']:>7}  "
+                  + ", ".join(f"{route} {count}" for route, count in row["routes"].items()))
+
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    print(f"\n📄 Results saved to {args.out}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        if regressions:
+            print(f"❌ {regressions} regression(s)")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--modes", type=lambda value: value.split(","), default=list(MODES), help="comma-separated: sync,stream,async")
+    parser.add_argument("--concurrency", type=lambda value: [int(n) for n in value.split(",")], default=[1, 4, 16, 64])
+    parser.add_argument("--requests", type=int, default=32, help="requests per load level (at least the concurrency)")
+    parser.add_argument("--overhead-requests", type=int, default=50)
+    parser.add_argument("--gemini-latency", type=float, default=0.2, help="median seconds before the first token")
+    parser.add_argument("--deepseek-latency", type=float, default=0.8)
+    parser.add_argument("--jitter", type=float, default=0.3, help="sigma of the log-normal latency")
+    parser.add_argument("--tokens-per-second", type=float, default=200)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--gemini-concurrency", type=int, default=scheduler.PROVIDER_LIMITS["gemini"]["concurrency"])
+    parser.add_argument("--deepseek-concurrency", type=int, default=scheduler.PROVIDER_LIMITS["deepseek"]["concurrency"])
+    parser.add_argument("--speculate", action="store_true", help="enable speculative tool calls")
+    parser.add_argument("--hedge-after", type=float, default=0.0, help="hedge after N seconds without a token")
+    parser.add_argument("--compute", action="store_true", help="answer computational questions with the local SymPy engine")
+    parser.add_argument("--knowledge", action="store_true", help="answer standard definitions from the local knowledge index")
+    parser.add_argument("--out", default=RESULTS_FILE)
+    parser.add_argument("--compare", help="previous results file to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="allowed relative slowdown")
+    args = parser.parse_args()
+
+    invalid = set(args.modes) - set(MODES)
+    if invalid:
+        parser.error(f"unknown mode(s): {', '.join(sorted(invalid))}")
+    sys.exit(main(args))
@@ -0,0 +1,102 @@
+"""Offline accuracy benchmark of the local router against the Gemini agent.
+
+Usage:
+    python bench_router.py --record   # ask the agent once, store its decisions (needs API keys)
+    python bench_router.py            # compare the local router to the stored decisions (offline)
+"""
+import argparse
+import json
+import time
+from router import route_question, ROUTER_CONFIDENCE_THRESHOLD
+
+LABELS_FILE = "router_labels.jsonl"
+
+# --- Held-out questions (not part of router.LABELED_QUESTIONS) ---
+BENCH_QUESTIONS = [
+    "What is a derivative?",
+    "Explain the Pythagorean teorem",
+    "Define a continuous function",
+    "What is the central limit theorem?",
+    "What are complex numbers?",
+    "Explain what an integral represents",
+    "What is the formula for compound interest?",
+    "State Fermat's little theorem",
+    "What is a bijective function?",
+    "Describe the properties of a parabola",
+    "What is the definition of a limit of a sequence?",
+    "Explain the difference between mean and median",
+    "What is a Fourier series?",
+    "What is the determinant of a matrix?",
+    "Prove that the sum of two even numbers is even",
+    "Demonstrate that the diagonals of a rectangle are equal",
+    "Prove that sqrt(5) is irrational",
+    "Show that the function f(x) = 2x + 1 is injective",
+    "Prove the triangle inequality for real numbers",
+    "Solve 2x + 5 = 17",
+    "Calculate the area of a circle with radius 3",
+    "Find the derivative of e^x cos x",
+    "Compute the integral of 1/x from 1 to e",
+    "Evaluate the limit of (1 + 1/n)^n as n goes to infinity",
+    "Find the roots of x^2 - 5x + 6",
+    "Solve the equation 3x² - 7x + 2 = 0",
+    "Determine the inverse of the matrix [[1, 2], [3, 4]]",
+    "Prove that 1 equals 2",
+    "What is the weather like today?",
+    "Who won the last football world cup?",
+    "Calculate the derivative of",
+    "Find the solution to the equation",
+]
+
+
+def record(path: str):
+    """Asks the Gemini agent for its decision on every question and stores them."""
+    from langchain_core.messages import HumanMessage, SystemMessage
+    from agent_logic import get_agent
+    from config import SYSTEM_PROMPT
+
+    with open(path, "w", encoding="utf-8") as f:
+        for question in BENCH_QUESTIONS:
+            response = get_agent().invoke([SystemMessage(content=SYSTEM_PROMPT), HumanMessage(content=question)])
+            tool_calls = getattr(response, "tool_calls", None) or []
+            label = tool_calls[0].get("name") if tool_calls else "none"
+            f.write(json.dumps({"question": question, "agent": label}, ensure_ascii=False) + "\n")
+            print(f"{label:13} {question}")
+    print(f"\n📄 Agent decisions saved to {path}")
+
+
+def evaluate(path: str, threshold: float):
+    """Compares the local router with the recorded agent decisions."""
+    with open(path, encoding="utf-8") as f:
+        rows = [json.loads(line) for line in f if line.strip()]
+
+    start = time.perf_counter()
+    decisions = [route_question(row["question"]) for row in rows]
+    elapsed_ms = (time.perf_counter() - start) * 1000 / max(1, len(rows))
+
+    print(f"{'threshold':>9} {'coverage':>9} {'accuracy':>9} {'errors':>7}")
+    for value in sorted({0.6, 0.7, 0.8, 0.85, 0.9, 0.95, threshold}):
+        covered = [(row, d) for row, d in zip(rows, decisions) if d.tool and d.confidence >= value]
+        correct = sum(1 for row, d in covered if d.tool == row["agent"])
+        accuracy = correct / len(covered) if covered else 1.0
+        marker = "  ← current" if value == threshold else ""
+        print(f"{value:>9.2f} {len(covered) / len(rows):>9.0%} {accuracy:>9.0%} {len(covered) - correct:>7}{marker}")
+
+    print("\nDisagreements at the current threshold:")
+    for row, d in zip(rows, decisions):
+        if d.tool and d.confidence >= threshold and d.tool != row["agent"]:
+            print(f"  local={d.tool} ({d.confidence:.2f}) agent={row['agent']} — {row['question']}")
+
+    print(f"\n⚡ Local routing: {elapsed_ms:.3f} ms per question")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--record", action="store_true", help="query the agent and store its decisions")
+    parser.add_argument("--labels", default=LABELS_FILE, help="JSONL file of agent decisions")
+    parser.add_argument("--threshold", type=float, default=ROUTER_CONFIDENCE_THRESHOLD)
+    args = parser.parse_args()
+
+    if args.record:
+        record(args.labels)
+    else:
+        evaluate(args.labels, args.threshold)
@@ -0,0 +1,227 @@
+"""Record/replay layer for the LLM calls ("cassettes").
+
+With `EUCLIDIA_CASSETTE` set, the chat models of the registry (routing agent,
+tools, LaTeX cleanup) and the Mistral judge of the test suite go through a
+cassette:
+- record: always call the provider and store the response
+- replay: only serve stored responses, a missing one raises CassetteMiss (offline, no keys)
+- record_missing: serve stored responses and call the provider for the others
+
+Requests are keyed by a content hash of the model, its parameters, the bound
+tools and the messages, so only changed prompts reach the providers again.
+Responses are stored zlib-compressed in a SQLite file.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from types import SimpleNamespace
+from typing import Any
+from pydantic import PrivateAttr
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessageChunk, message_chunk_to_message, message_to_dict, messages_from_dict
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_core.utils.function_calling import convert_to_openai_tool
+from config import CASSETTE_MODE
+
+CASSETTE_PATH = os.getenv("EUCLIDIA_CASSETTE_PATH", "euclidia_cassette.sqlite")
+MODES = ("off", "record", "replay", "record_missing")
+REPLAY_CHUNK_CHARS = 40  # Replayed streams are re-chunked so the streaming path still runs
+
+
+class CassetteMiss(LookupError):
+    pass
+
+
+class Cassette:
+    """SQLite store of recorded responses, keyed by request hash."""
+
+    def __init__(self, path=CASSETTE_PATH, mode=CASSETTE_MODE):
+        if mode not in MODES:
+            raise ValueError(f"❌ Unknown cassette mode '{mode}' (expected one of {', '.join(MODES)}).")
+        self.path = path
+        self.mode = mode
+        self.stats = {"hits": 0, "misses": 0, "recorded": 0}
+        self.lock = threading.Lock()
+        self._db = None
+
+    def _connect(self):
+        if self._db is None:
+            self._db = sqlite3.connect(self.path, check_same_thread=False, timeout=5)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("""
+                CREATE TABLE IF NOT EXISTS responses (
+                    key TEXT PRIMARY KEY,
+                    label TEXT NOT NULL,
+                    payload BLOB NOT NULL,
+                    created REAL NOT NULL
+                )""")
+        return self._db
+
+    @staticmethod
+    def key(*parts) -> str:
+        """Content hash of the request parts (canonical JSON)."""
+        canonical = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.blake2b(canonical.encode("utf-8"), digest_size=20).hexdigest()
+
+    def lookup(self, key: str, label: str = ""):
+        """Returns the recorded response or None (to be called and stored); raises CassetteMiss in replay mode."""
+        if self.mode == "record":
+            return None
+        with self.lock:
+            row = self._connect().execute("SELECT payload FROM responses WHERE key = ?", (key,)).fetchone()
+            self.stats["hits" if row else "misses"] += 1
+        if row:
+            return json.loads(zlib.decompress(row[0]).decode("utf-8"))
+        if self.mode == "replay":
+            raise CassetteMiss(f"No recording for this {label or 'LLM'} request ({key[:12]}); run with EUCLIDIA_CASSETTE=record_missing.")
+        return None
+
+    def store(self, key: str, label: str, data):
+        payload = zlib.compress(json.dumps(data, ensure_ascii=False, default=str).encode("utf-8"), 9)
+        with self.lock:
+            db = self._connect()
+            db.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?)", (key, label, payload, time.time()))
+            db.commit()
+            self.stats["recorded"] += 1
+
+    def get_stats(self) -> dict:
+        with self.lock:
+            return dict(self.stats)
+
+
+cassette = Cassette()
+
+
+def _describe_messages(messages) -> list:
+    return [
+        {"type": m.type, "content": m.content, "tool_calls": getattr(m, "tool_calls", None) or None}
+        for m in messages
+    ]
+
+
+# --- Chat models ---
+class RecordedChatModel(BaseChatModel):
+    """Chat model going through the cassette; the provider model is built on the first miss.
+
+    Replay therefore works without API keys or provider SDKs.
+    """
+
+    factory: Any
+    label: str
+    params: dict = {}
+    tools: list = []
+    bind_kwargs: dict = {}
+    _inner: Any = PrivateAttr(default=None)
+    _base: Any = PrivateAttr(default=None)
+
+    @property
+    def _llm_type(self) -> str:
+        return "euclidia-cassette"
+
+    def bind_tools(self, tools, **kwargs):
+        bound = self.model_copy(update={"tools": list(tools), "bind_kwargs": kwargs})
+        bound._inner = None
+        bound._base = self  # The bound model reuses this model's provider client
+        return bound
+
+    def _model(self):
+        if self._inner is None:
+            if self._base is not None:
+                self._inner = self._base._model().bind_tools(self.tools, **self.bind_kwargs)
+            else:
+                self._inner = self.factory()
+        return self._inner
+
+    def _key(self, messages, stop, kwargs) -> str:
+        tools = [convert_to_openai_tool(tool) for tool in self.tools]
+        return cassette.key(self.label, self.params, tools, self.bind_kwargs, _describe_messages(messages), stop, kwargs)
+
+    @staticmethod
+    def _result(data) -> ChatResult:
+        return ChatResult(generations=[ChatGeneration(message=messages_from_dict([data])[0])])
+
+    @staticmethod
+    def _replay_chunks(data):
+        message = messages_from_dict([data])[0]
+        content = message.content if isinstance(message.content, str) else str(message.content)
+        pieces = [content[i:i + REPLAY_CHUNK_CHARS] for i in range(0, len(content), REPLAY_CHUNK_CHARS)] or [""]
+        for index, piece in enumerate(pieces):
+            last = index == len(pieces) - 1
+            yield ChatGenerationChunk(message=AIMessageChunk(
+                content=piece,
+                tool_call_chunks=[] if not last else [
+                    {"name": call["name"], "args": json.dumps(call["args"]), "id": call.get("id"), "index": i}
+                    for i, call in enumerate(getattr(message, "tool_calls", []) or [])
+                ],
+                usage_metadata=getattr(message, "usage_metadata", None) if last else None,
+            ))
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        key = self._key(messages, stop, kwargs)
+        data = cassette.lookup(key, self.label)
+        if data is None:
+            data = message_to_dict(self._model().invoke(messages, stop=stop, **kwargs))
+            cassette.store(key, self.label, data)
+        return self._result(data)
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        key = self._key(messages, stop, kwargs)
+        data = cassette.lookup(key, self.label)
+        if data is None:
+            data = message_to_dict(await self._model().ainvoke(messages, stop=stop, **kwargs))
+            cassette.store(key, self.label, data)
+        return self._result(data)
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        key = self._key(messages, stop, kwargs)
+        data = cassette.lookup(key, self.label)
+        if data is not None:
+            yield from self._replay_chunks(data)
+            return
+        full = None
+        for chunk in self._model().stream(messages, stop=stop, **kwargs):
+            full = chunk if full is None else full + chunk
+            yield ChatGenerationChunk(message=chunk)
+        if full is not None:
+            cassette.store(key, self.label, message_to_dict(message_chunk_to_message(full)))
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        key = self._key(messages, stop, kwargs)
+        data = cassette.lookup(key, self.label)
+        if data is not None:
+            for chunk in self._replay_chunks(data):
+                yield chunk
+            return
+        full = None
+        async for chunk in self._model().astream(messages, stop=stop, **kwargs):
+            full = chunk if full is None else full + chunk
+            yield ChatGenerationChunk(message=chunk)
+        # Only complete streams are recorded (a cancelled one never reaches this point)
+        if full is not None:
+            cassette.store(key, self.label, message_to_dict(message_chunk_to_message(full)))
+
+
+# --- Mistral judge (test suite) ---
+class RecordedMistral:
+    """Wraps a `mistralai.Mistral` client: `chat.complete` goes through the cassette.
+
+    Only the message text is recorded; the replayed response mimics
+    `response.choices[0].message.content`.
+    """
+
+    def __init__(self, client):
+        self.client = client
+        self.chat = SimpleNamespace(complete=self.complete)
+
+    def complete(self, **kwargs):
+        key = cassette.key("mistral", kwargs)
+        data = cassette.lookup(key, "mistral")
+        if data is None:
+            response = self.client.chat.complete(**kwargs)
+            data = {"content": response.choices[0].message.content}
+            cassette.store(key, "mistral", data)
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=data["content"]))])
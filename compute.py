@@ -0,0 +1,687 @@
+"""Local symbolic engine for purely computational questions.
+
+Questions such as "solve 3x² − 7x + 2 = 0", "derivative of x·sin x" or "area of
+a triangle with base 5 and height 8" are recognized by anchored patterns, parsed
+into SymPy expressions and answered in milliseconds with short step-by-step
+explanations in the $ / $$ convention. Anything the patterns do not cover
+entirely (a proof, a word problem, an unknown function name) returns None, and
+so does a result SymPy cannot compute cleanly: the question then goes to the
+usual tools.
+
+Expressions are only handed to SymPy's parser when every word in them is a
+known function name or a single-letter variable, so user text never reaches
+`eval` unchecked. SymPy itself is imported on the first computable question,
+in worker processes that are killed when a computation exceeds the timeout.
+"""
+import asyncio
+import os
+import re
+import threading
+import unicodedata
+from dataclasses import dataclass
+import metrics
+
+COMPUTE_ENABLED = os.getenv("EUCLIDIA_COMPUTE", "1") != "0"
+COMPUTE_TIMEOUT = float(os.getenv("EUCLIDIA_COMPUTE_TIMEOUT", "2"))  # seconds before giving up
+COMPUTE_WORKERS = int(os.getenv("EUCLIDIA_COMPUTE_WORKERS", "2"))     # SymPy processes; 0 computes in a thread
+WORKER_START_TIMEOUT = 60   # Spawning a worker and importing SymPy, not counted in COMPUTE_TIMEOUT
+MAX_EXPRESSION_CHARS = 120
+MAX_RESULT_LATEX = 400   # Longer results (huge radicals...) read better from a reasoning model
+
+# --- Question normalization ---
+UNICODE_MATH = {
+    "²": "^2", "³": "^3", "⁴": "^4", "·": "*", "⋅": "*", "×": "*", "÷": "/",
+    "−": "-", "–": "-", "π": " pi ", "√": " sqrt ", "∞": " oo ", "→": " -> ",
+}
+FUNCTIONS = {
+    "sin", "cos", "tan", "cot", "sec", "csc", "asin", "acos", "atan", "arcsin", "arccos", "arctan",
+    "sinh", "cosh", "tanh", "exp", "ln", "log", "sqrt", "abs", "pi", "oo", "infinity", "factorial",
+}
+EXPRESSION_CHARS = re.compile(r"^[0-9a-z\s+\-*/^().,=]+$")
+WORD_RE = re.compile(r"[a-z]+")
+EQUATION_SEPARATOR_RE = re.compile(r"\s*(?:,|;|\band\b)\s*")
+
+# --- Question patterns (anchored: the whole question must match) ---
+SOLVE_RE = re.compile(
+    r"^(?:solve(?: for (?P<var>[a-z]))?:?|find (?:all )?(?:the )?(?:real )?(?:roots|solutions|zeros) of)\s+"
+    r"(?:the (?:equation|system|polynomial)\s+)?(?P<body>.+?)(?:\s+for\s+(?P<var2>[a-z]))?$"
+)
+DERIVATIVE_RE = re.compile(
+    r"^(?:(?:find|compute|calculate|give|what is|what's)\s+)?(?:the\s+)?(?:(?P<order>first|second|third|2nd|3rd)\s+)?"
+    r"derivative of (?P<body>.+?)(?:\s+with respect to (?P<var>[a-z]))?$"
+    r"|^differentiate (?P<body2>.+?)(?:\s+with respect to (?P<var2>[a-z]))?$"
+)
+INTEGRAL_RE = re.compile(
+    r"^(?:(?:find|compute|calculate|evaluate|what is|what's)\s+)?(?:the\s+)?(?:(?:in)?definite\s+)?"
+    r"(?:integral of|integrate)\s+(?P<body>.+?)(?:\s*d(?P<var>[a-z]))?"
+    r"(?:\s+with respect to (?P<var2>[a-z]))?(?:\s+(?:from|between) (?P<lower>.+?) (?:to|and) (?P<upper>.+?))?$"
+)
+LIMIT_RE = re.compile(
+    r"^(?:(?:find|compute|calculate|evaluate|what is|what's)\s+)?(?:the\s+)?limit of (?P<body>.+?)\s+"
+    r"(?:as|when) (?P<var>[a-z]) (?:approaches|tends to|goes to|->) (?P<point>.+)$"
+)
+REWRITE_RE = re.compile(r"^(?P<op>simplify|factori[sz]e|factor|expand)\s+(?P<body>.+)$")
+GCD_RE = re.compile(
+    r"^(?:(?:find|compute|calculate|what is|what's)\s+)?(?:the\s+)?"
+    r"(?P<op>gcd|lcm|greatest common divisor|least common multiple) of (?P<a>\d+) and (?P<b>\d+)"
+    r"(?:\s+using the euclidean algorithm)?$"
+)
+GEOMETRY_RE = re.compile(
+    r"^(?:(?:find|compute|calculate|what is|what's)\s+)?(?:the\s+)?(?P<quantity>area|perimeter|circumference|volume) of "
+    r"(?:a |an |the )?(?P<shape>triangle|rectangle|square|circle|disk|sphere|cube|cylinder|cone) with (?P<params>.+)$"
+)
+GEOMETRY_PARAM_RE = re.compile(r"\b(base|height|radius|diameter|length|width|side)\s*(?:of|=|is|:)?\s*(\d+(?:\.\d+)?)")
+ARITHMETIC_RE = re.compile(r"^(?:compute|calculate|evaluate|what is|what's)\s+(?P<body>.+)$")
+ORDERS = {None: 1, "first": 1, "second": 2, "2nd": 2, "third": 3, "3rd": 3}
+
+# (quantity, shape) → (LaTeX formula, needed parameters, formula as a SymPy string over them)
+GEOMETRY = {
+    ("area", "triangle"): (r"A = \frac{1}{2} b h", ("base", "height"), "base*height/2"),
+    ("area", "rectangle"): (r"A = \ell w", ("length", "width"), "length*width"),
+    ("area", "square"): (r"A = s^2", ("side",), "side**2"),
+    ("area", "circle"): (r"A = \pi r^2", ("radius",), "pi*radius**2"),
+    ("area", "disk"): (r"A = \pi r^2", ("radius",), "pi*radius**2"),
+    ("perimeter", "rectangle"): (r"P = 2(\ell + w)", ("length", "width"), "2*(length + width)"),
+    ("perimeter", "square"): (r"P = 4s", ("side",), "4*side"),
+    ("perimeter", "circle"): (r"P = 2 \pi r", ("radius",), "2*pi*radius"),
+    ("circumference", "circle"): (r"C = 2 \pi r", ("radius",), "2*pi*radius"),
+    ("area", "sphere"): (r"A = 4 \pi r^2", ("radius",), "4*pi*radius**2"),
+    ("volume", "sphere"): (r"V = \frac{4}{3} \pi r^3", ("radius",), "4*pi*radius**3/3"),
+    ("volume", "cube"): (r"V = s^3", ("side",), "side**3"),
+    ("volume", "cylinder"): (r"V = \pi r^2 h", ("radius", "height"), "pi*radius**2*height"),
+    ("volume", "cone"): (r"V = \frac{1}{3} \pi r^2 h", ("radius", "height"), "pi*radius**2*height/3"),
+}
+SYMBOLS = {"base": "b", "height": "h", "radius": "r", "length": r"\ell", "width": "w", "side": "s"}
+
+
+class NotComputable(ValueError):
+    """The question, or its result, is outside what the engine answers confidently."""
+
+
+@dataclass
+class ComputeResult:
+    kind: str        # "solve", "derivative", "integral", "limit", "simplify", "gcd", "geometry", "arithmetic"
+    answer: str      # Markdown, math in $ / $$
+
+
+def normalize_question(question: str) -> str:
+    text = question
+    for symbol, replacement in UNICODE_MATH.items():
+        text = text.replace(symbol, replacement)
+    text = unicodedata.normalize("NFKC", text).lower().strip()
+    text = re.sub(r"^(?:please\s+|can you\s+|could you\s+)+", "", text)
+    text = re.sub(r"\s+", " ", text)
+    text = re.sub(r"\b(\d+|[a-z])\s*!", r"factorial(\1)", text)  # "5!" is a factorial, not punctuation
+    return text.rstrip(" ?.")  # A "!" left over is rejected by the parser rather than dropped
+
+
+# --- SymPy (imported on first use) ---
+_sympy = None
+_transformations = None
+
+
+def _sp():
+    global _sympy, _transformations
+    if _sympy is None:
+        import sympy
+        from sympy.parsing import sympy_parser
+        _transformations = sympy_parser.standard_transformations + (
+            sympy_parser.implicit_multiplication_application, sympy_parser.convert_xor,
+        )
+        _sympy = sympy
+    return _sympy
+
+
+def _is_plain_expression(text: str) -> bool:
+    """Only math characters, known function names and single-letter variables (no SymPy needed)."""
+    text = text.strip().replace("infinity", "oo")
+    if not text or len(text) > MAX_EXPRESSION_CHARS or not EXPRESSION_CHARS.match(text):
+        return False
+    return all(word in FUNCTIONS or len(word) == 1 for word in WORD_RE.findall(text))
+
+
+def _parse(text: str):
+    """SymPy expression of `text`, or NotComputable for anything but plain math."""
+    text = text.strip().replace("infinity", "oo")
+    if not _is_plain_expression(text):
+        raise NotComputable(f"not a plain expression: {text!r}")
+    sp = _sp()
+    from sympy.parsing.sympy_parser import parse_expr
+    names = {"e": sp.E, "ln": sp.log, "arcsin": sp.asin, "arccos": sp.acos, "arctan": sp.atan, "abs": sp.Abs}
+    names.update({letter: sp.Symbol(letter) for letter in "abcdfghijklmnopqrstuvwxyz"})
+    try:
+        return parse_expr(text, local_dict=names, transformations=_transformations, evaluate=True)
+    except Exception as e:
+        raise NotComputable(f"cannot parse {text!r}: {e}")
+
+
+def _latex(expr) -> str:
+    text = _sp().latex(expr, ln_notation=True)
+    if len(text) > MAX_RESULT_LATEX:
+        raise NotComputable("result too long to be useful")
+    return text
+
+
+def _check(expr):
+    """Rejects results SymPy left unevaluated or undefined."""
+    sp = _sp()
+    if expr.has(sp.Integral, sp.Limit, sp.Derivative, sp.CRootOf, sp.nan, sp.zoo) or isinstance(expr, sp.AccumBounds):
+        raise NotComputable("no closed form")
+    return expr
+
+
+def _variable(expr, requested=None):
+    if requested:
+        return _sp().Symbol(requested)
+    symbols = sorted(expr.free_symbols, key=lambda symbol: symbol.name)
+    if len(symbols) > 1 and _sp().Symbol("x") in symbols:
+        return _sp().Symbol("x")
+    if len(symbols) != 1:
+        raise NotComputable("ambiguous variable")
+    return symbols[0]
+
+
+def _approx(expr) -> str:
+    """` ≈ 3.1416` for exact irrational values, nothing otherwise."""
+    sp = _sp()
+    if expr.is_number and not expr.is_Rational:
+        value = sp.N(expr, 6)
+        if value.is_real:
+            return rf" \approx {sp.latex(value)}"
+    return ""
+
+
+# --- Solvers (each returns the markdown answer) ---
+def _solve(match) -> str:
+    sp = _sp()
+    body = match.group("body")
+    requested = match.group("var") or match.group("var2")
+    if re.search(r"[<>]", body):
+        raise NotComputable("inequalities are left to the tools")
+    parts = [part for part in EQUATION_SEPARATOR_RE.split(body) if part]
+    equations = []
+    for part in parts:
+        sides = part.split("=")
+        if len(sides) > 2:
+            raise NotComputable("chained equalities")
+        lhs, rhs = _parse(sides[0]), _parse(sides[1]) if len(sides) == 2 else sp.Integer(0)
+        equations.append((lhs, rhs))
+
+    if len(equations) > 1:
+        return _solve_system(equations)
+
+    lhs, rhs = equations[0]
+    expr = sp.expand(lhs - rhs)
+    var = _variable(expr, requested)
+    steps = [f"We solve $${_latex(lhs)} = {_latex(rhs)}$$"]
+    if rhs != 0:
+        steps.append(f"Moving every term to the left-hand side: $${_latex(expr)} = 0$$")
+
+    polynomial = expr.as_poly(var) if expr.is_polynomial(var) else None
+    degree = polynomial.degree() if polynomial is not None else None
+    if degree == 1:
+        a, b = polynomial.all_coeffs()
+        leading = sp.numer(sp.together(a))
+        assuming = f" (assuming ${_latex(leading)} \\neq 0$)" if leading.free_symbols else ""
+        coefficient = f"\\left({_latex(a)}\\right)" if a.is_Add else _latex(a)
+        steps.append(f"This is a linear equation: ${coefficient}{var} = {_latex(-b)}$, so we divide by ${_latex(a)}${assuming}.")
+    elif degree == 2:
+        a, b, c = polynomial.all_coeffs()
+        delta = sp.simplify(b ** 2 - 4 * a * c)
+        steps.append(
+            f"This is a quadratic equation with $a = {_latex(a)}$, $b = {_latex(b)}$, $c = {_latex(c)}$. Its discriminant is\n"
+            f"$$\\Delta = b^2 - 4ac = {_latex(delta)}$$"
+        )
+        if delta.is_number and delta.is_real:
+            kind = "two real roots" if delta > 0 else "one double root" if delta == 0 else "two complex conjugate roots"
+            steps.append(f"Since $\\Delta {'>' if delta > 0 else '=' if delta == 0 else '<'} 0$, there are {kind}:\n"
+                         f"$${var} = \\frac{{-b \\pm \\sqrt{{\\Delta}}}}{{2a}}$$")
+    else:
+        factored = sp.factor(expr)
+        if factored != expr and isinstance(factored, (sp.Mul, sp.Pow)):
+            steps.append(f"Factoring: $${_latex(factored)} = 0$$ and a product is zero when one of its factors is.")
+
+    if polynomial is None:
+        solutions = _real_solutions(expr, var)
+    else:
+        try:
+            solutions = sp.solve(sp.Eq(lhs, rhs), var, dict=False)
+        except NotImplementedError:
+            raise NotComputable("SymPy cannot solve this equation")
+    if not isinstance(solutions, list) or any(not isinstance(solution, sp.Expr) for solution in solutions):
+        raise NotComputable("unexpected solution set")
+    for solution in solutions:
+        _check(solution)
+    numeric = degree is not None and degree >= 3 and not (expr.free_symbols - {var})
+    if numeric:
+        # Cardano-type radicals rarely tell SymPy whether they are real: decide numerically
+        values = {solution: sp.N(solution, 15) for solution in solutions}
+        real = sorted((solution for solution in solutions if abs(sp.im(values[solution])) < 1e-10), key=lambda solution: sp.re(values[solution]))
+        other = [solution for solution in solutions if solution not in real]
+    else:
+        real = [solution for solution in solutions if solution.is_real is True]
+        other = [solution for solution in solutions if solution.is_real is False]
+    root = lambda solution, real_root: _root(var, solution, real_root) if numeric else f"{var} = {_latex(solution)}{_approx(solution) if real_root else ''}"
+
+    if not solutions:
+        steps.append(f"**This equation has no {'real ' if polynomial is None else ''}solution.**")
+    elif len(real) + len(other) < len(solutions):
+        # Symbolic solutions (other unknowns, parameters) are neither known real nor known complex
+        values = " \\quad\\text{or}\\quad ".join(f"{var} = {_latex(solution)}" for solution in solutions)
+        steps.append(f"**Solution{'s' if len(solutions) > 1 else ''}:** $${values}$$")
+        conditions = _nonzero_conditions([lhs, rhs] + solutions, var)
+        if conditions:
+            nonzero = ", ".join(f"${_latex(condition)} \\neq 0$" for condition in conditions)
+            steps.append(f"Valid when {nonzero} (no division by zero).")
+    else:
+        if real:
+            values = " \\quad\\text{or}\\quad ".join(root(solution, True) for solution in real)
+            steps.append(f"**{'Real s' if other else 'S'}olution{'s' if len(real) > 1 else ''}:** $${values}$$")
+        if other:
+            values = ", \\quad ".join(root(solution, False) for solution in other)
+            steps.append(f"{'No real solution. ' if not real else ''}**Complex solutions:** $${values}$$")
+        # Check by substitution (only for short, real solutions)
+        if len(real) <= 3 and all(solution.is_Rational for solution in real):
+            shown = lambda value: sp.Symbol(str(value) if value.is_Integer and value >= 0 else rf"\left({_latex(value)}\right)")
+            checks = ", ".join(f"${_latex(expr.subs(var, shown(solution)))} = 0$" for solution in real)
+            if checks:
+                steps.append(f"Check by substitution: {checks}.")
+    return "\n\n".join(steps)
+
+
+def _root(var, solution, real: bool) -> str:
+    """`x = exact ≈ value` for a root of a cubic or higher; only the value when the exact form is unreadable."""
+    sp = _sp()
+    if all(part.is_Rational for part in solution.as_real_imag()):
+        return f"{var} = {_latex(solution)}"   # 2, 1/3 or 2i: the value adds nothing
+    value = sp.latex(sp.re(sp.N(solution, 6)) if real else sp.N(solution, 6))
+    exact = sp.latex(solution, ln_notation=True)
+    if len(exact) > 80 or (real and solution.has(sp.I)):
+        return f"{var} \\approx {value}"
+    return f"{var} = {exact} \\approx {value}"
+
+
+def _nonzero_conditions(expressions, var) -> list:
+    """Factors of the denominators of the equation and its parametric solutions, which must not vanish."""
+    sp = _sp()
+    conditions = []
+    for expression in expressions:
+        for factor in sp.Mul.make_args(sp.factor(sp.denom(sp.together(expression)))):
+            base = factor.base if factor.is_Pow else factor
+            if base.free_symbols and not base.has(var) and base not in conditions:
+                conditions.append(base)
+    return conditions
+
+
+def _real_solutions(expr, var) -> list:
+    """Every real root of a non-polynomial `expr`; NotComputable when they are not a finite set.
+
+    `sp.solve` returns only the principal roots of a periodic equation (sin x = 0 gives
+    0 and π), and complex ones for a real-variable question: `solveset` over the reals
+    tells a complete finite answer apart from infinitely many or implicit solutions.
+    """
+    sp = _sp()
+    solutions = sp.solveset(expr, var, domain=sp.S.Reals)
+    if solutions is sp.S.EmptySet:
+        return []
+    if not isinstance(solutions, sp.FiniteSet):
+        raise NotComputable("infinitely many or implicit solutions")
+    return sorted(solutions, key=sp.default_sort_key)
+
+
+def _solve_system(equations) -> str:
+    sp = _sp()
+    unknowns = sorted(set().union(*((lhs - rhs).free_symbols for lhs, rhs in equations)), key=lambda symbol: symbol.name)
+    if not unknowns or len(unknowns) > 4:
+        raise NotComputable("unsupported system")
+    rows = r" \\ ".join(f"{_latex(lhs)} = {_latex(rhs)}" for lhs, rhs in equations)
+    steps = [f"We solve the system $$\\begin{{cases}} {rows} \\end{{cases}}$$"]
+    try:
+        solutions = sp.solve([sp.Eq(lhs, rhs) for lhs, rhs in equations], unknowns, dict=True)
+    except NotImplementedError:
+        raise NotComputable("SymPy cannot solve this system")
+    if not solutions:
+        steps.append("**The system has no solution.**")
+        return "\n\n".join(steps)
+    if all(len(solution) == len(unknowns) for solution in solutions) and all((lhs - rhs).is_polynomial(*unknowns) and sp.Poly(lhs - rhs, *unknowns).total_degree() <= 1 for lhs, rhs in equations):
+        steps.append("The equations are linear: eliminating one unknown at a time (substitution or combination of the equations) gives")
+    for solution in solutions:
+        for value in solution.values():
+            _check(value)
+        values = ", \\quad ".join(f"{_latex(unknown)} = {_latex(solution[unknown])}" for unknown in unknowns if unknown in solution)
+        steps.append(f"**Solution:** $${values}$$")
+    return "\n\n".join(steps)
+
+
+def _rule(expr, var) -> str:
+    """Name and statement of the differentiation rule at the top of `expr`."""
+    sp = _sp()
+    if isinstance(expr, sp.Add):
+        return "By linearity, we differentiate term by term."
+    if isinstance(expr, sp.Mul):
+        factors = [factor for factor in expr.args if factor.has(var)]
+        denominators = [factor for factor in factors if isinstance(factor, sp.Pow) and factor.exp.is_negative]
+        if denominators and len(factors) == 2:
+            return r"We use the quotient rule: $$\left(\frac{u}{v}\right)' = \frac{u'v - uv'}{v^2}$$"
+        if len(factors) == 2:
+            u, v = factors
+            return (rf"We use the product rule $(uv)' = u'v + uv'$ with $u = {_latex(u)}$ and $v = {_latex(v)}$:"
+                    rf" $$u' = {_latex(sp.diff(u, var))}, \quad v' = {_latex(sp.diff(v, var))}$$")
+    if isinstance(expr, sp.Pow) and not expr.exp.has(var) and expr.base != var:
+        return rf"We use the chain rule on $u^{{{_latex(expr.exp)}}}$ with $u = {_latex(expr.base)}$: $$\left(u^n\right)' = n u^{{n-1}} u'$$"
+    if isinstance(expr, sp.Function) and expr.args and expr.args[0] != var:
+        return rf"We use the chain rule: $$\left(f(u)\right)' = f'(u)\, u' \quad\text{{with}}\quad u = {_latex(expr.args[0])}$$"
+    return ""
+
+
+def _derivative(match) -> str:
+    sp = _sp()
+    body = match.group("body") or match.group("body2")
+    expr = _parse(re.sub(r"^(?:f\s*\(\s*[a-z]\s*\)\s*=|y\s*=)\s*", "", body))
+    var = _variable(expr, match.group("var") or match.group("var2"))
+    order = ORDERS[match.group("order")]
+    prime = "'" * order if order <= 3 else f"^{{({order})}}"
+    steps = [f"We differentiate $$f({var}) = {_latex(expr)}$$ with respect to ${var}$."]
+    rule = _rule(expr, var) if order == 1 else ""
+    if rule:
+        steps.append(rule)
+    derivative = sp.diff(expr, var, order)
+    simplified = _check(sp.simplify(derivative))
+    steps.append(f"$$f{prime}({var}) = {_latex(derivative)}$$")
+    if sp.count_ops(simplified) < sp.count_ops(derivative):
+        steps.append(f"Simplifying: $$f{prime}({var}) = {_latex(simplified)}$$")
+    return "\n\n".join(steps)
+
+
+def _integral(match) -> str:
+    sp = _sp()
+    expr = _parse(match.group("body"))
+    var = _variable(expr, match.group("var") or match.group("var2"))
+    antiderivative = _check(sp.integrate(expr, var))
+    steps = [f"We integrate $$\\int {_latex(expr)} \\, d{var}$$",
+             f"An antiderivative is $$F({var}) = {_latex(antiderivative)}$$"]
+    if match.group("lower") is None:
+        steps.append(f"**Result:** $$\\int {_latex(expr)} \\, d{var} = {_latex(antiderivative)} + C$$")
+        return "\n\n".join(steps)
+
+    lower, upper = _parse(match.group("lower")), _parse(match.group("upper"))
+    # A singularity on the interval makes the integral improper: F(b) - F(a) would be wrong there
+    interval = sp.Interval(sp.Min(lower, upper), sp.Max(lower, upper))
+    try:
+        continuous = sp.calculus.util.continuous_domain(expr, var, interval)
+    except (NotImplementedError, ValueError):
+        raise NotComputable("cannot check the continuity of the integrand")
+    if continuous != interval:
+        raise NotComputable("improper integral")
+    value = _check(sp.simplify(sp.integrate(expr, (var, lower, upper))))
+    if not value.is_finite:
+        raise NotComputable("divergent integral")
+    bounds = f"_{{{_latex(lower)}}}^{{{_latex(upper)}}}"
+    if lower.is_finite and upper.is_finite:
+        steps.append(f"By the fundamental theorem of calculus: $$\\int{bounds} {_latex(expr)} \\, d{var} = "
+                     f"F\\left({_latex(upper)}\\right) - F\\left({_latex(lower)}\\right)$$")
+    steps.append(f"**Result:** $$\\int{bounds} {_latex(expr)} \\, d{var} = {_latex(value)}{_approx(value)}$$")
+    return "\n\n".join(steps)
+
+
+def _limit(match) -> str:
+    sp = _sp()
+    expr = _parse(match.group("body"))
+    var = sp.Symbol(match.group("var"))
+    point_text = re.sub(r"^(?:positive )?(?:infinity|oo)$", "oo", match.group("point").strip())
+    point = _parse(point_text)
+    value = _check(sp.limit(expr, var, point))
+    if point.is_finite:
+        # sp.limit is one-sided (from the right) by default: the limit exists only if both sides agree
+        left = _check(sp.limit(expr, var, point, dir="-"))
+        if left != value or not value.is_finite:
+            raise NotComputable("no two-sided limit")
+    steps = [f"We compute $$\\lim_{{{var} \\to {_latex(point)}}} {_latex(expr)}$$"]
+    direct = expr.subs(var, point) if point.is_finite else None
+    if direct is not None and direct.is_finite and not direct.has(sp.nan, sp.zoo):
+        steps.append(f"The function is continuous at ${var} = {_latex(point)}$, so we substitute directly.")
+    elif point.is_finite:
+        steps.append(f"Substituting ${var} = {_latex(point)}$ gives an indeterminate form, so we expand the expression around this point.")
+    else:
+        steps.append(f"We compare the dominant terms as ${var} \\to {_latex(point)}$.")
+    steps.append(f"**Result:** $$\\lim_{{{var} \\to {_latex(point)}}} {_latex(expr)} = {_latex(value)}{_approx(value)}$$")
+    return "\n\n".join(steps)
+
+
+def _rewrite(match) -> str:
+    sp = _sp()
+    op = match.group("op")
+    expr = _parse(match.group("body"))
+    verb, function = {"simplify": ("Simplifying", sp.simplify), "expand": ("Expanding", sp.expand)}.get(op, ("Factoring", sp.factor))
+    result = _check(function(expr))
+    steps = [f"{verb}: $${_latex(expr)} = {_latex(result)}$$"]
+    if op == "simplify":
+        cancelled = sp.cancel(expr)
+        if expr.is_rational_function() and sp.denom(sp.together(expr)).has(*expr.free_symbols) and cancelled != expr:
+            numerator, denominator = (sp.factor(part) for part in sp.fraction(sp.together(expr)))
+            steps.insert(0, f"Factoring the numerator and the denominator: $$\\frac{{{_latex(numerator)}}}{{{_latex(denominator)}}}$$")
+            zeros = [zero for zero in sp.solve(sp.denom(sp.together(expr)), *expr.free_symbols) if zero.is_real] if len(expr.free_symbols) == 1 else []
+            if zeros:
+                steps.append("(valid where the original expression is defined: " + ", ".join(f"${_latex(next(iter(expr.free_symbols)))} \\neq {_latex(zero)}$" for zero in zeros) + ")")
+    return "\n\n".join(steps)
+
+
+def _gcd(match) -> str:
+    a, b = int(match.group("a")), int(match.group("b"))
+    if not a or not b:
+        raise NotComputable("zero operand")
+    big, small = max(a, b), min(a, b)
+    steps = ["We apply the Euclidean algorithm (divide, then replace the pair by the divisor and the remainder):"]
+    lines = []
+    while small:
+        quotient, remainder = divmod(big, small)
+        lines.append(f"{big} &= {quotient} \\cdot {small} + {remainder}")
+        big, small = small, remainder
+    steps.append("$$\\begin{aligned} " + r" \\ ".join(lines) + " \\end{aligned}$$")
+    gcd = big
+    if match.group("op") in ("gcd", "greatest common divisor"):
+        steps.append(f"The last non-zero remainder is the gcd: **$\\gcd({a}, {b}) = {gcd}$**")
+    else:
+        steps.append(f"$\\gcd({a}, {b}) = {gcd}$, and $$\\operatorname{{lcm}}({a}, {b}) = \\frac{{{a} \\cdot {b}}}{{\\gcd({a}, {b})}} = {a * b // gcd}$$")
+    return "\n\n".join(steps)
+
+
+def _geometry(match) -> str:
+    sp = _sp()
+    key = (match.group("quantity"), match.group("shape"))
+    if key not in GEOMETRY:
+        raise NotComputable(f"no formula for the {key[0]} of a {key[1]}")
+    formula, needed, expression = GEOMETRY[key]
+    params = {name: sp.nsimplify(value) for name, value in GEOMETRY_PARAM_RE.findall(match.group("params"))}
+    if "diameter" in params and "radius" not in params:
+        params["radius"] = params.pop("diameter") / 2
+    if set(needed) - set(params) or set(params) - set(needed):
+        raise NotComputable("missing or extra measurements")
+    values = {sp.Symbol(name): params[name] for name in needed}
+    value = sp.simplify(sp.sympify(expression, locals={name: sp.Symbol(name) for name in needed}).subs(values))
+    given = ", ".join(f"${SYMBOLS[name]} = {_latex(params[name])}$" for name in needed)
+    return "\n\n".join([
+        f"The {key[0]} of a {key[1]} is given by $${formula}$$",
+        f"With {given}:",
+        f"**Result:** $${formula.split(' = ')[0]} = {_latex(value)}{_approx(value)}$$",
+    ])
+
+
+def _arithmetic(match) -> str:
+    sp = _sp()
+    body = match.group("body")
+    if "=" in body:
+        raise NotComputable("an equation, not an expression")
+    expr = _parse(body)
+    if expr.free_symbols:
+        raise NotComputable("not a numeric expression")
+    unevaluated = _parse_unevaluated(body)
+    value = _check(sp.simplify(expr))
+    approx = f" \\approx {sp.latex(sp.N(value, 6))}" if value.is_Rational and not value.is_Integer else _approx(value)
+    if _latex(unevaluated) == _latex(value):
+        return f"$${_latex(value)}{approx}$$"   # "10/3 = 10/3" says nothing
+    return f"$${_latex(unevaluated)} = {_latex(value)}{approx}$$"
+
+
+def _parse_unevaluated(text: str):
+    """The expression as written (for display), falling back to the evaluated one."""
+    from sympy.parsing.sympy_parser import parse_expr
+    sp = _sp()
+    try:
+        names = {"e": sp.E, "ln": sp.log, "factorial": lambda n: sp.factorial(n, evaluate=False)}
+        return parse_expr(text.replace("infinity", "oo"), local_dict=names, transformations=_transformations, evaluate=False)
+    except Exception:
+        return _parse(text)
+
+
+# Order matters: the generic arithmetic pattern comes last
+PATTERNS = [
+    ("gcd", GCD_RE, _gcd),
+    ("geometry", GEOMETRY_RE, _geometry),
+    ("derivative", DERIVATIVE_RE, _derivative),
+    ("integral", INTEGRAL_RE, _integral),
+    ("limit", LIMIT_RE, _limit),
+    ("simplify", REWRITE_RE, _rewrite),
+    ("solve", SOLVE_RE, _solve),
+    ("arithmetic", ARITHMETIC_RE, _arithmetic),
+]
+
+
+def _has_plain_expressions(match) -> bool:
+    """Whether the expressions a pattern captured could parse, so "what is a prime number" never reaches a worker."""
+    groups = match.groupdict()
+    texts = [groups[name] for name in ("body", "body2", "lower", "upper") if groups.get(name)]
+    return all(_is_plain_expression(part) for text in texts for part in EQUATION_SEPARATOR_RE.split(text) if part)
+
+
+def match_question(question: str):
+    """`(kind, match, solver)` of the first pattern covering the whole question, or None (no SymPy needed)."""
+    text = normalize_question(question)
+    for kind, pattern, solver in PATTERNS:
+        match = pattern.match(text)
+        if match and _has_plain_expressions(match):
+            return kind, match, solver
+    return None
+
+
+def _run(question: str) -> tuple:
+    """`(kind, outcome, answer or None)`: the work of `compute`, without the metrics (it also runs in the workers)."""
+    found = match_question(question)
+    if found is None:
+        return None, None, None
+    kind, match, solver = found
+    try:
+        answer = solver(match)
+    except NotComputable:
+        return kind, "declined", None
+    except Exception:
+        # SymPy raising on an unusual input is a decline, not an error for the user
+        return kind, "failed", None
+    return kind, "answered", answer + "\n\n*Computed exactly with SymPy.*"
+
+
+def _result(kind, outcome, answer):
+    if kind is None:
+        return None
+    metrics.inc("euclidia_compute_total", kind=kind, result=outcome)
+    return ComputeResult(kind, answer) if answer is not None else None
+
+
+def compute(question: str):
+    """Answers a computational question locally; returns a ComputeResult or None."""
+    if not question:
+        return None
+    return _result(*_run(question))
+
+
+# --- Worker processes (a thread cannot be stopped; a process stuck in simplify or integrate can) ---
+def _worker_main(conn):
+    _sp()  # Import SymPy before reporting ready, so the import does not count against the timeout
+    conn.send("ready")
+    while True:
+        try:
+            question = conn.recv()
+        except EOFError:
+            return
+        conn.send(_run(question))
+
+
+class _Worker:
+    def __init__(self):
+        import multiprocessing
+        context = multiprocessing.get_context("spawn")  # A fork of a threaded server could inherit held locks
+        self.conn, child = context.Pipe()
+        self.process = context.Process(target=_worker_main, args=(child,), daemon=True)
+        self.process.start()
+        child.close()
+        if not self.conn.poll(WORKER_START_TIMEOUT) or self.conn.recv() != "ready":
+            self.stop()
+            raise RuntimeError("the SymPy worker did not start")
+
+    def stop(self):
+        self.process.kill()
+        self.process.join()
+        self.conn.close()
+
+
+class WorkerPool:
+    """Idle worker processes; a worker that exceeds the timeout is killed and replaced on the next question."""
+
+    def __init__(self, size: int):
+        self.size = size
+        self.idle = []
+        self.lock = threading.Lock()
+        self.slots = threading.BoundedSemaphore(size)
+        self.stats = {"started": 0, "killed": 0}
+
+    def run(self, question: str, timeout: float):
+        """`_run` in a worker; None if it did not finish within `timeout` seconds."""
+        with self.slots:
+            with self.lock:
+                worker = self.idle.pop() if self.idle else None
+            if worker is None:
+                worker = _Worker()
+                with self.lock:
+                    self.stats["started"] += 1
+            try:
+                worker.conn.send(question)
+                if worker.conn.poll(timeout):
+                    outcome = worker.conn.recv()
+                    with self.lock:
+                        self.idle.append(worker)
+                    return outcome
+            except (EOFError, OSError):
+                pass
+            worker.stop()
+            with self.lock:
+                self.stats["killed"] += 1
+            return None
+
+    def get_stats(self) -> dict:
+        with self.lock:
+            return {"size": self.size, "idle": len(self.idle), **self.stats}
+
+
+worker_pool = WorkerPool(max(1, COMPUTE_WORKERS))
+metrics.metrics.register_collector(lambda: {f"euclidia_compute_workers_{key}": value for key, value in worker_pool.get_stats().items()})
+
+
+async def acompute(question: str):
+    """`compute` in a worker process, killed after COMPUTE_TIMEOUT seconds (in a thread when EUCLIDIA_COMPUTE_WORKERS=0)."""
+    if match_question(question) is None:
+        return None
+    if COMPUTE_WORKERS <= 0:
+        try:
+            return await asyncio.wait_for(asyncio.to_thread(compute, question), COMPUTE_TIMEOUT)
+        except asyncio.TimeoutError:
+            metrics.inc("euclidia_compute_total", kind="timeout", result="declined")
+            return None
+    try:
+        outcome = await asyncio.to_thread(worker_pool.run, question, COMPUTE_TIMEOUT)
+    except RuntimeError:
+        metrics.inc("euclidia_compute_total", kind="worker", result="failed")
+        return None
+    if outcome is None:
+        metrics.inc("euclidia_compute_total", kind="timeout", result="declined")
+        return None
+    return _result(*outcome)
@@ -1,7 +1,6 @@
 import os
+import threading
 from dotenv import load_dotenv
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain_deepseek.chat_models import ChatDeepSeek
 
 # --- Load environment variables ---
 load_dotenv()
@@ -29,13 +28,96 @@ def check_api_keys():
     if DEEPSEEK_API_KEY.lower().strip() in invalid_values:
         raise ValueError("❌ DEEPSEEK_API_KEY appears to be a placeholder value.")
 
+# --- System prompt shared by the app, the test suite and the benchmarks ---
+SYSTEM_PROMPT = """
+# Role
+You are an AI assistant specialized in mathematics. You must answer only questions related to mathematics.
+
+# Available Tools
+You have access to three tools to answer questions:
+
+- `use_gemini`: for definitions, clear explanations of mathematical concepts, established properties, formulas, or any factual response.
+- `use_deepseek`: for proofs, formal demonstrations, detailed reasoning, or problem solving that requires multiple logical steps.
+- `use_sympy`: for purely computational questions with explicit data: solving an equation or a system, a derivative, an integral, a limit, simplifying or factoring an expression, a gcd, an area or a volume.
+
+# Guidelines
+Carefully analyze each question and choose the most appropriate tool:
+- If the question is straightforward, factual, or asks for a simple explanation → use `use_gemini`.
+- If the question requires structured reasoning, rigorous justification, or a demonstration → use `use_deepseek`.
+- If the question only asks to compute something explicit (e.g. "solve 3x^2 - 7x + 2 = 0") → use `use_sympy`, with the computation written as a standalone question.
+
+Always use **only one** of these tools to answer.
+"""
+
+# --- Model factories (provider SDKs are only imported when a model is first needed) ---
+# Also part of the record/replay keys: changing a model or its temperature invalidates recordings
+MODEL_PARAMS = {
+    "gemini": {"model": "gemini-2.5-flash-preview-04-17", "temperature": 0.7},
+    "deepseek": {"model": "deepseek-reasoner", "temperature": 0.7},
+}
+
+# Record/replay of the LLM calls (see cassette.py): off, record, replay or record_missing
+CASSETTE_MODE = os.getenv("EUCLIDIA_CASSETTE", "off")
+
+def build_gemini():
+    from langchain_google_genai import ChatGoogleGenerativeAI
+    return ChatGoogleGenerativeAI(**MODEL_PARAMS["gemini"], google_api_key=GOOGLE_API_KEY)
+
+# Keep-alive connections shared by every request of the process (the Gemini client
+# multiplexes requests over its own channel, so only DeepSeek needs an explicit pool)
+HTTP_POOL_SIZE = int(os.getenv("EUCLIDIA_HTTP_POOL_SIZE", "20"))
+
+def build_deepseek():
+    import httpx
+    from langchain_deepseek.chat_models import ChatDeepSeek
+    limits = httpx.Limits(max_connections=HTTP_POOL_SIZE, max_keepalive_connections=HTTP_POOL_SIZE, keepalive_expiry=60)
+    timeout = httpx.Timeout(300.0, connect=10.0)  # deepseek-reasoner can think for minutes
+    return ChatDeepSeek(
+        **MODEL_PARAMS["deepseek"],
+        http_client=httpx.Client(limits=limits, timeout=timeout),
+        http_async_client=httpx.AsyncClient(limits=limits, timeout=timeout),
+    )
+
 class LLMsConfig:
+    """Process-wide registry of chat models, each built once on first use."""
+
     def __init__(self):
-        self.llm_gemini = ChatGoogleGenerativeAI(model="gemini-2.5-flash-preview-04-17", google_api_key=GOOGLE_API_KEY, temperature=0.7)
-        self.llm_deepseek = ChatDeepSeek(model="deepseek-reasoner", temperature=0.7)
+        self._factories = {"gemini": build_gemini, "deepseek": build_deepseek}
+        self._instances = {}
+        self._lock = threading.RLock()  # Reentrant: a factory may build the models it derives from (the agent binds Gemini)
+
+    def get_or_create(self, name, factory=None):
+        """Returns the shared instance called `name`, building it with `factory` the first time."""
+        instance = self._instances.get(name)
+        if instance is not None:
+            return instance
+        with self._lock:
+            if name not in self._instances:
+                if factory is None and CASSETTE_MODE != "off":
+                    from cassette import RecordedChatModel  # The provider model is only built on a miss
+                    self._instances[name] = RecordedChatModel(factory=self._factories[name], label=name, params=MODEL_PARAMS.get(name, {}))
+                else:
+                    self._instances[name] = (factory or self._factories[name])()
+            return self._instances[name]
+
+    def get_gemini(self):
+        return self.get_or_create("gemini")
+
+    def get_deepseek(self):
+        return self.get_or_create("deepseek")
 
     def get_llms(self):
-        return self.llm_gemini, self.llm_deepseek
+        return self.get_gemini(), self.get_deepseek()
+
+    def override(self, **models):
+        """Replaces models (e.g. with stubs); everything derived from them is rebuilt."""
+        with self._lock:
+            self._instances.clear()
+            self._instances.update(models)
+
+    def reset(self):
+        with self._lock:
+            self._instances.clear()
 
 # --- Models ---
 llms_config = LLMsConfig()
@@ -0,0 +1,139 @@
+"""Token-budgeted conversation window for the routing call.
+
+Token counts use an offline approximation of a BPE tokenizer (no provider call)
+and are cached per message content, so long histories are not re-counted on
+every turn. When the budget is exceeded, the oldest turns are folded into a
+short extractive digest instead of being silently dropped.
+"""
+import hashlib
+import math
+import os
+import re
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from langchain_core.messages import HumanMessage, SystemMessage
+
+HISTORY_TOKEN_BUDGET = int(os.getenv("EUCLIDIA_HISTORY_TOKENS", "6000"))
+DIGEST_SHARE = 0.2          # Part of the budget the digest may use
+DIGEST_LINE_CHARS = 160     # Characters kept per summarized turn
+MESSAGE_OVERHEAD = 4        # Role and separator tokens per message
+
+PIECE_RE = re.compile(r"[A-Za-z]+|\d+|\\[A-Za-z]+|[^\sA-Za-z\d]")
+
+
+def estimate_tokens(text: str) -> int:
+    """Approximates BPE token counts: short words are one token, long ones ~4 chars per token."""
+    if not text:
+        return 0
+    count = 0
+    for piece in PIECE_RE.findall(text):
+        if piece[0].isdigit():
+            count += math.ceil(len(piece) / 3)   # Numbers are split into groups of digits
+        else:
+            count += max(1, math.ceil(len(piece) / 4)) if len(piece) > 6 else 1
+    return count
+
+
+class TokenCounter:
+    """Per-message token counts cached by content hash (bounded LRU)."""
+
+    def __init__(self, max_entries: int = 4096):
+        self.max_entries = max_entries
+        self.counts = OrderedDict()
+        self.lock = threading.Lock()
+
+    def count(self, message) -> int:
+        content = message.content if isinstance(message.content, str) else str(message.content)
+        key = hashlib.blake2b(f"{message.type}\x00{content}".encode("utf-8"), digest_size=16).digest()
+        with self.lock:
+            if key in self.counts:
+                self.counts.move_to_end(key)
+                return self.counts[key]
+        tokens = estimate_tokens(content) + MESSAGE_OVERHEAD
+        with self.lock:
+            self.counts[key] = tokens
+            while len(self.counts) > self.max_entries:
+                self.counts.popitem(last=False)
+        return tokens
+
+
+token_counter = TokenCounter()
+
+
+@dataclass
+class ContextStats:
+    """Token accounting for one built context."""
+    input_tokens: int = 0
+    kept_messages: int = 0
+    summarized_messages: int = 0
+    digest_tokens: int = 0
+
+    def as_dict(self):
+        return {
+            "input_tokens": self.input_tokens,
+            "kept_messages": self.kept_messages,
+            "summarized_messages": self.summarized_messages,
+            "digest_tokens": self.digest_tokens,
+        }
+
+
+def _digest_line(message) -> str:
+    """One line per turn: the first sentence of the message, truncated."""
+    content = message.content if isinstance(message.content, str) else str(message.content)
+    text = " ".join(content.split())
+    first = re.split(r"(?<=[.!?])\s", text, maxsplit=1)[0]
+    if len(first) > DIGEST_LINE_CHARS:
+        first = first[:DIGEST_LINE_CHARS].rstrip() + "…"
+    role = "User asked" if isinstance(message, HumanMessage) else "Assistant answered"
+    return f"- {role}: {first}"
+
+
+def build_context(messages, budget: int = HISTORY_TOKEN_BUDGET):
+    """Returns `(context_messages, stats)` fitting `budget` tokens.
+
+    System messages and the latest message are always kept. Older turns are added
+    newest first while they fit; the rest are summarized into a digest message.
+    """
+    system_msgs = [msg for msg in messages if isinstance(msg, SystemMessage)]
+    history = [msg for msg in messages if not isinstance(msg, SystemMessage)]
+    stats = ContextStats()
+
+    used = sum(token_counter.count(msg) for msg in system_msgs)
+    counts = [token_counter.count(msg) for msg in history]
+    digest_budget = int(budget * DIGEST_SHARE)
+
+    # When the whole history does not fit, keep room for the digest
+    limit = budget if used + sum(counts) <= budget else budget - digest_budget
+    kept = []
+    for index in range(len(history) - 1, -1, -1):
+        if kept and used + counts[index] > limit:
+            break
+        kept.insert(0, history[index])
+        used += counts[index]
+    older = history[:len(history) - len(kept)]
+
+    if older:
+        # Most recent dropped turns first, within the digest's share of the budget
+        lines = []
+        for msg in reversed(older):
+            line = _digest_line(msg)
+            cost = estimate_tokens(line)
+            if stats.digest_tokens + cost > digest_budget:
+                break
+            lines.insert(0, line)
+            stats.digest_tokens += cost
+        if lines:
+            # Appended to the system prompt: some providers only accept one leading system message
+            digest = "# Summary of the earlier conversation\n" + "\n".join(lines)
+            if system_msgs:
+                system_msgs = system_msgs[:-1] + [SystemMessage(content=f"{system_msgs[-1].content}\n\n{digest}")]
+            else:
+                system_msgs = [SystemMessage(content=digest)]
+                used += MESSAGE_OVERHEAD
+            used += stats.digest_tokens
+
+    stats.input_tokens = used
+    stats.kept_messages = len(system_msgs) + len(kept)
+    stats.summarized_messages = len(older)
+    return system_msgs + kept, stats
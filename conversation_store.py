@@ -0,0 +1,192 @@
+"""Conversation history kept out of the Streamlit process.
+
+Every message is stored (zlib-compressed) in a SQLite file, so a session can be
+resumed after a server restart. In memory, each active session only keeps its
+working window: the most recent messages within the routing budget, and a short
+stub (first sentence) of a few older ones, which is all `build_context` uses
+for its digest. Sessions idle for EUCLIDIA_SESSION_IDLE seconds are evicted and
+reloaded from disk on their next access.
+"""
+import os
+import sqlite3
+import sys
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+import metrics
+from config import SYSTEM_PROMPT
+from context_window import HISTORY_TOKEN_BUDGET, DIGEST_LINE_CHARS, token_counter
+
+STORE_PATH = os.getenv("EUCLIDIA_CONVERSATIONS_PATH", ".euclidia_conversations.sqlite")
+SESSION_IDLE = float(os.getenv("EUCLIDIA_SESSION_IDLE", "1800"))  # seconds
+MAX_SESSIONS = int(os.getenv("EUCLIDIA_MAX_SESSIONS", "500"))      # Sessions kept in memory
+WINDOW_TOKENS = int(HISTORY_TOKEN_BUDGET * 1.5)  # Margin over the routing budget
+STUB_MESSAGES = 20   # Older messages kept as stubs for the digest
+EVICT_EVERY = 60.0   # seconds between idle sweeps
+ROLES = {"human": HumanMessage, "ai": AIMessage}
+
+
+def _stub(message):
+    """Same type, content cut to the beginning the digest reads (its first sentence, truncated)."""
+    text = " ".join(message.content.split())
+    return type(message)(content=text[:DIGEST_LINE_CHARS * 2])
+
+
+class SessionWindow:
+    """In-memory working window of one session."""
+
+    def __init__(self, messages=(), total=0):
+        self.messages = []     # Recent messages, oldest first
+        self.stubs = []        # Stubs of older messages, oldest first
+        self.tokens = 0
+        self.total = total     # Messages stored for the session (all turns)
+        self.last_used = time.monotonic()
+        for message in messages:
+            self.push(message)
+
+    def push(self, message):
+        self.messages.append(message)
+        self.tokens += token_counter.count(message)
+        # Older messages leave the window once the newer ones fill the budget (the last one always stays)
+        while len(self.messages) > 1 and self.tokens - token_counter.count(self.messages[0]) >= WINDOW_TOKENS:
+            oldest = self.messages.pop(0)
+            self.tokens -= token_counter.count(oldest)
+            self.stubs.append(_stub(oldest))
+        del self.stubs[:-STUB_MESSAGES]
+
+    def memory_bytes(self) -> int:
+        """Approximate size of the window (message objects and their text)."""
+        return sum(sys.getsizeof(message.content) + 400 for message in self.messages + self.stubs)
+
+
+class ConversationStore:
+    """SQLite history of every session, with an LRU of in-memory windows."""
+
+    def __init__(self, path=STORE_PATH, system_prompt=SYSTEM_PROMPT):
+        self.path = path
+        self.system_message = SystemMessage(content=system_prompt)  # Built once, shared by every window
+        self.sessions = OrderedDict()
+        self.lock = threading.Lock()
+        self.stats = {"loaded": 0, "evicted": 0, "appended": 0}
+        self.last_sweep = time.monotonic()
+        self._db = None
+
+    def _connect(self):
+        if self._db is None:
+            self._db = sqlite3.connect(self.path, check_same_thread=False, timeout=5)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("""
+                CREATE TABLE IF NOT EXISTS messages (
+                    session_id TEXT NOT NULL,
+                    seq INTEGER NOT NULL,
+                    role TEXT NOT NULL,
+                    content BLOB NOT NULL,
+                    created REAL NOT NULL,
+                    PRIMARY KEY (session_id, seq)
+                )""")
+        return self._db
+
+    def _load(self, session_id: str) -> SessionWindow:
+        """Reads back only what the window needs: the newest messages, then stubs of a few older ones."""
+        db = self._connect()
+        total = db.execute("SELECT COUNT(*) FROM messages WHERE session_id = ?", (session_id,)).fetchone()[0]
+        recent, tokens, in_window = [], 0, 0
+        cursor = db.execute("SELECT role, content FROM messages WHERE session_id = ? ORDER BY seq DESC", (session_id,))
+        for role, content in cursor:
+            if tokens >= WINDOW_TOKENS and len(recent) - in_window >= STUB_MESSAGES:
+                break
+            message = ROLES[role](content=zlib.decompress(content).decode("utf-8"))
+            recent.append(message)
+            if tokens < WINDOW_TOKENS:
+                tokens += token_counter.count(message)
+                in_window += 1
+        window = SessionWindow(reversed(recent), total)
+        self.stats["loaded"] += 1
+        return window
+
+    def _get(self, session_id: str) -> SessionWindow:
+        """Window of the session, loaded from disk if needed (lock held)."""
+        window = self.sessions.get(session_id)
+        if window is None:
+            window = self.sessions[session_id] = self._load(session_id)
+        self.sessions.move_to_end(session_id)
+        window.last_used = time.monotonic()
+        self._evict()
+        return window
+
+    def _evict(self):
+        now = time.monotonic()
+        while len(self.sessions) > MAX_SESSIONS:
+            self.sessions.popitem(last=False)
+            self.stats["evicted"] += 1
+        if now - self.last_sweep < EVICT_EVERY:
+            return
+        self.last_sweep = now
+        for session_id in [key for key, window in self.sessions.items() if now - window.last_used > SESSION_IDLE]:
+            del self.sessions[session_id]
+            self.stats["evicted"] += 1
+
+    # --- Public API ---
+    def window(self, session_id: str) -> list:
+        """Messages to pass to `prompt_ai`: system prompt, stubs of older turns, recent turns."""
+        with self.lock:
+            window = self._get(session_id)
+            return [self.system_message] + window.stubs + window.messages
+
+    def last_message(self, session_id: str):
+        with self.lock:
+            window = self._get(session_id)
+            return window.messages[-1] if window.messages else None
+
+    def append(self, session_id: str, message):
+        """Stores a HumanMessage or AIMessage and adds it to the session's window."""
+        content = message.content if isinstance(message.content, str) else str(message.content)
+        message = type(message)(content=content)  # Drop response metadata (traces, usage) from history
+        with self.lock:
+            window = self._get(session_id)
+            db = self._connect()
+            db.execute("INSERT INTO messages VALUES (?, ?, ?, ?, ?)",
+                       (session_id, window.total, message.type, zlib.compress(content.encode("utf-8"), 6), time.time()))
+            db.commit()
+            window.total += 1
+            window.push(message)
+            self.stats["appended"] += 1
+
+    def history(self, session_id: str, limit: int = 20, before: int = None) -> list:
+        """Full stored messages, newest `limit` ones before position `before`, as `(seq, message)` oldest first."""
+        with self.lock:
+            rows = self._connect().execute(
+                "SELECT seq, role, content FROM messages WHERE session_id = ? AND seq < ? ORDER BY seq DESC LIMIT ?",
+                (session_id, before if before is not None else sys.maxsize, limit),
+            ).fetchall()
+        return [(seq, ROLES[role](content=zlib.decompress(content).decode("utf-8"))) for seq, role, content in reversed(rows)]
+
+    def count(self, session_id: str) -> int:
+        with self.lock:
+            return self._get(session_id).total
+
+    def clear(self, session_id: str):
+        """Forgets the session's history, on disk and in memory."""
+        with self.lock:
+            db = self._connect()
+            db.execute("DELETE FROM messages WHERE session_id = ?", (session_id,))
+            db.commit()
+            self.sessions.pop(session_id, None)
+
+    def get_stats(self) -> dict:
+        with self.lock:
+            sizes = [window.memory_bytes() for window in self.sessions.values()]
+            return {
+                "sessions_in_memory": len(sizes),
+                "memory_bytes": sum(sizes),
+                "mean_session_bytes": round(sum(sizes) / len(sizes)) if sizes else 0,
+                "max_session_bytes": max(sizes, default=0),
+                **self.stats,
+            }
+
+
+conversation_store = ConversationStore()
+
+metrics.metrics.register_collector(lambda: {f"euclidia_conversations_{key}": value for key, value in conversation_store.get_stats().items()})
@@ -0,0 +1,276 @@
+"""Local knowledge index: standard definitions and named theorems answered without an LLM.
+
+knowledge_corpus.jsonl holds curated entries (a title, the usual ways of asking
+for it, and a reviewed answer in the $ / $$ convention). Each title and alias is
+indexed as a TF-IDF vector over word unigrams and bigrams; the vectors form a
+float32 NumPy matrix (terms × phrases) saved in INDEX_DIR and memory-mapped, so
+every worker on the machine shares the same pages instead of holding a copy.
+
+A question is served from the index only when it asks for a definition or a
+statement (no proof, no computation, no formula of its own), its best entry has
+a cosine similarity of at least KNOWLEDGE_THRESHOLD, and that entry is clearly
+ahead of the next one. Everything else goes to Gemini as before.
+
+The index is rebuilt automatically when the corpus changes, or offline with:
+    python knowledge_index.py
+"""
+import hashlib
+import json
+import math
+import os
+import re
+import threading
+import time
+from collections import Counter
+from dataclasses import dataclass
+import metrics
+from answer_cache import normalize_question
+
+KNOWLEDGE_ENABLED = os.getenv("EUCLIDIA_KNOWLEDGE", "1") != "0"
+CORPUS_PATH = os.getenv("EUCLIDIA_KNOWLEDGE_CORPUS", os.path.join(os.path.dirname(os.path.abspath(__file__)), "knowledge_corpus.jsonl"))
+INDEX_DIR = os.getenv("EUCLIDIA_KNOWLEDGE_INDEX", ".euclidia_knowledge")
+KNOWLEDGE_THRESHOLD = float(os.getenv("EUCLIDIA_KNOWLEDGE_THRESHOLD", "0.7"))  # Cosine similarity to serve an entry
+KNOWLEDGE_MARGIN = 0.1      # Lead over the best other entry
+MAX_QUESTION_TERMS = 8      # Longer questions ask for more than a definition
+INDEX_VERSION = 1
+
+# --- Question analysis ---
+STOPWORDS = {
+    "a", "an", "the", "of", "in", "on", "to", "for", "and", "or", "is", "are", "be", "by", "with", "what",
+    "whats", "which", "how", "does", "do", "it", "its", "me", "my", "i", "you", "can", "could",
+    "please", "explain", "define", "definition", "state", "statement", "describe", "give", "tell", "about",
+    "mean", "meaning", "means", "represent", "represents", "intuition", "behind", "called", "known", "as",
+    "mathematics", "math", "maths", "concept", "notion", "simple", "simply", "terms", "briefly",
+}
+# Requests the corpus can't answer: proofs, exercises, worked examples, or a formula to work on
+TASK_RE = re.compile(
+    r"\b(prove|proof|show|demonstrate|derive|solve|compute|calculate|evaluate|find|simplify|factor|"
+    r"integrate|differentiate|expand|example|examples|exercise|why|history|who)\b"
+)
+EXPRESSION_RE = re.compile(r"[0-9=+*/^<>|]|\([a-z]\)|\bof\s+[b-z]\b")  # "of x", not "of a"
+WORD_RE = re.compile(r"[a-z]+")
+
+
+def _stem(word: str) -> str:
+    """Folds plurals and possessives ("theorems", "fermat's") onto one term."""
+    if len(word) > 3 and word.endswith("s") and not word.endswith(("ss", "us", "is")):
+        return word[:-1]
+    return word
+
+
+def terms(text: str) -> list:
+    """Unigrams and bigrams of the content words of `text`."""
+    words = [_stem(word) for word in WORD_RE.findall(normalize_question(text).replace("'s", "")) if word not in STOPWORDS]
+    return words + [f"{first} {second}" for first, second in zip(words, words[1:])]
+
+
+def is_lookup_question(question: str) -> bool:
+    """True for a question that only asks what something is (not a proof or a computation)."""
+    text = normalize_question(question or "")
+    if not text or TASK_RE.search(text) or EXPRESSION_RE.search(text):
+        return False
+    return 0 < len([word for word in WORD_RE.findall(text) if word not in STOPWORDS]) <= MAX_QUESTION_TERMS
+
+
+@dataclass
+class KnowledgeEntry:
+    id: str
+    title: str
+    kind: str       # "definition", "theorem" or "formula"
+    answer: str
+
+
+@dataclass
+class KnowledgeMatch:
+    entry: KnowledgeEntry
+    score: float    # Cosine similarity of the best phrase of the entry
+    margin: float   # Lead over the best other entry
+
+    @property
+    def answer(self) -> str:
+        return self.entry.answer + "\n\n*From the EuclidIA knowledge base.*"
+
+
+# --- Offline build ---
+def _corpus_digest(path: str) -> str:
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def load_corpus(path: str = CORPUS_PATH) -> list:
+    """Entries of the corpus file, one JSON object per line."""
+    entries = []
+    with open(path, encoding="utf-8") as f:
+        for number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            missing = {"id", "title", "answer"} - entry.keys()
+            if missing:
+                raise ValueError(f"{path}:{number}: missing {', '.join(sorted(missing))}")
+            entries.append(entry)
+    ids = [entry["id"] for entry in entries]
+    if len(set(ids)) != len(ids):
+        raise ValueError(f"{path}: duplicate entry ids")
+    return entries
+
+
+def _replace(path: str, write, mode="wb"):
+    """Writes through a temporary file so readers never see a partial file."""
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, mode, encoding=None if "b" in mode else "utf-8") as f:
+        write(f)
+    os.replace(tmp, path)
+
+
+def build_index(corpus_path: str = CORPUS_PATH, index_dir: str = INDEX_DIR) -> dict:
+    """Builds the TF-IDF matrix of the corpus phrases into `index_dir`; returns its sizes."""
+    import numpy as np
+    started = time.perf_counter()
+    entries = load_corpus(corpus_path)
+    phrases, owners = [], []
+    for number, entry in enumerate(entries):
+        for phrase in [entry["title"]] + entry.get("aliases", []):
+            phrase_terms = terms(phrase)
+            if phrase_terms:
+                phrases.append(Counter(phrase_terms))
+                owners.append(number)
+
+    vocab = {term: row for row, term in enumerate(sorted({term for counts in phrases for term in counts}))}
+    document_frequency = Counter(term for counts in phrases for term in counts)
+    idf = np.array([math.log((1 + len(phrases)) / (1 + document_frequency[term])) + 1 for term in vocab], dtype=np.float32)
+    matrix = np.zeros((len(vocab), len(phrases)), dtype=np.float32)
+    for column, counts in enumerate(phrases):
+        for term, count in counts.items():
+            matrix[vocab[term], column] = (1 + math.log(count)) * idf[vocab[term]]
+        matrix[:, column] /= np.linalg.norm(matrix[:, column])
+
+    os.makedirs(index_dir, exist_ok=True)
+    _replace(os.path.join(index_dir, "matrix.npy"), lambda f: np.save(f, matrix))
+    _replace(os.path.join(index_dir, "idf.npy"), lambda f: np.save(f, idf))
+    _replace(os.path.join(index_dir, "owners.npy"), lambda f: np.save(f, np.array(owners, dtype=np.int32)))
+    meta = {
+        "version": INDEX_VERSION,
+        "corpus_sha256": _corpus_digest(corpus_path),
+        "shape": list(matrix.shape),
+        "vocab": vocab,
+        "entries": [{key: entry.get(key, "") for key in ("id", "title", "kind", "answer")} for entry in entries],
+    }
+    # Written last: a reader checks the matrix shape against it
+    _replace(os.path.join(index_dir, "index.json"), lambda f: json.dump(meta, f, ensure_ascii=False), mode="w")
+    return {"entries": len(entries), "phrases": len(phrases), "terms": len(vocab),
+            "matrix_bytes": matrix.nbytes, "build_seconds": round(time.perf_counter() - started, 4)}
+
+
+# --- Lookups ---
+class KnowledgeIndex:
+    """Memory-mapped TF-IDF index of the corpus, loaded (and rebuilt if stale) on first use."""
+
+    def __init__(self, corpus_path=CORPUS_PATH, index_dir=INDEX_DIR, threshold=KNOWLEDGE_THRESHOLD, margin=KNOWLEDGE_MARGIN):
+        self.corpus_path = corpus_path
+        self.index_dir = index_dir
+        self.threshold = threshold
+        self.margin = margin
+        self.lock = threading.Lock()
+        self.loaded = None   # (vocab, idf, matrix, owners, entries)
+        self.stats = {"lookups": 0, "hits": 0, "misses": 0, "skipped": 0, "lookup_seconds": 0.0, "rebuilds": 0}
+
+    def _read(self):
+        import numpy as np
+        with open(os.path.join(self.index_dir, "index.json"), encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta.get("version") != INDEX_VERSION or meta.get("corpus_sha256") != _corpus_digest(self.corpus_path):
+            return None
+        matrix = np.load(os.path.join(self.index_dir, "matrix.npy"), mmap_mode="r")
+        if list(matrix.shape) != meta["shape"]:
+            return None  # Caught between two files of a concurrent rebuild
+        idf = np.load(os.path.join(self.index_dir, "idf.npy"), mmap_mode="r")
+        owners = np.load(os.path.join(self.index_dir, "owners.npy"), mmap_mode="r")
+        entries = [KnowledgeEntry(entry["id"], entry["title"], entry["kind"], entry["answer"]) for entry in meta["entries"]]
+        return meta["vocab"], idf, matrix, owners, entries
+
+    def _load(self):
+        if self.loaded is None:
+            with self.lock:
+                if self.loaded is None:
+                    try:
+                        loaded = self._read()
+                    except (OSError, ValueError):
+                        loaded = None
+                    if loaded is None:
+                        build_index(self.corpus_path, self.index_dir)
+                        self.stats["rebuilds"] += 1
+                        loaded = self._read()
+                    self.loaded = loaded
+        return self.loaded
+
+    def search(self, question: str, limit: int = 3) -> list:
+        """Best entries for `question` as `(score, KnowledgeEntry)`, highest first (no intent check)."""
+        import numpy as np
+        vocab, idf, matrix, owners, entries = self._load()
+        counts = Counter(term for term in terms(question) if term in vocab)
+        if not counts:
+            return []
+        rows = [vocab[term] for term in counts]
+        weights = np.array([(1 + math.log(count)) * idf[vocab[term]] for term, count in counts.items()], dtype=np.float32)
+        # Unknown words still count in the question's norm: a question about something else scores low
+        unknown = sum((1 + math.log(count)) * float(idf.max()) for term, count in Counter(terms(question)).items() if term not in vocab)
+        scores = weights @ matrix[rows] / math.sqrt(float(weights @ weights) + unknown ** 2)
+        best = {}
+        for column in np.argsort(-scores):
+            owner = int(owners[column])
+            if owner not in best:
+                best[owner] = float(scores[column])
+                if len(best) == limit:
+                    break
+        return [(score, entries[owner]) for owner, score in best.items()]
+
+    def lookup(self, question: str):
+        """The entry answering `question` with high confidence, as a KnowledgeMatch, or None."""
+        if not KNOWLEDGE_ENABLED or not is_lookup_question(question):
+            self.stats["skipped"] += 1
+            metrics.inc("euclidia_knowledge_total", result="skipped")
+            return None
+        started = time.perf_counter()
+        ranked = self.search(question, limit=2)
+        elapsed = time.perf_counter() - started
+        self.stats["lookups"] += 1
+        self.stats["lookup_seconds"] += elapsed
+        match = None
+        if ranked:
+            score, entry = ranked[0]
+            margin = score - (ranked[1][0] if len(ranked) > 1 else 0.0)
+            if score >= self.threshold and margin >= self.margin:
+                match = KnowledgeMatch(entry, round(score, 4), round(margin, 4))
+        self.stats["hits" if match else "misses"] += 1
+        metrics.inc("euclidia_knowledge_total", result="hit" if match else "miss")
+        return match
+
+    def get_stats(self) -> dict:
+        lookups = self.stats["lookups"]
+        return {
+            "entries": len(self.loaded[4]) if self.loaded else 0,
+            "lookups": lookups,
+            "hits": self.stats["hits"],
+            "misses": self.stats["misses"],
+            "skipped": self.stats["skipped"],
+            "rebuilds": self.stats["rebuilds"],
+            "hit_rate": round(self.stats["hits"] / lookups, 4) if lookups else 0.0,
+            "mean_lookup_ms": round(self.stats["lookup_seconds"] / lookups * 1000, 4) if lookups else 0.0,
+        }
+
+
+knowledge_index = KnowledgeIndex()
+
+metrics.metrics.register_collector(lambda: {f"euclidia_knowledge_{key}": value for key, value in knowledge_index.get_stats().items()})
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Rebuilds the knowledge index from the corpus.")
+    parser.add_argument("--corpus", default=CORPUS_PATH)
+    parser.add_argument("--index", default=INDEX_DIR)
+    args = parser.parse_args()
+    stats = build_index(args.corpus, args.index)
+    print(f"✅ {stats['entries']} entries, {stats['phrases']} phrases, {stats['terms']} terms "
+          f"({stats['matrix_bytes'] / 1024:.1f} KB) built in {stats['build_seconds'] * 1000:.1f} ms → {args.index}")
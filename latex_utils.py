@@ -0,0 +1,276 @@
+"""LaTeX post-processing helpers shared by the tools and the agent.
+
+`normalize_latex` is a local, rule-based pass that rewrites delimiters to the $ / $$
+convention used by Streamlit and checks that every math span is balanced. It knows
+about code blocks, escaped dollars and nested environments, and runs in milliseconds,
+so the LLM cleanup is only needed when it reports problems it cannot fix.
+"""
+import re
+from dataclasses import dataclass, field
+
+# --- Delimiters rewritten to the $ / $$ convention used by Streamlit ---
+DELIMITERS = {
+    "\\(": "$",
+    "\\)": "$",
+    "\\[": "$$",
+    "\\]": "$$",
+}
+CLOSERS = {"\\(": "\\)", "\\[": "\\]", "$": "$", "$$": "$$"}
+
+# Environments that KaTeX only renders inside display math
+DISPLAY_ENVS = {
+    "align", "align*", "aligned", "equation", "equation*", "gather", "gather*",
+    "gathered", "multline", "multline*", "eqnarray", "eqnarray*", "split",
+    "cases", "matrix", "pmatrix", "bmatrix", "vmatrix", "Vmatrix", "array",
+}
+
+TOKEN_RE = re.compile(
+    r"""
+    (?P<fence>^[ \t]*```[^\n]*\n.*?(?:^[ \t]*```[ \t]*$|\Z))
+    |(?P<code>(?P<ticks>`+)(?:(?!\n[ \t]*\n).)+?(?P=ticks))
+    |(?P<begin>\\begin\{(?P<bname>[A-Za-z]+\*?)\})
+    |(?P<end>\\end\{(?P<ename>[A-Za-z]+\*?)\})
+    |(?P<delim>\$\$|\$|\\\(|\\\)|\\\[|\\\])
+    |(?P<escape>\\.)
+    |(?P<brace>[{}])
+    |(?P<para>\n[ \t]*\n)
+    """,
+    re.MULTILINE | re.DOTALL | re.VERBOSE,
+)
+
+
+@dataclass
+class LatexCheck:
+    """Result of a local normalization pass."""
+    text: str
+    issues: list = field(default_factory=list)
+
+    @property
+    def balanced(self) -> bool:
+        return not self.issues
+
+
+def tokenize(text: str):
+    """Yields `(kind, value, start)` tokens; plain text between tokens has kind 'text'."""
+    pos = 0
+    for match in TOKEN_RE.finditer(text):
+        if match.start() > pos:
+            yield "text", text[pos:match.start()], pos
+        kind = match.lastgroup
+        if kind in ("bname", "ename", "ticks"):
+            kind = {"bname": "begin", "ename": "end", "ticks": "code"}[kind]
+        value = match.group(0)
+        if kind in ("begin", "end"):
+            value = (value, match.group("bname") or match.group("ename"))
+        yield kind, value, match.start()
+        pos = match.end()
+    if pos < len(text):
+        yield "text", text[pos:], pos
+
+
+class _Rollback(Exception):
+    """Raised when an inline `$` turns out to be a literal dollar sign."""
+
+    def __init__(self, position):
+        self.position = position
+
+
+def _scan(text: str, literal: set, final: bool):
+    """One normalization pass.
+
+    Returns `(output, issues, safe_cut)` where `safe_cut` is the largest source offset
+    at which no math span, environment or code block is open.
+    """
+    out = []
+    issues = []
+    math = None          # Open delimiter, or "env" for a bare display environment
+    opener = None        # Source offset of the open delimiter
+    env_stack = []
+    depth = 0
+    safe_cut = 0
+
+    def close_math(closer):
+        nonlocal math, depth
+        if env_stack:
+            issues.append(f"unclosed environment '{env_stack[-1]}' at offset {opener}")
+            env_stack.clear()
+        if depth != 0:
+            issues.append(f"unbalanced braces in math starting at offset {opener}")
+        out.append(closer)
+        math = None
+        depth = 0
+
+    for kind, value, start in tokenize(text):
+        if kind == "fence":
+            out.append(value)
+            if not final and not re.search(r"^[ \t]*```[ \t]*$", value.rstrip("\n").split("\n")[-1]):
+                break  # The code block is still being streamed
+        elif kind == "para":
+            if math == "$":
+                raise _Rollback(opener)
+            if math == "\\(":
+                issues.append(f"inline math opened at offset {opener} runs across a blank line")
+            out.append(value)
+        elif kind == "delim":
+            if math is None:
+                if value == "$":
+                    following = text[start + 1:start + 2]
+                    if start in literal or (following and following.isspace()):
+                        out.append("\\$")  # Currency or stray dollar sign, not math
+                    elif not following and not final:
+                        break  # Cannot tell yet whether this opens math
+                    else:
+                        math, opener = value, start
+                        out.append("$")
+                elif value in ("\\(", "\\[", "$$"):
+                    math, opener = value, start
+                    out.append(DELIMITERS.get(value, value))
+                else:
+                    issues.append(f"stray closing delimiter '{value}' at offset {start}")
+                    out.append(value)
+            elif math == "$" and value == "$" and not final and start + 1 >= len(text):
+                break  # Whether this closes the span depends on the next character
+            elif math == "$" and value == "$" and (text[start - 1].isspace() or text[start + 1:start + 2].isdigit()):
+                raise _Rollback(opener)  # Not a valid closer ("$5 and $10"): the opener was a dollar sign
+            elif math != "env" and value == CLOSERS[math]:
+                close_math(DELIMITERS.get(value, value))
+            else:
+                issues.append(f"unexpected delimiter '{value}' inside math at offset {start}")
+                out.append(value)
+        elif kind == "begin":
+            raw, name = value
+            if math is None:
+                if name in DISPLAY_ENVS:
+                    math, opener = "env", start
+                    env_stack.append(name)
+                    out.append("$$\n" + raw)
+                else:
+                    out.append(raw)  # Text-level environment, left to Markdown
+            else:
+                env_stack.append(name)
+                out.append(raw)
+        elif kind == "end":
+            raw, name = value
+            if math is None:
+                if name in DISPLAY_ENVS:
+                    issues.append(f"stray '\\end{{{name}}}' at offset {start}")
+                out.append(raw)
+            elif env_stack and env_stack[-1] == name:
+                env_stack.pop()
+                out.append(raw)
+                if math == "env" and not env_stack:
+                    close_math("\n$$")
+            else:
+                issues.append(f"mismatched '\\end{{{name}}}' at offset {start}")
+                out.append(raw)
+        elif kind == "brace":
+            if math is not None:
+                depth += 1 if value == "{" else -1
+                if depth < 0:
+                    issues.append(f"unmatched '}}' at offset {start}")
+                    depth = 0
+            out.append(value)
+        else:
+            # An unmatched backtick may still become inline code once its closing run arrives
+            if not final and "`" in value and not re.search(r"\n[ \t]*\n", text[start:]):
+                break
+            out.append(value)
+
+        if math is None:
+            safe_cut = start + len(value if isinstance(value, str) else value[0])
+
+    if final and math == "$":
+        raise _Rollback(opener)
+    if final and math is not None:
+        issues.append(f"unclosed math opened at offset {opener}")
+    return "".join(out), issues, safe_cut
+
+
+def _scan_with_rollback(text: str, final: bool):
+    literal = set()
+    while True:
+        try:
+            return _scan(text, literal, final)
+        except _Rollback as rollback:
+            literal.add(rollback.position)
+
+
+def normalize_latex(text: str) -> LatexCheck:
+    """Rewrites delimiters to $ / $$ and validates them, without any LLM call."""
+    output, issues, _ = _scan_with_rollback(text, final=True)
+    return LatexCheck(text=output, issues=issues)
+
+
+def split_blocks(text: str) -> list:
+    """Splits `text` after blank lines that are outside math spans, environments and code blocks.
+
+    Joining the blocks gives back `text` exactly, so they can be processed separately.
+    """
+    blocks = []
+    start = 0
+    math = None
+    env_depth = 0
+    for kind, value, pos in tokenize(text):
+        if kind == "delim":
+            if math is None:
+                if value in ("$", "$$", "\\(", "\\["):
+                    math = value
+            elif value == CLOSERS[math]:
+                math = None
+        elif kind == "begin":
+            env_depth += 1
+        elif kind == "end":
+            env_depth = max(0, env_depth - 1)
+        elif kind == "para":
+            if math in ("$", "\\("):
+                math = None  # Inline math never spans paragraphs (a dollar sign, or a broken span)
+            if math is None and env_depth == 0:
+                end = pos + len(value)
+                blocks.append(text[start:end])
+                start = end
+    if start < len(text):
+        blocks.append(text[start:])
+    return blocks
+
+
+def convert_delimiters(text: str) -> str:
+    """Rewrites \\( \\) and \\[ \\] into $ and $$ (a LaTeX line break `\\\\(` is left untouched)."""
+    return normalize_latex(text).text
+
+
+class StreamingLatexFormatter:
+    """Incrementally normalizes streamed chunks with `normalize_latex`.
+
+    Text is only released once it is safe: trailing partial tokens (a lone backslash,
+    a `$` that may become `$$`, an unfinished `\\begin{`) are held back, and so is any
+    open math span, environment or code block until it is closed, so the UI never
+    renders half a formula.
+    """
+
+    def __init__(self):
+        self.buffer = ""
+
+    def _safe_cut(self) -> int:
+        """Returns the length of the prefix of the buffer that can be released."""
+        text = self.buffer
+        # Drop trailing characters that may be the start of a longer token
+        stable = len(text)
+        partial = re.search(r"(\\+[A-Za-z]*(?:\{[A-Za-z]*\*?)?|`+|(?m:^[ \t]*```[^\n]*)|[ \t]*\n[ \t]*)\Z", text)
+        if partial:
+            stable = partial.start()
+        _, _, cut = _scan_with_rollback(text[:stable], final=False)
+        return cut
+
+    def feed(self, chunk: str) -> str:
+        """Adds a chunk and returns the formatted text that is ready to display."""
+        self.buffer += chunk
+        cut = self._safe_cut()
+        if not cut:
+            return ""
+        ready, self.buffer = self.buffer[:cut], self.buffer[cut:]
+        return normalize_latex(ready).text
+
+    def flush(self) -> str:
+        """Returns whatever is left once the stream is over."""
+        rest, self.buffer = self.buffer, ""
+        return normalize_latex(rest).text
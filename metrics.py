@@ -0,0 +1,342 @@
+"""Lightweight tracing and metrics for the pipeline.
+
+Each `prompt_ai` call is a trace made of spans (route_llm, tool, latex_cleanup...).
+Span durations feed latency histograms, provider token usage feeds counters, and
+finished traces can be appended to a JSONL log. `render_prometheus()` exports
+everything in the Prometheus text format: api.py serves it at /metrics, the
+Streamlit app and scripts can start `serve()` on a side port.
+State is in memory behind a lock and the log is written by a background thread,
+so it can stay on in production.
+"""
+import bisect
+import contextvars
+import json
+import os
+import queue
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+METRICS_ENABLED = os.getenv("EUCLIDIA_METRICS", "1") != "0"
+METRICS_LOG = os.getenv("EUCLIDIA_METRICS_LOG", "")  # JSONL file of finished traces, empty disables
+METRICS_PORT = int(os.getenv("EUCLIDIA_METRICS_PORT", "0"))  # Standalone /metrics server, 0 disables
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300)
+
+DESCRIPTIONS = {
+    "euclidia_request_seconds": "End-to-end latency of a pipeline call.",
+    "euclidia_stage_seconds": "Latency of each pipeline stage.",
+    "euclidia_first_token_seconds": "Time to the first streamed token, per provider.",
+    "euclidia_tokens_total": "Tokens reported by the providers.",
+    "euclidia_requests_total": "Pipeline calls by route and cache result.",
+    "euclidia_latex_cleanup_total": "LaTeX cleanup outcomes (local pass or Gemini fallback).",
+    "euclidia_retries_total": "Provider calls retried after a transient error.",
+    "euclidia_fallbacks_total": "Degraded answers (another model or the local router stood in).",
+    "euclidia_breaker_transitions_total": "Circuit breaker state changes.",
+    "euclidia_breaker_state": "Circuit breaker state (0 closed, 1 half-open, 2 open).",
+    "euclidia_queue_wait_seconds": "Time provider calls waited in the scheduler queue.",
+    "euclidia_compute_total": "Questions handled by the SymPy engine, by kind and outcome.",
+    "euclidia_batch_seconds": "Wall time of a problem set answered in batch mode.",
+    "euclidia_batch_questions_total": "Questions answered in batch mode.",
+    "euclidia_knowledge_total": "Knowledge index lookups, by outcome (hit, miss, skipped).",
+}
+
+
+class Histogram:
+    """Cumulative-bucket histogram (Prometheus semantics)."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> float:
+        """Upper bound of the bucket holding the q-quantile (inf above the last bucket)."""
+        if not self.count:
+            return 0.0
+        rank, seen = q * self.count, 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return self.buckets[index] if index < len(self.buckets) else float("inf")
+        return float("inf")
+
+
+def _label_text(labels) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{str(value).replace(chr(34), "")}"' for key, value in labels) + "}"
+
+
+class Metrics:
+    """Process-wide counters and histograms, keyed by name and labels."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.gauges = {}
+        self.histograms = {}
+        self.collectors = []
+
+    def inc(self, name: str, value: float = 1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def set_gauge(self, name: str, value: float, **labels):
+        with self.lock:
+            self.gauges[(name, tuple(sorted(labels.items())))] = value
+
+    def observe(self, name: str, value: float, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            if key not in self.histograms:
+                self.histograms[key] = Histogram()
+            self.histograms[key].observe(value)
+
+    def register_collector(self, collector):
+        """`collector()` returns `{name: value}` gauges read at export time (e.g. cache stats)."""
+        self.collectors.append(collector)
+
+    def summary(self, name: str = "euclidia_stage_seconds") -> dict:
+        """Count, mean, p50 and p95 per label set of a histogram."""
+        with self.lock:
+            items = [(labels, hist) for (hist_name, labels), hist in self.histograms.items() if hist_name == name]
+            return {
+                ",".join(f"{key}={value}" for key, value in labels): {
+                    "count": hist.count,
+                    "mean": hist.sum / hist.count if hist.count else 0.0,
+                    "p50": hist.quantile(0.5),
+                    "p95": hist.quantile(0.95),
+                }
+                for labels, hist in items
+            }
+
+    def render_prometheus(self) -> str:
+        lines, typed = [], set()
+
+        def header(name, kind):
+            if name not in typed:
+                typed.add(name)
+                if name in DESCRIPTIONS:
+                    lines.append(f"# HELP {name} {DESCRIPTIONS[name]}")
+                lines.append(f"# TYPE {name} {kind}")
+
+        with self.lock:
+            for (name, labels), value in sorted(self.counters.items()):
+                header(name, "counter")
+                lines.append(f"{name}{_label_text(labels)} {value}")
+            for (name, labels), value in sorted(self.gauges.items()):
+                header(name, "gauge")
+                lines.append(f"{name}{_label_text(labels)} {value}")
+            for (name, labels), hist in sorted(self.histograms.items(), key=lambda item: item[0]):
+                header(name, "histogram")
+                cumulative = 0
+                for bound, count in zip(list(hist.buckets) + ["+Inf"], hist.counts):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{_label_text(labels + (('le', bound),))} {cumulative}")
+                lines.append(f"{name}_sum{_label_text(labels)} {hist.sum}")
+                lines.append(f"{name}_count{_label_text(labels)} {hist.count}")
+
+        for collector in self.collectors:
+            try:
+                gauges = collector()
+            except Exception as e:
+                print(f"⚠️ Metrics collector failed: {e}")
+                continue
+            for name, value in gauges.items():
+                header(name, "gauge")
+                lines.append(f"{name} {value}")
+        return "\n".join(lines) + "\n"
+
+    def reset(self):
+        with self.lock:
+            self.counters.clear()
+            self.gauges.clear()
+            self.histograms.clear()
+
+
+metrics = Metrics()
+
+
+# --- Helpers used by the pipeline ---
+def inc(name: str, value: float = 1, **labels):
+    metrics.inc(name, value, **labels)
+
+def observe(name: str, value: float, **labels):
+    metrics.observe(name, value, **labels)
+
+def set_gauge(name: str, value: float, **labels):
+    metrics.set_gauge(name, value, **labels)
+
+
+# --- Traces and spans ---
+@dataclass
+class Trace:
+    """One pipeline call: its spans and attributes, written to the JSONL log when it ends."""
+    name: str
+    trace_id: str = field(default_factory=lambda: uuid.uuid4().hex[:16])
+    started_at: float = field(default_factory=time.time)
+    perf_start: float = field(default_factory=time.perf_counter, repr=False)
+    duration: float = 0.0
+    spans: list = field(default_factory=list)
+    attrs: dict = field(default_factory=dict)
+
+    def stages(self) -> dict:
+        """Seconds spent per stage (spans of the same stage are added up, cancelled ones skipped)."""
+        totals = {}
+        for item in self.spans:
+            if item.get("error") == "CancelledError":
+                continue
+            totals[item["stage"]] = round(totals.get(item["stage"], 0.0) + item["seconds"], 4)
+        return totals
+
+    def summary(self) -> dict:
+        return {"trace_id": self.trace_id, "stages": self.stages()}
+
+    def as_dict(self) -> dict:
+        return {
+            "trace_id": self.trace_id,
+            "name": self.name,
+            "started_at": self.started_at,
+            "seconds": round(self.duration, 4),
+            "spans": self.spans,
+            **self.attrs,
+        }
+
+
+_trace = contextvars.ContextVar("euclidia_trace", default=None)
+
+
+def current_trace():
+    return _trace.get()
+
+
+@contextmanager
+def trace(name: str, **attrs):
+    """Starts a trace for the code inside the `with` block (yields None when metrics are off)."""
+    if not METRICS_ENABLED:
+        yield None
+        return
+    current = Trace(name, attrs=dict(attrs))
+    token = _trace.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.attrs["error"] = type(e).__name__
+        raise
+    finally:
+        _trace.reset(token)
+        current.duration = time.perf_counter() - current.perf_start
+        metrics.observe("euclidia_request_seconds", current.duration, entry=name)
+        if METRICS_LOG:
+            _log_writer.write(current.as_dict())
+
+
+@contextmanager
+def span(stage: str, **attrs):
+    """Times a stage; yields a dict the caller can add attributes to (tokens, outcome...)."""
+    if not METRICS_ENABLED:
+        yield dict(attrs)
+        return
+    current = _trace.get()
+    record = {"stage": stage, **attrs}
+    started = time.perf_counter()
+    try:
+        yield record
+    except BaseException as e:
+        record["error"] = type(e).__name__  # CancelledError for discarded speculative calls
+        raise
+    finally:
+        record["seconds"] = round(time.perf_counter() - started, 4)
+        metrics.observe("euclidia_stage_seconds", record["seconds"], stage=stage)
+        if current is not None:
+            record["offset"] = round(started - current.perf_start, 4)
+            current.spans.append(record)
+
+
+def record_tokens(record: dict, provider: str, message):
+    """Adds the provider-reported token usage of `message` to a span and the token counters."""
+    usage = getattr(message, "usage_metadata", None)
+    if not usage:
+        return
+    for kind in ("input_tokens", "output_tokens"):
+        value = usage.get(kind) or 0
+        if value:
+            record[kind] = record.get(kind, 0) + value
+            metrics.inc("euclidia_tokens_total", value, provider=provider, kind=kind.split("_")[0])
+
+
+# --- Export ---
+class _LogWriter:
+    """Appends JSON lines from a background thread, so callers never wait on disk."""
+
+    def __init__(self):
+        self.lines = queue.Queue()
+        self.thread = None
+        self.lock = threading.Lock()
+
+    def write(self, record: dict):
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, name="euclidia-metrics", daemon=True)
+                self.thread.start()
+        self.lines.put(json.dumps(record, ensure_ascii=False, default=str))
+
+    def _run(self):
+        while True:
+            line = self.lines.get()
+            try:
+                with open(METRICS_LOG, "a", encoding="utf-8") as f:
+                    f.write(line + "\n")
+                    # Drain whatever queued up meanwhile in the same open
+                    while not self.lines.empty():
+                        f.write(self.lines.get_nowait() + "\n")
+                        self.lines.task_done()
+            except OSError as e:
+                print(f"⚠️ Metrics log write failed: {e}")
+            finally:
+                self.lines.task_done()
+
+    def flush(self):
+        """Blocks until every queued trace has been written."""
+        if self.thread is not None:
+            self.lines.join()
+
+
+_log_writer = _LogWriter()
+
+
+def flush():
+    _log_writer.flush()
+
+
+def serve(port: int = METRICS_PORT, host: str = "0.0.0.0"):
+    """Serves `GET /metrics` from a daemon thread; returns the server."""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = metrics.render_prometheus().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, name="euclidia-metrics-http", daemon=True).start()
+    return server
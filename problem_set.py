@@ -0,0 +1,83 @@
+"""Splitting a pasted problem set into individual questions.
+
+Numbered or bulleted items ("1.", "2)", "- ", "Exercise 3:") start a new question
+and the unnumbered lines below them are kept with it, so a system of equations
+stays one question. Lettered items ("a.", "(b)") under a numbered item are
+sub-questions: each one is asked with its parent's text (the shared premise), and
+text before the first item is a premise shared by every question. Without
+markers, only blank lines separate the questions. Questions that normalize to the
+same text (see `answer_cache.normalize_question`) are only kept once.
+"""
+import os
+import re
+from answer_cache import normalize_question
+
+MAX_BATCH_QUESTIONS = int(os.getenv("EUCLIDIA_BATCH_MAX_QUESTIONS", "50"))
+MIN_QUESTION_CHARS = 3
+
+NUMBERED_RE = re.compile(
+    r"^\s*(?:\(?\d{1,3}[.)]|[-*•]|(?:exercise|problem|question|q)\s*\d{1,3}\s*[:.)-]?)\s+",
+    re.IGNORECASE,
+)
+LETTERED_RE = re.compile(r"^\s*\(?[a-hA-H][.)]\s+")
+
+
+def _by_markers(lines):
+    """Questions of a list with item markers: `[premise..., parent, sub-item]` joined by newlines."""
+    premise, items = [], []   # items: [text, sub-items, lettered]
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        numbered, lettered = NUMBERED_RE.match(line), LETTERED_RE.match(line)
+        if numbered:
+            items.append([line[numbered.end():], [], False])
+        elif lettered and items and not items[-1][2]:
+            items[-1][1].append(line[lettered.end():])
+        elif lettered:
+            items.append([line[lettered.end():], [], True])   # Lettered items without a numbered parent
+        elif items and items[-1][1]:
+            items[-1][1][-1] += "\n" + line
+        elif items:
+            items[-1][0] += "\n" + line
+        else:
+            premise.append(line)
+    questions = []
+    for text, subitems, _ in items:
+        for subitem in subitems or [None]:
+            questions.append("\n".join(premise + [text] + ([subitem] if subitem else [])))
+    return questions
+
+
+def split_questions(text: str) -> list:
+    """The questions of a problem set, in order (markers stripped, duplicates kept)."""
+    text = (text or "").strip()
+    if not text:
+        return []
+    lines = text.splitlines()
+    if sum(1 for line in lines if NUMBERED_RE.match(line) or LETTERED_RE.match(line)) >= 2:
+        items = _by_markers(lines)
+    else:
+        items = re.split(r"\n\s*\n", text)
+    return [item.strip() for item in items if len(item.strip()) >= MIN_QUESTION_CHARS]
+
+
+def dedupe(questions) -> tuple:
+    """Returns `(unique, duplicates)`: first occurrences in order, and how many were dropped."""
+    seen = set()
+    unique = []
+    for question in questions:
+        key = normalize_question(question)
+        if key in seen:
+            continue
+        seen.add(key)
+        unique.append(question)
+    return unique, len(questions) - len(unique)
+
+
+def parse_problem_set(text: str) -> tuple:
+    """`(questions, duplicates)` of a pasted problem set; raises ValueError when there are too many."""
+    questions, duplicates = dedupe(split_questions(text))
+    if len(questions) > MAX_BATCH_QUESTIONS:
+        raise ValueError(f"Problem sets are limited to {MAX_BATCH_QUESTIONS} questions ({len(questions)} found).")
+    return questions, duplicates
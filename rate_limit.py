@@ -0,0 +1,59 @@
+"""Thread-safe rate limiting primitives."""
+import threading
+import time
+from contextlib import contextmanager
+
+
+class TokenBucket:
+    """Token bucket: `rate` tokens per second, bursts of up to `capacity` tokens."""
+
+    def __init__(self, rate: float, capacity: float = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_acquire(self, tokens: float = 1.0) -> float:
+        """Takes `tokens` if available and returns 0, otherwise returns the seconds to wait."""
+        with self.lock:
+            self._refill()
+            if self.tokens >= tokens:
+                self.tokens -= tokens
+                return 0.0
+            return (tokens - self.tokens) / self.rate
+
+    def charge(self, tokens: float):
+        """Adjusts the bucket after the fact (the balance may go negative, delaying the next takers)."""
+        with self.lock:
+            self._refill()
+            self.tokens = min(self.capacity, self.tokens - tokens)
+
+    def acquire(self, tokens: float = 1.0):
+        """Blocks until `tokens` are available (requests larger than the capacity wait for a full bucket)."""
+        tokens = min(tokens, self.capacity)
+        while True:
+            wait = self.try_acquire(tokens)
+            if wait <= 0:
+                return
+            time.sleep(wait)
+
+
+class ProviderLimiter:
+    """Caps in-flight calls to one provider and paces them with a token bucket."""
+
+    def __init__(self, name: str, max_concurrency: int, rate: float, burst: float = None):
+        self.name = name
+        self.semaphore = threading.BoundedSemaphore(max_concurrency)
+        self.bucket = TokenBucket(rate, burst)
+
+    @contextmanager
+    def slot(self):
+        with self.semaphore:
+            self.bucket.acquire()
+            yield
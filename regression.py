@@ -0,0 +1,194 @@
+"""Regression corpus of the test suite: versioned questions, shards, cached judgments, trends.
+
+test_questions.jsonl starts with a header line (`{"corpus": ..., "version": N}`)
+followed by one question per line (`{"id", "category", "question", "since"}`).
+Ids are stable: a question whose text changes gets a new id and the version is
+bumped, so runs on the same version are comparable item by item.
+
+Questions are assigned to shards by a hash of their id, which keeps every
+question in the same shard when the corpus grows. Judgments are cached in SQLite
+by (question, answer hash, judge): an answer that did not change since the last
+run is not judged again. Each run appends one row per category to the trends CSV.
+"""
+import csv
+import hashlib
+import json
+import os
+import sqlite3
+import statistics
+import threading
+import time
+from dataclasses import dataclass
+
+CORPUS_PATH = os.getenv("EUCLIDIA_TEST_CORPUS", "test_questions.jsonl")
+JUDGMENTS_PATH = os.getenv("EUCLIDIA_JUDGMENTS_PATH", ".euclidia_judgments.sqlite")
+TRENDS_PATH = os.getenv("EUCLIDIA_TEST_TRENDS", "euclidia_test_trends.csv")
+TREND_FIELDS = ["date", "corpus_version", "category", "questions", "mean_score", "min_score",
+                "mean_latency_s", "p95_latency_s", "judged", "judgments_cached"]
+
+
+@dataclass
+class RegressionItem:
+    id: str
+    category: str
+    question: str
+    since: int = 1   # Corpus version that introduced the question
+
+
+@dataclass
+class RegressionCorpus:
+    version: int
+    digest: str      # Hash of the file, to tell two edits of the same version apart
+    items: list
+
+
+def load_corpus(path: str = CORPUS_PATH) -> RegressionCorpus:
+    with open(path, "rb") as f:
+        raw = f.read()
+    lines = [json.loads(line) for line in raw.decode("utf-8").splitlines() if line.strip()]
+    if not lines or "version" not in lines[0]:
+        raise ValueError(f"{path}: the first line must be the corpus header with its version")
+    items = [RegressionItem(row["id"], row["category"], row["question"], row.get("since", 1)) for row in lines[1:]]
+    ids = [item.id for item in items]
+    if len(set(ids)) != len(ids):
+        raise ValueError(f"{path}: duplicate question ids")
+    return RegressionCorpus(lines[0]["version"], hashlib.sha256(raw).hexdigest()[:12], items)
+
+
+def shard_of(item_id: str, shards: int) -> int:
+    return int(hashlib.sha1(item_id.encode("utf-8")).hexdigest()[:8], 16) % shards
+
+
+def select(items, shard: int = 0, shards: int = 1, categories=None, limit: int = None) -> list:
+    """Items of one shard (0-based), optionally restricted to some categories and to `limit` per category."""
+    selected, per_category = [], {}
+    for item in items:
+        if categories and item.category not in categories:
+            continue
+        if shard_of(item.id, shards) != shard:
+            continue
+        if limit is not None and per_category.get(item.category, 0) >= limit:
+            continue
+        per_category[item.category] = per_category.get(item.category, 0) + 1
+        selected.append(item)
+    return selected
+
+
+def parse_shard(text: str) -> tuple:
+    """"2/4" -> (1, 4): the 1-based shard number on the command line, 0-based internally."""
+    number, _, total = text.partition("/")
+    number, total = int(number), int(total or 1)
+    if not 1 <= number <= total:
+        raise ValueError(f"Invalid shard '{text}' (expected i/N with 1 <= i <= N)")
+    return number - 1, total
+
+
+# --- Judgment cache ---
+def answer_digest(answer: str) -> str:
+    return hashlib.sha256(answer.encode("utf-8")).hexdigest()
+
+
+class JudgmentCache:
+    """Scores already given by the judge, keyed by question, answer hash and judge version."""
+
+    def __init__(self, path=JUDGMENTS_PATH, enabled=True):
+        self.path = path
+        self.enabled = enabled
+        self.stats = {"hits": 0, "misses": 0, "stores": 0}
+        self.lock = threading.Lock()
+        self._db = None
+
+    def _connect(self):
+        if self._db is None:
+            self._db = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+            self._db.execute("PRAGMA journal_mode=WAL")  # Shards judge from several processes
+            self._db.execute("""
+                CREATE TABLE IF NOT EXISTS judgments (
+                    question TEXT NOT NULL,
+                    answer_sha TEXT NOT NULL,
+                    judge TEXT NOT NULL,
+                    score REAL NOT NULL,
+                    comment TEXT NOT NULL,
+                    created REAL NOT NULL,
+                    PRIMARY KEY (question, answer_sha, judge)
+                )""")
+        return self._db
+
+    def get(self, question: str, answer: str, judge: str):
+        """`(score, comment)` of a previous judgment of this exact answer, or None."""
+        if not self.enabled:
+            return None
+        with self.lock:
+            row = self._connect().execute(
+                "SELECT score, comment FROM judgments WHERE question = ? AND answer_sha = ? AND judge = ?",
+                (question, answer_digest(answer), judge),
+            ).fetchone()
+            self.stats["hits" if row else "misses"] += 1
+        return tuple(row) if row else None
+
+    def put(self, question: str, answer: str, judge: str, score: float, comment: str):
+        if not self.enabled:
+            return
+        with self.lock:
+            db = self._connect()
+            db.execute("INSERT OR REPLACE INTO judgments VALUES (?, ?, ?, ?, ?, ?)",
+                       (question, answer_digest(answer), judge, score, comment, time.time()))
+            db.commit()
+            self.stats["stores"] += 1
+
+    def get_stats(self) -> dict:
+        with self.lock:
+            return dict(self.stats)
+
+
+# --- Per-category trends ---
+def p95(values) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * 0.95))] if values else 0.0
+
+
+def summarize(results) -> dict:
+    """Score and latency per category of per-question result rows (CSV columns)."""
+    categories = {}
+    for row in results:
+        categories.setdefault(row["Category"], []).append(row)
+    return {
+        category: {
+            "questions": len(rows),
+            "mean_score": round(statistics.fmean(row["Score"] for row in rows), 2),
+            "min_score": min(row["Score"] for row in rows),
+            "mean_latency_s": round(statistics.fmean(row["Latency"] for row in rows), 2),
+            "p95_latency_s": p95(row["Latency"] for row in rows),
+            "judged": sum(1 for row in rows if row.get("Judgment") in ("single", "batch")),
+            "judgments_cached": sum(1 for row in rows if row.get("Judgment") == "cached"),
+        }
+        for category, rows in sorted(categories.items())
+    }
+
+
+def previous_trends(path: str = TRENDS_PATH) -> dict:
+    """Last recorded row of each category, to compare the current run with."""
+    if not os.path.exists(path):
+        return {}
+    with open(path, newline="", encoding="utf-8") as f:
+        return {row["category"]: row for row in csv.DictReader(f)}
+
+
+def with_deltas(summary: dict, previous: dict, corpus_version: int) -> dict:
+    """Adds the score and latency change since the previous run (same corpus version only)."""
+    for category, row in summary.items():
+        before = previous.get(category)
+        if before and int(before["corpus_version"]) == corpus_version:
+            row["delta_score"] = round(row["mean_score"] - float(before["mean_score"]), 2)
+            row["delta_latency_s"] = round(row["mean_latency_s"] - float(before["mean_latency_s"]), 2)
+    return summary
+
+
+def append_trends(summary: dict, date: str, corpus_version: int, path: str = TRENDS_PATH):
+    new_file = not os.path.exists(path)
+    with open(path, "a", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=TREND_FIELDS, extrasaction="ignore")
+        if new_file:
+            writer.writeheader()
+        for category, row in summary.items():
+            writer.writerow({"date": date, "corpus_version": corpus_version, "category": category, **row})
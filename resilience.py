@@ -0,0 +1,406 @@
+"""Deadlines, retries, circuit breakers and degradation for the provider calls.
+
+Every LLM call of the pipeline goes through `call` (or `stream`):
+- its timeout is bounded by what is left of the request's deadline (`request_scope`),
+- transient errors (timeouts, connection errors, 429 and 5xx responses) are retried
+  with exponential backoff and full jitter, as long as the deadline allows it,
+- a per-provider circuit breaker opens after sustained failures or slow calls, so the
+  next requests fail fast (and degrade, see `tools.adeepseek`) instead of waiting,
+- each attempt waits for a slot of the provider's `scheduler` (fair queue, token budget).
+
+Breaker transitions are printed, counted in `euclidia_breaker_transitions_total`,
+exported as the `euclidia_breaker_state` gauge and listed by `get_states()`.
+Degradations are counted in `euclidia_fallbacks_total` and reported in the
+request's `response_metadata["fallbacks"]`.
+"""
+import asyncio
+import contextvars
+import os
+import random
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+import metrics
+import scheduler
+
+# --- Settings ---
+REQUEST_DEADLINE = float(os.getenv("EUCLIDIA_REQUEST_DEADLINE", "300"))  # Seconds for a whole question
+ROUTER_TIMEOUT = float(os.getenv("EUCLIDIA_ROUTER_TIMEOUT", "20"))
+CALL_TIMEOUTS = {
+    "gemini": float(os.getenv("EUCLIDIA_GEMINI_TIMEOUT", "60")),
+    "deepseek": float(os.getenv("EUCLIDIA_DEEPSEEK_TIMEOUT", "240")),
+}
+SLOW_CALLS = {  # A call (or a stream's first chunk) slower than this counts as a failure for the breaker
+    "gemini": float(os.getenv("EUCLIDIA_GEMINI_SLOW", "30")),
+    "deepseek": float(os.getenv("EUCLIDIA_DEEPSEEK_SLOW", "150")),
+}
+RETRY_ATTEMPTS = int(os.getenv("EUCLIDIA_RETRY_ATTEMPTS", "3"))  # Attempts per call, including the first
+RETRY_BASE_DELAY = 0.5
+RETRY_MAX_DELAY = 8.0
+BREAKER_OPEN_SECONDS = float(os.getenv("EUCLIDIA_BREAKER_OPEN_SECONDS", "30"))
+
+TRANSIENT_STATUS = {408, 409, 425, 429, 500, 502, 503, 504, 529}
+TRANSIENT_NAMES = (
+    "Timeout", "ConnectError", "ConnectionError", "RemoteProtocolError", "APIConnectionError",
+    "RateLimit", "ServiceUnavailable", "ResourceExhausted", "InternalServerError", "DeadlineExceeded",
+)
+STATE_CODES = {"closed": 0, "half_open": 1, "open": 2}
+
+
+class CircuitOpen(RuntimeError):
+    pass
+
+
+class DeadlineExceeded(TimeoutError):
+    pass
+
+
+def is_transient(error: BaseException) -> bool:
+    """True for errors worth retrying: timeouts, connection errors, rate limits and 5xx responses."""
+    if isinstance(error, (asyncio.TimeoutError, TimeoutError, ConnectionError)):
+        return True
+    response = getattr(error, "response", None)
+    for code in (getattr(error, "status_code", None), getattr(response, "status_code", None), getattr(error, "code", None)):
+        if isinstance(code, int) and code in TRANSIENT_STATUS:
+            return True
+    return any(name in type(error).__name__ for name in TRANSIENT_NAMES)
+
+
+# --- Circuit breakers ---
+class CircuitBreaker:
+    """Closed → open after sustained failures or slow calls → half-open after a cool-down.
+
+    The breaker opens after `consecutive` failures in a row, or when at least
+    `failure_rate` of the last `window` calls failed (once `min_calls` were seen).
+    Half-open lets a single probe through: it closes the breaker on success and
+    reopens it on failure.
+    """
+
+    def __init__(self, name: str, slow_call: float = None, window: int = 20, min_calls: int = 5,
+                 failure_rate: float = 0.5, consecutive: int = 5, open_seconds: float = BREAKER_OPEN_SECONDS):
+        self.name = name
+        self.slow_call = slow_call
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.consecutive = consecutive
+        self.open_seconds = open_seconds
+        self.state = "closed"
+        self.outcomes = deque(maxlen=window)  # True for a failed (or slow) call
+        self.failures_in_row = 0
+        self.opened_at = 0.0
+        self.probing = False
+        self.transitions = 0
+        self.lock = threading.Lock()
+        metrics.set_gauge("euclidia_breaker_state", 0, provider=name)
+
+    def _transition(self, state: str, reason: str = ""):
+        previous, self.state = self.state, state
+        self.transitions += 1
+        if state == "open":
+            self.opened_at = time.monotonic()
+        if state == "closed":
+            self.outcomes.clear()
+            self.failures_in_row = 0
+        print(f"⚠️ Circuit breaker '{self.name}': {previous} → {state}{f' ({reason})' if reason else ''}")
+        metrics.inc("euclidia_breaker_transitions_total", provider=self.name, state=state)
+        metrics.set_gauge("euclidia_breaker_state", STATE_CODES[state], provider=self.name)
+
+    def allow(self) -> bool:
+        """Whether a call may go out now (in half-open state, only one probe at a time)."""
+        with self.lock:
+            if self.state == "open":
+                if time.monotonic() - self.opened_at < self.open_seconds:
+                    return False
+                self._transition("half_open", "cool-down over")
+            if self.state == "half_open":
+                if self.probing:
+                    return False
+                self.probing = True
+            return True
+
+    def record(self, ok: bool, seconds: float):
+        """Records the outcome of an allowed call (`seconds`: its latency, to the first chunk for a stream)."""
+        slow = self.slow_call is not None and seconds > self.slow_call
+        failed = not ok or slow
+        with self.lock:
+            if self.state == "half_open":
+                self.probing = False
+                if failed:
+                    self._transition("open", "probe failed" if not ok else f"probe took {seconds:.0f}s")
+                else:
+                    self._transition("closed", "probe succeeded")
+                return
+            self.outcomes.append(failed)
+            self.failures_in_row = self.failures_in_row + 1 if failed else 0
+            if self.state != "closed":
+                return
+            if self.failures_in_row >= self.consecutive:
+                self._transition("open", f"{self.failures_in_row} failed or slow calls in a row")
+            elif len(self.outcomes) >= self.min_calls and sum(self.outcomes) / len(self.outcomes) >= self.failure_rate:
+                self._transition("open", f"{sum(self.outcomes)}/{len(self.outcomes)} recent calls failed or slow")
+
+    def release(self):
+        """Forgets an allowed call that was cancelled (it says nothing about the provider)."""
+        with self.lock:
+            self.probing = False
+
+    def is_open(self) -> bool:
+        """True while calls are being rejected (open and still cooling down)."""
+        with self.lock:
+            return self.state == "open" and time.monotonic() - self.opened_at < self.open_seconds
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            return {
+                "state": self.state,
+                "recent_calls": len(self.outcomes),
+                "recent_failures": sum(self.outcomes),
+                "failures_in_row": self.failures_in_row,
+                "transitions": self.transitions,
+                "retry_in_s": round(max(0.0, self.opened_at + self.open_seconds - time.monotonic()), 1) if self.state == "open" else 0.0,
+            }
+
+    def reset(self):
+        with self.lock:
+            if self.state != "closed":
+                self._transition("closed", "reset")
+            self.outcomes.clear()
+            self.failures_in_row = 0
+            self.probing = False
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(provider: str) -> CircuitBreaker:
+    with _breakers_lock:
+        if provider not in _breakers:
+            _breakers[provider] = CircuitBreaker(provider, slow_call=SLOW_CALLS.get(provider))
+        return _breakers[provider]
+
+
+def get_states() -> dict:
+    """Snapshot of every provider's breaker (for /healthz and the logs)."""
+    with _breakers_lock:
+        breakers = list(_breakers.values())
+    return {breaker.name: breaker.snapshot() for breaker in breakers}
+
+
+def reset():
+    """Closes every breaker (tests, benchmarks)."""
+    with _breakers_lock:
+        breakers = list(_breakers.values())
+    for breaker in breakers:
+        breaker.reset()
+
+
+# --- Request deadlines ---
+class RequestScope:
+    """Deadline of one question and the degradations that happened while answering it."""
+
+    def __init__(self, seconds: float):
+        self.deadline = time.monotonic() + seconds
+        self.fallbacks = []
+
+    def remaining(self) -> float:
+        return self.deadline - time.monotonic()
+
+
+_scope = contextvars.ContextVar("euclidia_request_scope", default=None)
+
+
+@contextmanager
+def request_scope(seconds: float = REQUEST_DEADLINE):
+    """Bounds every provider call made inside the block (a nested scope keeps the outer deadline)."""
+    outer = _scope.get()
+    if outer is not None:
+        yield outer
+        return
+    scope = RequestScope(seconds)
+    token = _scope.set(scope)
+    try:
+        yield scope
+    finally:
+        _scope.reset(token)
+
+
+def remaining():
+    """Seconds left before the current request's deadline (None outside a request)."""
+    scope = _scope.get()
+    return None if scope is None else scope.remaining()
+
+
+def note_fallback(stage: str, source: str, target: str, reason):
+    """Records a degradation (for example DeepSeek answered by Gemini) on the metrics and the request."""
+    metrics.inc("euclidia_fallbacks_total", stage=stage, source=source, target=target)
+    scope = _scope.get()
+    if scope is not None:
+        scope.fallbacks.append({"stage": stage, "from": source, "to": target, "reason": str(reason)[:200]})
+
+
+def degraded() -> bool:
+    """Whether another model stood in for a tool during the current request (its answer is not cached)."""
+    scope = _scope.get()
+    return scope is not None and any(fallback["stage"] == "tool" and fallback["to"] == "gemini" for fallback in scope.fallbacks)
+
+
+def _budget(provider: str, timeout: float) -> float:
+    left = remaining()
+    if left is not None and left <= 0:
+        raise DeadlineExceeded(f"request deadline exceeded before calling {provider}")
+    return timeout if left is None else min(timeout, left)
+
+
+def _backoff(attempt: int) -> float:
+    """Full jitter: a random wait up to base * 2^(attempt-1), capped."""
+    return random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** (attempt - 1)))
+
+
+def _should_retry(error: BaseException, attempt: int, delay: float) -> bool:
+    if attempt >= RETRY_ATTEMPTS or not is_transient(error):
+        return False
+    left = remaining()
+    return left is None or left > delay + 1  # Leave the next attempt at least a second
+
+
+# --- Resilient calls ---
+def _used_tokens(message):
+    usage = getattr(message, "usage_metadata", None)
+    return (usage.get("input_tokens") or 0) + (usage.get("output_tokens") or 0) if usage else 0
+
+
+def _record_error(breaker: CircuitBreaker, error: BaseException, seconds: float):
+    """Only transient errors say the provider is unhealthy; a 4xx (bad request, auth) is our problem."""
+    if is_transient(error):
+        breaker.record(False, seconds)
+    else:
+        breaker.release()
+
+
+async def _admit(provider: str, breaker: CircuitBreaker, timeout: float, tokens: int, priority: int):
+    """Waits for the breaker and a scheduler slot; returns `(queue, reserved, budget)`.
+
+    The queue wait is bounded by the request deadline but not by the call timeout,
+    and does not count against the breaker.
+    """
+    if not breaker.allow():
+        raise CircuitOpen(f"{provider} is unavailable (circuit breaker open)")
+    queue = scheduler.get_scheduler(provider)
+    left = remaining()
+    try:
+        reserved = await asyncio.wait_for(queue.acquire(scheduler.reserve_tokens(provider, tokens), priority), left)
+    except asyncio.TimeoutError:
+        breaker.release()
+        raise DeadlineExceeded(f"request deadline exceeded while waiting for {provider}")
+    except BaseException:
+        breaker.release()
+        raise
+    try:
+        budget = _budget(provider, timeout)
+    except DeadlineExceeded:
+        queue.release(reserved)
+        breaker.release()
+        raise
+    return queue, reserved, budget
+
+
+async def call(provider: str, make_call, timeout: float = None, record: dict = None,
+               tokens: int = 0, priority: int = scheduler.EXPLAIN):
+    """Awaits `make_call()` (a coroutine factory) with a deadline, retries and the provider's breaker.
+
+    Each attempt waits for a slot of the provider's scheduler (`tokens` is the
+    estimated input). Raises CircuitOpen when the breaker rejects the call,
+    SchedulerBusy when the queue is full, DeadlineExceeded on a timeout, or the
+    provider's last error. Retries are added to the span `record` if given.
+    """
+    breaker = get_breaker(provider)
+    timeout = timeout or CALL_TIMEOUTS.get(provider, 60.0)
+    attempt = 0
+    while True:
+        attempt += 1
+        queue, reserved, budget = await _admit(provider, breaker, timeout, tokens, priority)
+        started = time.monotonic()
+        used = None
+        try:
+            result = await asyncio.wait_for(make_call(), budget)
+            used = _used_tokens(result) or None
+        except asyncio.CancelledError:
+            breaker.release()
+            raise
+        except Exception as e:
+            error = DeadlineExceeded(f"{provider} did not answer within {budget:.1f}s") if isinstance(e, asyncio.TimeoutError) else e
+            _record_error(breaker, error, time.monotonic() - started)
+            delay = _backoff(attempt)
+            if not _should_retry(error, attempt, delay):
+                raise error from e
+        else:
+            breaker.record(True, time.monotonic() - started)
+            return result
+        finally:
+            queue.release(reserved, used)
+
+        # The slot is given back while waiting to retry
+        metrics.inc("euclidia_retries_total", provider=provider)
+        if record is not None:
+            record["retries"] = record.get("retries", 0) + 1
+        await asyncio.sleep(delay)
+
+
+async def stream(provider: str, make_stream, timeout: float = None, record: dict = None,
+                 tokens: int = 0, priority: int = scheduler.EXPLAIN):
+    """Streaming counterpart of `call` (async generator).
+
+    Only the wait for the first chunk is retried: once chunks were yielded, an error
+    is raised to the consumer rather than repeating the beginning of the answer.
+    The whole stream must end within the call timeout (and the request deadline),
+    and holds its scheduler slot until then.
+    """
+    breaker = get_breaker(provider)
+    timeout = timeout or CALL_TIMEOUTS.get(provider, 60.0)
+    attempt = 0
+    while True:
+        attempt += 1
+        queue, reserved, budget = await _admit(provider, breaker, timeout, tokens, priority)
+        started = time.monotonic()
+        agen = make_stream()
+        yielded = False
+        first_chunk = None  # Seconds to the first chunk: a long answer is not a slow provider
+        used = 0
+        try:
+            while True:
+                left = budget - (time.monotonic() - started)
+                if left <= 0:
+                    raise asyncio.TimeoutError()
+                try:
+                    chunk = await asyncio.wait_for(agen.__anext__(), left)
+                except StopAsyncIteration:
+                    break
+                used += _used_tokens(chunk)
+                if first_chunk is None:
+                    first_chunk = time.monotonic() - started
+                yielded = True
+                yield chunk
+        except (asyncio.CancelledError, GeneratorExit):
+            breaker.release()
+            raise
+        except Exception as e:
+            error = DeadlineExceeded(f"{provider} did not finish within {budget:.1f}s") if isinstance(e, asyncio.TimeoutError) else e
+            _record_error(breaker, error, first_chunk if first_chunk is not None else time.monotonic() - started)
+            delay = _backoff(attempt)
+            if yielded or not _should_retry(error, attempt, delay):
+                raise error from e
+        else:
+            breaker.record(True, first_chunk if first_chunk is not None else time.monotonic() - started)
+            return
+        finally:
+            try:
+                await agen.aclose()
+            finally:
+                queue.release(reserved, used or None)
+
+        metrics.inc("euclidia_retries_total", provider=provider)
+        if record is not None:
+            record["retries"] = record.get("retries", 0) + 1
+        await asyncio.sleep(delay)
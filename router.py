@@ -0,0 +1,195 @@
+"""Local fast-path router.
+
+Decides between `use_gemini` and `use_deepseek` without an LLM call when the
+question is unambiguous. Keyword rules are combined with a small multinomial
+Naive Bayes model trained on the labeled questions below; `prompt_ai` only asks
+the Gemini agent when the resulting confidence is below the threshold.
+"""
+import math
+import os
+import re
+from collections import Counter
+from dataclasses import dataclass, field
+
+ROUTER_CONFIDENCE_THRESHOLD = float(os.getenv("EUCLIDIA_ROUTER_THRESHOLD", "0.85"))
+
+# --- Keyword rules: (pattern, tool, weight in log-odds) ---
+RULES = [
+    (r"\b(prove|proof|demonstrate|demonstration|show that|show why)\b", "use_deepseek", 3.0),
+    (r"\b(solve|calculate|compute|evaluate|find|determine|simplify|factori[sz]e)\b", "use_deepseek", 2.0),
+    (r"\b(derive|derivation|justify|verify|deduce|by induction|step by step)\b", "use_deepseek", 2.0),
+    (r"\b(what is|what are|what's|what does .+ mean|define|definition|meaning of|explain|describe)\b", "use_gemini", 2.5),
+    (r"\b(formula for|formula of|state the|statement of|difference between|who (was|is|invented))\b", "use_gemini", 2.0),
+    (r"\b(property|properties|example of|examples of|intuition)\b", "use_gemini", 1.0),
+]
+COMPILED_RULES = [(re.compile(pattern, re.IGNORECASE), tool, weight) for pattern, tool, weight in RULES]
+
+# Without math vocabulary the question may be off-topic: the agent must decide (and refuse)
+MATH_TERMS = re.compile(
+    r"[0-9=+*^√∑∫π≤≥≠<>]|\b(th?eorem|lemma|integer|prime|rational|irrational|"
+    r"derivative|integral|matrix|matrices|vector|eigen\w*|determinant|"
+    r"triangle|rectangle|diagonal|polygon|perimeter|equation|inequality|polynomial|"
+    r"quadr\w*|pythagor\w*|logarithm|exponential|sine|cosine|trigonometr\w*|"
+    r"probability|variance|median|topology|geometry|algebra|calculus|"
+    r"fourier|laplace|taylor|converg\w*|differentiable|"
+    r"fraction|modulo|divisible|gcd|lcm|factorial|binomial|combinatoric\w*|permutation|"
+    r"(in|sur|bi)jective|isomorphi\w*|homomorphi\w*|axiom|parabola|ellipse|hyperbola)(s|es)?\b",
+    re.IGNORECASE,
+)
+# Everyday words that are only a math signal together ("complex numbers", not "the best field to plant corn")
+AMBIGUOUS_MATH_TERMS = re.compile(
+    r"\b(number|real|complex|function|limit|series|sequence|square|circle|angle|area|volume|tangent|log|"
+    r"mean|set|group|ring|field|graph|transform|continuous|odd|even|sum|product|root|percentage|sphere)(s|es)?\b",
+    re.IGNORECASE,
+)
+
+
+def has_math_signal(question: str) -> bool:
+    """A math term, or two distinct everyday words with a math meaning."""
+    if MATH_TERMS.search(question):
+        return True
+    return len({match.group(1).lower() for match in AMBIGUOUS_MATH_TERMS.finditer(question)}) >= 2
+
+
+# Computations need concrete data (numbers, a formula or a variable)
+COMPUTE_VERBS = re.compile(r"\b(solve|calculate|compute|evaluate|find|determine|simplify)\b", re.IGNORECASE)
+CONCRETE_DATA = re.compile(r"[0-9=+^√∑∫π(]|\b(?!a\b)[a-z]\b", re.IGNORECASE)
+INCOMPLETE = re.compile(r"\b(of|the|to|for|a|an|that|and)\s*[?.!]*\s*$", re.IGNORECASE)
+
+# References to earlier turns: the raw question is not self-contained
+ANAPHORA = re.compile(r"\b(it|this|that one|these|those|above|previous|again|same|last one)\b", re.IGNORECASE)
+
+# --- Labeled training questions (tool chosen by the Gemini agent) ---
+LABELED_QUESTIONS = [
+    ("What is the definition of a derivative?", "use_gemini"),
+    ("What is the Laplace transform?", "use_gemini"),
+    ("Explain the Pythagorean theorem", "use_gemini"),
+    ("Define a prime number", "use_gemini"),
+    ("What is a group in abstract algebra?", "use_gemini"),
+    ("What are eigenvalues and eigenvectors?", "use_gemini"),
+    ("Explain the fundamental theorem of calculus", "use_gemini"),
+    ("What is the formula for the area of a circle?", "use_gemini"),
+    ("State the mean value theorem", "use_gemini"),
+    ("What is the difference between a permutation and a combination?", "use_gemini"),
+    ("Explain what a limit is", "use_gemini"),
+    ("What does it mean for a function to be continuous?", "use_gemini"),
+    ("Give the formula for the sum of an arithmetic series", "use_gemini"),
+    ("What is a Taylor series?", "use_gemini"),
+    ("Describe the properties of a determinant", "use_gemini"),
+    ("What is the quadratic formula?", "use_gemini"),
+    ("Explain Bayes theorem with an example", "use_gemini"),
+    ("What is a vector space?", "use_gemini"),
+    ("Definition of an irrational number", "use_gemini"),
+    ("Who invented calculus?", "use_gemini"),
+    ("What is the binomial theorem?", "use_gemini"),
+    ("Explain the intuition behind the Fourier transform", "use_gemini"),
+    ("What are the properties of logarithms?", "use_gemini"),
+    ("What is a matrix inverse?", "use_gemini"),
+    ("Prove that the square root of 2 is irrational", "use_deepseek"),
+    ("Demonstrate the quadratic formula", "use_deepseek"),
+    ("Prove that there are infinitely many primes", "use_deepseek"),
+    ("Show that the sum of the first n odd numbers is n squared", "use_deepseek"),
+    ("Prove by induction that 1 + 2 + ... + n = n(n+1)/2", "use_deepseek"),
+    ("Solve the equation 3x^2 - 7x + 2 = 0", "use_deepseek"),
+    ("Calculate the area of a triangle with base 5 and height 8", "use_deepseek"),
+    ("Find the derivative of x sin x", "use_deepseek"),
+    ("Compute the integral of x^2 from 0 to 1", "use_deepseek"),
+    ("Evaluate the limit of sin(x)/x as x approaches 0", "use_deepseek"),
+    ("Prove that 1 equals 2", "use_deepseek"),
+    ("Find all real solutions of x^3 - x = 0", "use_deepseek"),
+    ("Determine whether the series sum 1/n^2 converges", "use_deepseek"),
+    ("Show that every bounded monotone sequence converges", "use_deepseek"),
+    ("Derive the formula for the volume of a sphere", "use_deepseek"),
+    ("Justify why the determinant of a product is the product of determinants", "use_deepseek"),
+    ("Solve the system x + y = 3 and x - y = 1", "use_deepseek"),
+    ("Prove that the composition of two injective functions is injective", "use_deepseek"),
+    ("Calculate the eigenvalues of the matrix [[2, 1], [1, 2]]", "use_deepseek"),
+    ("Find the gcd of 84 and 120 using the Euclidean algorithm", "use_deepseek"),
+    ("Verify that the function f(x) = x^3 is odd", "use_deepseek"),
+    ("Show that sqrt(3) is irrational", "use_deepseek"),
+    ("Compute the probability of rolling two sixes with two dice", "use_deepseek"),
+    ("Simplify (x^2 - 1)/(x - 1)", "use_deepseek"),
+]
+
+TOKEN_RE = re.compile(r"[a-z]+|[0-9]+|[√∑∫π=+\-*/^]")
+
+
+def _features(question: str):
+    """Unigrams and bigrams of the lowercased question."""
+    tokens = TOKEN_RE.findall(question.lower())
+    return tokens + [f"{a}_{b}" for a, b in zip(tokens, tokens[1:])]
+
+
+class NaiveBayesRouter:
+    """Multinomial Naive Bayes over unigram/bigram features (two classes)."""
+
+    def __init__(self, examples):
+        self.counts = {"use_gemini": Counter(), "use_deepseek": Counter()}
+        self.docs = Counter()
+        for question, tool in examples:
+            self.counts[tool].update(_features(question))
+            self.docs[tool] += 1
+        self.vocab = set(self.counts["use_gemini"]) | set(self.counts["use_deepseek"])
+        self.totals = {tool: sum(counter.values()) for tool, counter in self.counts.items()}
+
+    def log_odds(self, question: str) -> float:
+        """log P(deepseek | q) - log P(gemini | q), ignoring unseen features."""
+        score = math.log(self.docs["use_deepseek"] / self.docs["use_gemini"])
+        size = len(self.vocab)
+        for feature in _features(question):
+            if feature not in self.vocab:
+                continue
+            p_deepseek = (self.counts["use_deepseek"][feature] + 1) / (self.totals["use_deepseek"] + size)
+            p_gemini = (self.counts["use_gemini"][feature] + 1) / (self.totals["use_gemini"] + size)
+            score += math.log(p_deepseek / p_gemini)
+        return score
+
+
+_model = NaiveBayesRouter(LABELED_QUESTIONS)
+
+
+@dataclass
+class RouteDecision:
+    """Which tool to use, how sure we are and who decided."""
+    tool: str = None
+    confidence: float = 0.0
+    source: str = "local"
+    reasons: list = field(default_factory=list)
+
+    def as_dict(self):
+        return {"tool": self.tool, "confidence": round(self.confidence, 3), "source": self.source, "reasons": self.reasons}
+
+
+def route_question(question: str, has_history: bool = False) -> RouteDecision:
+    """Scores a question locally. `tool` is None when there is no usable math signal."""
+    reasons = []
+    rule_score = 0.0
+    for pattern, tool, weight in COMPILED_RULES:
+        match = pattern.search(question)
+        if match:
+            rule_score += weight if tool == "use_deepseek" else -weight
+            reasons.append(f"rule:{match.group(0).lower()}")
+
+    if not reasons or not has_math_signal(question):
+        return RouteDecision(reasons=reasons + ["no math signal"])
+
+    # Rules dominate, the model breaks ties and calibrates the confidence
+    score = rule_score + 0.5 * _model.log_odds(question)
+    probability = 1 / (1 + math.exp(-score))
+    tool = "use_deepseek" if probability >= 0.5 else "use_gemini"
+    confidence = max(probability, 1 - probability)
+
+    # Incomplete or underspecified questions get a clarification from the agent instead
+    if INCOMPLETE.search(question):
+        confidence *= 0.5
+        reasons.append("looks incomplete")
+    elif COMPUTE_VERBS.search(question) and not CONCRETE_DATA.search(question):
+        confidence *= 0.5
+        reasons.append("no concrete data")
+
+    # Follow-ups like "prove it" need the conversation: leave them to the agent
+    if has_history and ANAPHORA.search(question):
+        confidence *= 0.5
+        reasons.append("refers to earlier turns")
+
+    return RouteDecision(tool=tool, confidence=confidence, reasons=reasons)
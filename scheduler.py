@@ -0,0 +1,298 @@
+"""Process-wide scheduler in front of the provider clients.
+
+Every Streamlit session, API request and script shares one `ProviderScheduler`
+per provider. It caps the calls in flight, paces them to a tokens-per-minute
+budget and decides who goes next when calls are waiting:
+- explanation calls (EXPLAIN) go before long reasoning calls (REASON), unless
+  the latter have waited more than PRIORITY_AGING seconds,
+- within a priority, sessions take turns, so a session with several queued
+  questions does not delay another session's first one,
+- a session's own calls keep their order.
+
+When a queue is full the call is rejected right away (SchedulerBusy) rather
+than timing out. Waiting calls show their queue position through `status`.
+The state is guarded by a threading lock and waiters are woken on their own
+event loop, so the API server's loop and the shared background loop can use
+the same schedulers.
+"""
+import asyncio
+import contextvars
+import itertools
+import os
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+import metrics
+import status
+from rate_limit import TokenBucket
+
+# --- Settings ---
+PROVIDER_LIMITS = {
+    "gemini": {
+        "concurrency": int(os.getenv("EUCLIDIA_GEMINI_CONCURRENCY", "8")),
+        "tokens_per_minute": float(os.getenv("EUCLIDIA_GEMINI_TPM", "0")),  # 0 = no token budget
+    },
+    "deepseek": {
+        "concurrency": int(os.getenv("EUCLIDIA_DEEPSEEK_CONCURRENCY", "4")),
+        "tokens_per_minute": float(os.getenv("EUCLIDIA_DEEPSEEK_TPM", "0")),
+    },
+}
+DISPLAY_NAMES = {"gemini": "Gemini", "deepseek": "DeepSeek"}
+OUTPUT_ESTIMATES = {"gemini": 1000, "deepseek": 3000}  # Tokens reserved for the answer until the real usage is known
+MAX_QUEUE = int(os.getenv("EUCLIDIA_MAX_QUEUE", "128"))  # Waiting calls per provider
+MAX_QUEUE_PER_SESSION = int(os.getenv("EUCLIDIA_MAX_QUEUE_PER_SESSION", "4"))
+MAX_TRACKED_SESSIONS = 1000
+PRIORITY_AGING = 20.0  # Seconds after which a reasoning call is served like an explanation
+POLL_INTERVAL = 0.5
+
+EXPLAIN, REASON = 0, 1
+
+
+class SchedulerBusy(RuntimeError):
+    pass
+
+
+# --- Sessions ---
+_session = contextvars.ContextVar("euclidia_session", default=None)
+
+
+@contextmanager
+def use_session(session_id):
+    """Attributes the provider calls made inside the block to `session_id` (for fair queuing)."""
+    token = _session.set(session_id)
+    try:
+        yield
+    finally:
+        _session.reset(token)
+
+
+def current_session():
+    return _session.get()
+
+
+class _Waiter:
+    def __init__(self, owner, priority, tokens, seq, loop):
+        self.owner = owner  # The session id, None for calls made outside a session
+        self.session = owner if owner is not None else f"call-{seq}"  # Queue key: anonymous calls queue alone
+        self.priority = priority
+        self.tokens = tokens
+        self.seq = seq
+        self.loop = loop
+        self.future = loop.create_future()
+        self.enqueued = time.monotonic()
+        self.granted = False
+
+
+def _wake(future):
+    if not future.done():
+        future.set_result(None)
+
+
+class ProviderScheduler:
+    """Concurrency cap, token budget and fair queue for one provider."""
+
+    def __init__(self, name: str, concurrency: int, tokens_per_minute: float = 0,
+                 max_queue: int = MAX_QUEUE, max_per_session: int = MAX_QUEUE_PER_SESSION):
+        self.name = name
+        self.concurrency = concurrency
+        self.max_queue = max_queue
+        self.max_per_session = max_per_session
+        self.bucket = TokenBucket(tokens_per_minute / 60, tokens_per_minute) if tokens_per_minute else None
+        self.lock = threading.Lock()
+        self.queues = {}          # Session → deque of waiters, in arrival order
+        self.turns = {}           # Session → number of its last grant (sessions served least recently go first)
+        self.in_flight = 0
+        self.waiting = 0
+        self.seq = itertools.count()
+        self.grants = itertools.count()
+        self.positions = None     # Cached service order, rebuilt after each queue change
+        self.stats = {"granted": 0, "queued": 0, "rejected": 0, "wait_s": 0.0}
+
+    # --- Queue order (lock held) ---
+    def _key(self, waiter, turns, now):
+        priority = waiter.priority if now - waiter.enqueued < PRIORITY_AGING else EXPLAIN
+        return (priority, turns.get(waiter.session, -1), waiter.seq)
+
+    def _head(self, queues, turns, now):
+        """The waiter served next: the best of each session's first waiter."""
+        return min((queue[0] for queue in queues.values()), key=lambda waiter: self._key(waiter, turns, now))
+
+    def _position(self, waiter) -> int:
+        if self.positions is None:
+            queues = {session: deque(queue) for session, queue in self.queues.items()}
+            turns = dict(self.turns)
+            grants = itertools.count(max(turns.values(), default=0) + 1)
+            now = time.monotonic()
+            self.positions = {}
+            while queues:
+                head = self._head(queues, turns, now)
+                self.positions[head] = len(self.positions) + 1
+                turns[head.session] = next(grants)
+                queues[head.session].popleft()
+                if not queues[head.session]:
+                    del queues[head.session]
+        return self.positions.get(waiter, 0)
+
+    def _served(self, session):
+        """Records a grant for the session's turn (calls outside a session have no turn to keep)."""
+        if session is None:
+            return
+        self.turns[session] = next(self.grants)
+        if len(self.turns) > MAX_TRACKED_SESSIONS:
+            # Forget the sessions served longest ago that have nothing queued
+            for stale in sorted(self.turns, key=self.turns.get)[:len(self.turns) // 2]:
+                if stale not in self.queues:
+                    del self.turns[stale]
+
+    def _take_tokens(self, tokens: float) -> bool:
+        return self.bucket is None or self.bucket.try_acquire(min(tokens, self.bucket.capacity)) <= 0
+
+    def _dispatch(self):
+        """Grants free slots to the waiters, in service order, while the token budget allows."""
+        now = time.monotonic()
+        while self.waiting and self.in_flight < self.concurrency:
+            waiter = self._head(self.queues, self.turns, now)
+            if not self._take_tokens(waiter.tokens):
+                break  # Budget exhausted: the waiters' polling dispatches again once it refilled
+            queue = self.queues[waiter.session]
+            queue.popleft()
+            if not queue:
+                del self.queues[waiter.session]
+            self.waiting -= 1
+            self.in_flight += 1
+            self._served(waiter.owner)
+            waiter.granted = True
+            waiter.loop.call_soon_threadsafe(_wake, waiter.future)
+        self.positions = None
+
+    def _remove(self, waiter):
+        queue = self.queues.get(waiter.session)
+        if queue and waiter in queue:
+            queue.remove(waiter)
+            if not queue:
+                del self.queues[waiter.session]
+            self.waiting -= 1
+            self.positions = None
+
+    # --- Public API ---
+    async def acquire(self, tokens: float = 0, priority: int = EXPLAIN) -> float:
+        """Waits for a slot and returns the tokens reserved (to pass to `release`).
+
+        Raises SchedulerBusy when the provider's queue, or the session's, is full.
+        """
+        session = current_session()
+        with self.lock:
+            if not self.waiting and self.in_flight < self.concurrency and self._take_tokens(tokens):
+                self.in_flight += 1
+                self._served(session)
+                self.stats["granted"] += 1
+                return tokens
+            if session is not None and len(self.queues.get(session, ())) >= self.max_per_session:
+                self.stats["rejected"] += 1
+                raise SchedulerBusy(f"too many questions waiting for {self.name} in this session, retry when one is answered")
+            if self.waiting >= self.max_queue:
+                self.stats["rejected"] += 1
+                raise SchedulerBusy(f"{self.name} is saturated ({self.waiting} calls waiting), retry in a moment")
+            seq = next(self.seq)
+            waiter = _Waiter(session, priority, tokens, seq, asyncio.get_running_loop())
+            self.queues.setdefault(waiter.session, deque()).append(waiter)
+            self.waiting += 1
+            self.stats["queued"] += 1
+            self.positions = None
+
+        previous = status.current_status()
+        shown = None
+        try:
+            while True:
+                try:
+                    await asyncio.wait_for(asyncio.shield(waiter.future), POLL_INTERVAL)
+                    break
+                except asyncio.TimeoutError:
+                    with self.lock:
+                        self._dispatch()  # Picks up refilled token budget
+                        position = 0 if waiter.granted else self._position(waiter)
+                    if position and position != shown:
+                        shown = position
+                        status.set_status(f"⏳ **Waiting for {DISPLAY_NAMES.get(self.name, self.name)}: position {position} in the queue**")
+        except BaseException:
+            with self.lock:
+                if waiter.granted:
+                    self.in_flight -= 1
+                    self._dispatch()
+                else:
+                    self._remove(waiter)
+            raise
+        finally:
+            if shown is not None and previous:
+                status.set_status(previous)
+            elif shown is not None:
+                status.clear_status()
+
+        waited = time.monotonic() - waiter.enqueued
+        metrics.observe("euclidia_queue_wait_seconds", waited, provider=self.name)
+        with self.lock:
+            self.stats["granted"] += 1
+            self.stats["wait_s"] += waited
+        return tokens
+
+    def release(self, reserved: float = 0, used: float = None):
+        """Frees the slot; `used` (real token usage) corrects the reservation in the budget."""
+        with self.lock:
+            self.in_flight -= 1
+            if self.bucket is not None and used is not None:
+                self.bucket.charge(used - min(reserved, self.bucket.capacity))
+            self._dispatch()
+
+    @asynccontextmanager
+    async def slot(self, tokens: float = 0, priority: int = EXPLAIN):
+        """`async with` form of acquire/release; set `usage["tokens"]` to the real usage if known."""
+        reserved = await self.acquire(tokens, priority)
+        usage = {"tokens": None}
+        try:
+            yield usage
+        finally:
+            self.release(reserved, usage["tokens"])
+
+    def get_stats(self) -> dict:
+        with self.lock:
+            granted = self.stats["granted"]
+            return {
+                "in_flight": self.in_flight,
+                "waiting": self.waiting,
+                "concurrency": self.concurrency,
+                "granted": granted,
+                "queued": self.stats["queued"],
+                "rejected": self.stats["rejected"],
+                "mean_wait_s": round(self.stats["wait_s"] / granted, 4) if granted else 0.0,
+            }
+
+
+_schedulers = {}
+_schedulers_lock = threading.Lock()
+
+
+def get_scheduler(provider: str) -> ProviderScheduler:
+    with _schedulers_lock:
+        if provider not in _schedulers:
+            limits = PROVIDER_LIMITS.get(provider, {"concurrency": 4, "tokens_per_minute": 0})
+            _schedulers[provider] = ProviderScheduler(provider, limits["concurrency"], limits["tokens_per_minute"])
+        return _schedulers[provider]
+
+
+def get_stats() -> dict:
+    with _schedulers_lock:
+        schedulers = list(_schedulers.values())
+    return {scheduler.name: scheduler.get_stats() for scheduler in schedulers}
+
+
+def reserve_tokens(provider: str, input_tokens: int) -> int:
+    """Tokens to reserve for a call: its input plus the usual answer length."""
+    return input_tokens + OUTPUT_ESTIMATES.get(provider, 1000)
+
+
+metrics.metrics.register_collector(lambda: {
+    f"euclidia_scheduler_{provider}_{key}": value
+    for provider, stats in get_stats().items()
+    for key, value in stats.items()
+})
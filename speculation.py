@@ -0,0 +1,171 @@
+"""Speculative and hedged execution of the tool calls.
+
+Speculation starts the tool the local router finds most likely while the agent
+is still routing: the call is kept if the agent picks the same tool and
+cancelled otherwise. Hedging starts a backup request when the primary has not
+produced a first token within a deadline; whichever answers first is used.
+Both trade provider spend for latency, so `speculation_stats` tracks the time
+saved and the tokens wasted.
+"""
+import asyncio
+import os
+import threading
+import time
+from context_window import estimate_tokens
+from status import DeferredReporter, use_reporter
+
+SPECULATE = os.getenv("EUCLIDIA_SPECULATE", "0") == "1"
+SPECULATE_MIN_CONFIDENCE = float(os.getenv("EUCLIDIA_SPECULATE_MIN_CONFIDENCE", "0.6"))
+HEDGE_AFTER = float(os.getenv("EUCLIDIA_HEDGE_AFTER", "0"))  # seconds without a first token, 0 disables
+
+_DONE = object()
+
+
+class Prefetch:
+    """Runs an async generator in its own task, buffering its chunks until they are consumed."""
+
+    def __init__(self, agen, input_tokens: int = 0):
+        self.input_tokens = input_tokens
+        self.started = time.perf_counter()
+        self.first_chunk_at = None
+        self.finished_at = None
+        self.first_chunk = asyncio.Event()
+        self.output = []
+        self.chunks = asyncio.Queue()
+        self.task = asyncio.create_task(self._pump(agen))
+
+    async def _pump(self, agen):
+        try:
+            async for chunk in agen:
+                if self.first_chunk_at is None:
+                    self.first_chunk_at = time.perf_counter()
+                self.first_chunk.set()
+                self.output.append(chunk)
+                self.chunks.put_nowait(chunk)
+        finally:
+            self.finished_at = time.perf_counter()
+            self.first_chunk.set()
+            self.chunks.put_nowait(_DONE)
+
+    @property
+    def spent_tokens(self) -> int:
+        """Estimated tokens billed so far (prompt plus generated output)."""
+        return self.input_tokens + estimate_tokens("".join(self.output))
+
+    def elapsed(self) -> float:
+        """Seconds the call has been (or was) running."""
+        return (self.finished_at or time.perf_counter()) - self.started
+
+    def cancel(self):
+        if not self.task.done():
+            self.task.cancel()
+
+    async def stream(self):
+        """Yields the buffered chunks, then the live ones; closing it cancels the call."""
+        try:
+            while True:
+                chunk = await self.chunks.get()
+                if chunk is _DONE:
+                    break
+                yield chunk
+            if not self.task.cancelled():
+                await self.task  # Re-raises a failure of the underlying stream
+        finally:
+            self.cancel()
+
+
+class SpeculationStats:
+    """Process-wide counters: latency saved vs. provider spend wasted."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.stats = {
+            "speculations": 0, "speculations_kept": 0, "speculations_discarded": 0,
+            "hedges": 0, "hedges_won_by_backup": 0,
+            "saved_seconds": 0.0, "wasted_seconds": 0.0, "wasted_tokens": 0,
+        }
+
+    def record(self, **increments):
+        with self.lock:
+            for key, value in increments.items():
+                self.stats[key] += value
+
+    def get_stats(self) -> dict:
+        with self.lock:
+            stats = dict(self.stats)
+        stats["keep_rate"] = stats["speculations_kept"] / stats["speculations"] if stats["speculations"] else 0.0
+        return stats
+
+
+speculation_stats = SpeculationStats()
+
+
+# --- Hedging ---
+async def hedged_stream(factory, hedge_after: float = HEDGE_AFTER, input_tokens: int = 0, report: dict = None):
+    """Streams `factory()`, starting a second `factory()` if no chunk arrived after `hedge_after` seconds.
+
+    The first call to produce a chunk is streamed, the other one is cancelled.
+    If `report` is a dict, the hedge outcome is stored in it.
+    """
+    primary = Prefetch(factory(), input_tokens)
+    backup = None
+    try:
+        try:
+            await asyncio.wait_for(primary.first_chunk.wait(), hedge_after)
+            winner = primary
+        except asyncio.TimeoutError:
+            backup = Prefetch(factory(), input_tokens)
+            waiters = {asyncio.create_task(call.first_chunk.wait()): call for call in (primary, backup)}
+            try:
+                done, _ = await asyncio.wait(waiters, return_when=asyncio.FIRST_COMPLETED)
+            finally:
+                for waiter in waiters:
+                    waiter.cancel()
+            winner = primary if primary.first_chunk.is_set() else waiters[done.pop()]
+            loser = backup if winner is primary else primary
+            loser.cancel()
+            speculation_stats.record(
+                hedges=1,
+                hedges_won_by_backup=int(winner is backup),
+                wasted_tokens=loser.spent_tokens,
+            )
+            if report is not None:
+                report["hedge"] = {"after_s": hedge_after, "winner": "backup" if winner is backup else "primary"}
+
+        async for chunk in winner.stream():
+            yield chunk
+    finally:
+        primary.cancel()
+        if backup:
+            backup.cancel()
+
+
+# --- Speculation ---
+class Speculation:
+    """A tool call started before the agent has decided which tool to use."""
+
+    def __init__(self, tool_name: str, agen_factory, input_tokens: int = 0):
+        self.tool_name = tool_name
+        self.outcome = None
+        # Statuses and errors stay hidden unless the speculation is kept
+        self.reporter = DeferredReporter()
+        with use_reporter(self.reporter):
+            self.call = Prefetch(agen_factory(), input_tokens)  # The task copies the current context
+
+    def keep(self) -> dict:
+        """Uses the speculative call: the time it has been running is the latency saved."""
+        self.outcome = "kept"
+        self.reporter.attach()
+        saved = self.call.elapsed()
+        speculation_stats.record(speculations=1, speculations_kept=1, saved_seconds=saved)
+        return {"tool": self.tool_name, "outcome": "kept", "saved_s": round(saved, 3)}
+
+    def discard(self) -> dict:
+        """Cancels the call (the agent chose another tool or no tool); no-op once settled."""
+        if self.outcome:
+            return {"tool": self.tool_name, "outcome": self.outcome}
+        self.outcome = "discarded"
+        self.call.cancel()
+        wasted_s, wasted_tokens = self.call.elapsed(), self.call.spent_tokens
+        speculation_stats.record(speculations=1, speculations_discarded=1, wasted_seconds=wasted_s, wasted_tokens=wasted_tokens)
+        return {"tool": self.tool_name, "outcome": "discarded", "wasted_s": round(wasted_s, 3), "wasted_tokens": wasted_tokens}
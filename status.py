@@ -0,0 +1,138 @@
+"""Status reporting for the pipeline, decoupled from Streamlit.
+
+Tools and the agent call `set_status`, `clear_status`, `warning` and `error`
+instead of touching `st.session_state` or `st.warning`. The caller decides where
+those go by installing a reporter for the current context: the Streamlit app
+renders them in its loading placeholder, the HTTP API forwards them to the
+client, and scripts simply print warnings and errors.
+"""
+import contextvars
+from contextlib import contextmanager
+
+
+class StatusReporter:
+    """Default reporter: statuses are ignored, warnings and errors are printed."""
+
+    def status(self, text: str):
+        pass
+
+    def clear(self):
+        pass
+
+    def warning(self, text: str):
+        print(f"⚠️ {text}")
+
+    def error(self, text: str):
+        print(f"❌ {text}")
+
+
+class CallbackReporter(StatusReporter):
+    """Forwards every event to a single `callback(kind, text)`."""
+
+    def __init__(self, callback):
+        self.callback = callback
+
+    def status(self, text: str):
+        self.callback("status", text)
+
+    def clear(self):
+        self.callback("clear", "")
+
+    def warning(self, text: str):
+        self.callback("warning", text)
+
+    def error(self, text: str):
+        self.callback("error", text)
+
+
+class DeferredReporter(StatusReporter):
+    """Buffers events until `attach()`, then forwards them to the reporter current at creation.
+
+    Used for speculative calls: their statuses only reach the user if the call is kept.
+    """
+
+    def __init__(self):
+        self.target = get_reporter()
+        self.events = []
+        self.attached = False
+
+    def _emit(self, kind, *args):
+        if self.attached:
+            getattr(self.target, kind)(*args)
+        else:
+            self.events.append((kind, args))
+
+    def status(self, text: str):
+        self._emit("status", text)
+
+    def clear(self):
+        self._emit("clear")
+
+    def warning(self, text: str):
+        self._emit("warning", text)
+
+    def error(self, text: str):
+        self._emit("error", text)
+
+    def attach(self):
+        """Replays the buffered events and forwards the next ones directly."""
+        self.attached = True
+        for kind, args in self.events:
+            getattr(self.target, kind)(*args)
+        self.events.clear()
+
+
+class ItemReporter(StatusReporter):
+    """Reporter of one question of a batch: warnings and errors reach the batch's reporter, prefixed.
+
+    Statuses are dropped: the questions run side by side, so there is no single status to show.
+    """
+
+    def __init__(self, prefix: str):
+        self.target = get_reporter()
+        self.prefix = prefix
+
+    def warning(self, text: str):
+        self.target.warning(f"{self.prefix}{text}")
+
+    def error(self, text: str):
+        self.target.error(f"{self.prefix}{text}")
+
+
+_reporter = contextvars.ContextVar("euclidia_status_reporter", default=StatusReporter())
+
+
+@contextmanager
+def use_reporter(reporter: StatusReporter):
+    """Installs `reporter` for the code running inside the `with` block."""
+    token = _reporter.set(reporter)
+    try:
+        yield reporter
+    finally:
+        _reporter.reset(token)
+
+
+def get_reporter() -> StatusReporter:
+    return _reporter.get()
+
+
+# --- Helpers used by the pipeline ---
+_status_text = contextvars.ContextVar("euclidia_status_text", default=None)
+
+def set_status(text: str):
+    _status_text.set(text)
+    _reporter.get().status(text)
+
+def clear_status():
+    _status_text.set(None)
+    _reporter.get().clear()
+
+def current_status():
+    """Last status set in this context (None once cleared), so a temporary status can be undone."""
+    return _status_text.get()
+
+def warning(text: str):
+    _reporter.get().warning(text)
+
+def error(text: str):
+    _reporter.get().error(text)
@@ -0,0 +1,132 @@
+"""Stub chat models for local load tests and benchmarks (no API keys, no network).
+
+`install()` replaces Gemini and DeepSeek in the model registry with stubs that
+wait for a simulated latency and answer with canned text. Latency follows a
+log-normal distribution around its median, streamed answers come out at a
+configurable token rate, and a share of the calls can fail. When tools are
+bound, the stub routes with the local router (or always calls `tool_call`),
+so the whole pipeline runs.
+"""
+import asyncio
+import math
+import random
+import time
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, HumanMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from config import llms_config
+from context_window import estimate_tokens
+from router import route_question
+
+STUB_ANSWER = (
+    "**Stub answer.** Let $x \\in \\mathbb{R}$ with $x^2 = 2$. "
+    "Then $$x = \\pm\\sqrt{2}$$ and the claim follows. "
+) * 4
+
+_rng = random.Random(0)
+
+
+class StubError(RuntimeError):
+    status_code = 503  # Looks like a provider outage, so the resilience layer retries it
+
+
+class StubChatModel(BaseChatModel):
+    """Chat model that waits `latency` seconds (median), then answers (or streams) `reply`.
+
+    `jitter` is the sigma of the log-normal latency (0 = constant), `tokens_per_second`
+    paces the generated words, `error_rate` is the share of calls raising StubError.
+    `tool_call` forces the tool picked when tools are bound ("none" = plain answer).
+    """
+
+    name: str = "stub"
+    latency: float = 0.5
+    jitter: float = 0.0
+    tokens_per_second: float = 100.0
+    error_rate: float = 0.0
+    reply: str = STUB_ANSWER
+    tool_call: str = None
+    tool_names: list = []
+
+    @property
+    def _llm_type(self) -> str:
+        return "euclidia-stub"
+
+    def bind_tools(self, tools, **kwargs):
+        return self.model_copy(update={"tool_names": [tool.name for tool in tools]})
+
+    # --- Simulation ---
+    def _latency(self) -> float:
+        if self.jitter <= 0:
+            return self.latency
+        return self.latency * math.exp(_rng.gauss(0, self.jitter))
+
+    def _token_delay(self) -> float:
+        return 1 / self.tokens_per_second if self.tokens_per_second > 0 else 0.0
+
+    def _maybe_fail(self):
+        if self.error_rate and _rng.random() < self.error_rate:
+            raise StubError(f"{self.name}: simulated provider error")
+
+    def _usage(self, messages, output: str) -> dict:
+        input_tokens = sum(estimate_tokens(m.content if isinstance(m.content, str) else str(m.content)) for m in messages)
+        output_tokens = estimate_tokens(output)
+        return {"input_tokens": input_tokens, "output_tokens": output_tokens, "total_tokens": input_tokens + output_tokens}
+
+    def _message(self, messages) -> AIMessage:
+        if not self.tool_names or self.tool_call == "none":
+            return AIMessage(content=self.reply, usage_metadata=self._usage(messages, self.reply))
+        question = next((m.content for m in reversed(messages) if isinstance(m, HumanMessage)), "")
+        tool = self.tool_call or route_question(question).tool or self.tool_names[0]
+        return AIMessage(content="", tool_calls=[{"name": tool, "args": {"question": question}, "id": "stub-call"}],
+                         usage_metadata=self._usage(messages, question))
+
+    def _chunks(self):
+        words = self.reply.split(" ")
+        for index, word in enumerate(words):
+            yield word if index == len(words) - 1 else word + " "
+
+    def _generation_time(self, message) -> float:
+        return self._token_delay() * len(message.content.split(" ")) if message.content else 0.0
+
+    # --- BaseChatModel ---
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        time.sleep(self._latency())
+        self._maybe_fail()
+        message = self._message(messages)
+        time.sleep(self._generation_time(message))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        await asyncio.sleep(self._latency())
+        self._maybe_fail()
+        message = self._message(messages)
+        await asyncio.sleep(self._generation_time(message))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        time.sleep(self._latency())
+        self._maybe_fail()
+        for text in self._chunks():
+            time.sleep(self._token_delay())
+            yield ChatGenerationChunk(message=AIMessageChunk(content=text))
+        yield ChatGenerationChunk(message=AIMessageChunk(content="", usage_metadata=self._usage(messages, self.reply)))
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        await asyncio.sleep(self._latency())
+        self._maybe_fail()
+        for text in self._chunks():
+            await asyncio.sleep(self._token_delay())
+            yield ChatGenerationChunk(message=AIMessageChunk(content=text))
+        yield ChatGenerationChunk(message=AIMessageChunk(content="", usage_metadata=self._usage(messages, self.reply)))
+
+
+def install(gemini_latency: float = 0.3, deepseek_latency: float = 2.0, seed: int = 0, **options):
+    """Replaces the real models of the registry with stubs.
+
+    `options` (jitter, tokens_per_second, error_rate, tool_call, reply) apply to both stubs.
+    """
+    _rng.seed(seed)
+    llms_config.override(
+        gemini=StubChatModel(name="stub-gemini", latency=gemini_latency, **options),
+        deepseek=StubChatModel(name="stub-deepseek", latency=deepseek_latency, **options),
+    )
@@ -1,20 +1,65 @@
-import time
+import argparse
+import json
+import multiprocessing
 import os
+import re
+import statistics
+import sys
+import time
 import pandas as pd
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 from agent_logic import prompt_ai
+import metrics
+import regression
+from rate_limit import ProviderLimiter
+from config import SYSTEM_PROMPT, CASSETTE_MODE
 from langchain_core.messages import HumanMessage, SystemMessage
 from mistralai import Mistral
 from datetime import datetime
 
 # --- Load Mistral API key from environment ---
 api_key = os.environ.get("MISTRAL_API_KEY")
-if not api_key:
+if not api_key and CASSETTE_MODE != "replay":
     raise ValueError("Environment variable MISTRAL_API_KEY is not defined.")
 
 # Update: using Mistral instead of MistralClient
 client = Mistral(api_key=api_key)
 
-# --- Generate 10 diverse test questions using Mistral Medium ---
+# Record/replay (EUCLIDIA_CASSETTE=record_missing replays a previous run and only calls providers for new prompts)
+if CASSETTE_MODE != "off":
+    from cassette import RecordedMistral
+    client = RecordedMistral(client)
+
+# --- Concurrency and rate limits (replace the fixed sleep between questions) ---
+MAX_WORKERS = int(os.environ.get("EUCLIDIA_TEST_WORKERS", "4"))
+PROCESSES = int(os.environ.get("EUCLIDIA_TEST_PROCESSES", "1"))  # Shards run in parallel worker processes
+EUCLIDIA_CONCURRENCY = int(os.environ.get("EUCLIDIA_TEST_CONCURRENCY", "4"))
+EUCLIDIA_RATE = float(os.environ.get("EUCLIDIA_TEST_RATE", "1.0"))  # questions started per second
+MISTRAL_CONCURRENCY = int(os.environ.get("MISTRAL_TEST_CONCURRENCY", "2"))
+MISTRAL_RATE = float(os.environ.get("MISTRAL_TEST_RATE", "1.0"))    # requests per second
+
+
+def build_limiters(share: int = 1):
+    """Provider limiters for one process; with `share` worker processes, each gets its share of the limits."""
+    euclidia = ProviderLimiter("euclidia", max_concurrency=max(1, EUCLIDIA_CONCURRENCY // share),
+                               rate=EUCLIDIA_RATE / share, burst=max(1, EUCLIDIA_CONCURRENCY // share))
+    mistral = ProviderLimiter("mistral", max_concurrency=max(1, MISTRAL_CONCURRENCY // share),
+                              rate=MISTRAL_RATE / share, burst=max(1, MISTRAL_CONCURRENCY // share))
+    return euclidia, mistral
+
+
+euclidia_limiter, mistral_limiter = build_limiters()
+
+# --- Judge settings ---
+JUDGE_MODEL = "mistral-medium"
+JUDGE = f"{JUDGE_MODEL}/v1"   # Cached judgments are reused only for the same judge and prompt version
+JUDGE_BATCH = int(os.environ.get("EUCLIDIA_JUDGE_BATCH", "5"))           # Answers scored per judge call
+JUDGE_BATCH_CHARS = int(os.environ.get("EUCLIDIA_JUDGE_BATCH_CHARS", "16000"))
+THRESHOLD_SCORE = 7.0  # ✅ Minimum required average score
+
+judgment_cache = regression.JudgmentCache(enabled=os.environ.get("EUCLIDIA_JUDGMENT_CACHE", "1") != "0")
+
+# --- Propose new corpus questions using Mistral Medium (reviewed by hand before being added) ---
 def generate_test_questions():
     prompt = """You are generating test questions for a mathematics AI assistant called EuclidIA.
 Generate exactly 10 questions following this structure:
@@ -42,11 +87,12 @@ AMBIGUOUS QUESTIONS (2 questions - should trigger error handling):
 IMPORTANT: Return ONLY the numbered list of questions. Do NOT add any comments, notes, explanations, or text in parentheses. Each line should contain ONLY the question number and the question text."""
     try:
         # Update: correct syntax for v1.7.0 with higher temperature for variety
-        response = client.chat.complete(
-            model="mistral-medium",
-            messages=[{"role": "user", "content": prompt}],
-            temperature=0.8  # Higher temperature for more diverse questions
-        )
+        with mistral_limiter.slot():
+            response = client.chat.complete(
+                model="mistral-medium",
+                messages=[{"role": "user", "content": prompt}],
+                temperature=0.8  # Higher temperature for more diverse questions
+            )
         lines = response.choices[0].message.content.strip().split("\n")
         questions = [line.lstrip("0123456789. ").strip() for line in lines if line.strip()]
 
@@ -68,16 +114,37 @@ IMPORTANT: Return ONLY the numbered list of questions. Do NOT add any comments,
             "Find the solution to the equation"  # Missing equation
         ]
 
-# --- Evaluate assistant's answer using Mistral Medium ---
-def evaluate_response(question, answer):
-    prompt = f"""
+# --- Evaluate assistant's answers using Mistral Medium ---
+JUDGE_RULES = """
 You are evaluating the response of a specialized math assistant named EuclidIA.
 
 Rules:
 - It must only answer math-related questions.
 - It must reject non-math questions politely.
 - Math answers must be accurate, clear, and helpful.
+"""
+SCORE_RE = re.compile(r"\[(\d+)\]\s*Score:\s*([\d.]+)\s*/\s*10")
+COMMENT_RE = re.compile(r"\[(\d+)\]\s*Comment:\s*(.+)")
+
+
+def _judge(prompt):
+    with mistral_limiter.slot():
+        response = client.chat.complete(
+            model=JUDGE_MODEL,
+            messages=[{"role": "user", "content": prompt}]
+        )
+    return response.choices[0].message.content
+
+
+def evaluate_response(question, answer=None):
+    """Scores one answer, or a list of `(question, answer)` pairs in a single judge call.
 
+    Returns `(score, comment)`, or a list of them in the order of the pairs. Pairs
+    the judge left out of a batch are scored again one by one.
+    """
+    if answer is None:
+        return _evaluate_batch(list(question))
+    prompt = f"""{JUDGE_RULES}
 Question:
 {question}
 
@@ -94,12 +161,7 @@ Comment: <your evaluation>
 No introduction, no explanations, no greetings, just the two lines inside the code block.
 """
     try:
-        # Update: correct syntax for v1.7.0
-        response = client.chat.complete(
-            model="mistral-medium",
-            messages=[{"role": "user", "content": prompt}]
-        )
-        content = response.choices[0].message.content
+        content = _judge(prompt)
         score_line = next((line for line in content.splitlines() if "Score:" in line), "Score: 0/10")
         comment_line = next((line for line in content.splitlines() if "Comment:" in line), "Comment: No comment.")
         score = float(score_line.split(":")[1].split("/")[0].strip())
@@ -109,83 +171,238 @@ No introduction, no explanations, no greetings, just the two lines inside the co
         print(f"❌ Error evaluating response: {e}")
         return 0.0, f"Evaluation failed: {e}"
 
-# --- System message (copied exactly from your code) ---
-system_msg = SystemMessage(content="""# Role
-You are an AI assistant specialized in mathematics. You must answer only questions related to mathematics.
 
-# Available Tools
-You have access to two tools to answer questions:
-- `use_gemini`: for definitions, clear explanations of mathematical concepts, established properties, formulas, or any factual response.
-- `use_deepseek`: for proofs, formal demonstrations, detailed reasoning, or problem solving that requires multiple logical steps.
+def _evaluate_batch(pairs):
+    if len(pairs) == 1:
+        return [evaluate_response(*pairs[0])]
+    items = "\n".join(f"### Item {index}\nQuestion:\n{question}\n\nAnswer:\n{answer}\n" for index, (question, answer) in enumerate(pairs, 1))
+    prompt = f"""{JUDGE_RULES}
+Evaluate each of the {len(pairs)} question/answer pairs below independently.
+
+{items}
+Provide your evaluation ONLY in this exact format, one pair of lines per item, enclosed in triple backticks (no extra text):
+
+```
+[1] Score: X/10
+[1] Comment: <your evaluation>
+[2] Score: X/10
+[2] Comment: <your evaluation>
+```
+
+No introduction, no explanations, no greetings, just the lines inside the code block.
+"""
+    scores, comments = {}, {}
+    try:
+        content = _judge(prompt)
+        scores = {int(index): float(score) for index, score in SCORE_RE.findall(content)}
+        comments = {int(index): comment.strip() for index, comment in COMMENT_RE.findall(content)}
+    except Exception as e:
+        print(f"❌ Error evaluating a batch of {len(pairs)} responses: {e}")
+    return [
+        (scores[index], comments.get(index, "No comment.")) if index in scores else evaluate_response(question, answer)
+        for index, (question, answer) in enumerate(pairs, 1)
+    ]
+
+
+def _judge_batches(rows):
+    """Splits rows awaiting a judgment into batches of at most JUDGE_BATCH answers and JUDGE_BATCH_CHARS characters."""
+    batch, size = [], 0
+    for row in rows:
+        length = len(row["Question"]) + len(row["Answer"])
+        if batch and (len(batch) >= JUDGE_BATCH or size + length > JUDGE_BATCH_CHARS):
+            yield batch
+            batch, size = [], 0
+        batch.append(row)
+        size += length
+    if batch:
+        yield batch
+
+
+def judge_rows(rows):
+    """Scores the rows in one judge call and caches the judgments."""
+    judgments = evaluate_response([(row["Question"], row["Answer"]) for row in rows])
+    for row, (score, comment) in zip(rows, judgments):
+        row.update({"Score": score, "Comment": comment, "Judgment": "batch" if len(rows) > 1 else "single"})
+        if not comment.startswith("Evaluation failed"):
+            judgment_cache.put(row["Question"], row["Answer"], JUDGE, score, comment)
+        print(f"\n🔹 {row['Id']}: {row['Question']}\n✅ Score: {score}/10 — {comment}")
+    return rows
+
+# --- System message (same as the app) ---
+system_msg = SystemMessage(content=SYSTEM_PROMPT)
+
+# --- Single question: answer, then reuse a previous judgment if the answer did not change ---
+def run_question(item):
+    """Answers one regression item; the row is judged later unless its judgment is cached."""
+    started = time.perf_counter()
+    result = {"Id": item.id, "Category": item.category, "Question": item.question}
+    try:
+        messages = [system_msg, HumanMessage(content=item.question)]
+
+        # Direct call since prompt_ai now handles everything and returns AIMessage with final content
+        # The answer cache is bypassed: the suite must exercise the live pipeline
+        with euclidia_limiter.slot():
+            response = prompt_ai(messages, use_cache=False)
+        answer = response.content if hasattr(response, "content") else str(response)
+        trace = (getattr(response, "response_metadata", None) or {}).get("trace", {})
+        result["Answer"] = answer
+
+        cached = judgment_cache.get(item.question, answer, JUDGE)
+        if cached:
+            result.update({"Score": cached[0], "Comment": cached[1], "Judgment": "cached"})
+            print(f"\n🔹 {item.id}: {item.question}\n✅ Score: {cached[0]}/10 — {cached[1]} (unchanged answer)")
+
+        # Per-stage latency of the pipeline (route_llm, tool, latex_cleanup...)
+        for stage, seconds in trace.get("stages", {}).items():
+            result[f"{stage}_s"] = seconds
 
-# Guidelines
-Carefully analyze each question and choose the most appropriate tool:
-- If the question is straightforward, factual, or asks for a simple explanation → use `use_gemini`.
-- If the question requires structured reasoning, rigorous justification, or a demonstration → use `use_deepseek`.
+    except Exception as e:
+        print(f"\n🔹 {item.id}: {item.question}\n❌ Error: {e}")
+        result.update({"Answer": "[ERROR]", "Score": 0, "Comment": str(e), "Judgment": "error"})
+
+    result["Latency"] = round(time.perf_counter() - started, 2)
+    return result
+
+
+def run_shard(items, max_workers=MAX_WORKERS):
+    """Answers and judges a list of RegressionItems in this process; returns their rows in the same order.
+
+    Answers are produced concurrently; as they arrive, the ones without a cached
+    judgment are grouped into batches scored by the judge in parallel.
+    """
+    rows = {}
+    pending = []
+    judge_futures = []
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as answers, \
+            ThreadPoolExecutor(max_workers=max(1, MISTRAL_CONCURRENCY)) as judges:
+        futures = {answers.submit(run_question, item): item.id for item in items}
+        for future in as_completed(futures):
+            row = rows[futures[future]] = future.result()
+            if "Judgment" not in row:
+                pending.append(row)
+            if len(pending) >= JUDGE_BATCH:
+                judge_futures.extend(judges.submit(judge_rows, batch) for batch in _judge_batches(pending))
+                pending = []
+        judge_futures.extend(judges.submit(judge_rows, batch) for batch in _judge_batches(pending))
+        for future in judge_futures:
+            future.result()
+    metrics.flush()
+    return [rows[item.id] for item in items]
+
+
+def _init_worker(processes):
+    """Worker process setup: its share of the provider limits."""
+    global euclidia_limiter, mistral_limiter
+    euclidia_limiter, mistral_limiter = build_limiters(processes)
 
-Always use only one of these two tools to answer.
-""")
 
 # --- Main test runner ---
-def run_test_suite():
-    print("🚀 Generating test questions using Mistral Medium...")
-    questions = generate_test_questions()
-    results = []
-    total_score = 0.0
-    threshold_score = 7.0  # ✅ Minimum required average score
-
-    for idx, question in enumerate(questions, 1):
-        print(f"\n🔹 Q{idx}: {question}")
-        try:
-            messages = [system_msg, HumanMessage(content=question)]
-
-            # Direct call since prompt_ai now handles everything and returns AIMessage with final content
-            response = prompt_ai(messages)
-            answer = response.content if hasattr(response, "content") else str(response)
-
-            score, comment = evaluate_response(question, answer)
-            total_score += score
-
-            print(f"✅ Score: {score}/10 — {comment}")
-            results.append({
-                "Question": question,
-                "Answer": answer,
-                "Score": score,
-                "Comment": comment
-            })
-
-            time.sleep(1)
-
-        except Exception as e:
-            print(f"❌ Error: {e}")
-            results.append({
-                "Question": question,
-                "Answer": "[ERROR]",
-                "Score": 0,
-                "Comment": str(e)
-            })
-
-
-    avg = total_score / len(questions)
+def run_test_suite(max_workers=MAX_WORKERS, processes=PROCESSES, shard="1/1", categories=None, limit=None, corpus_path=regression.CORPUS_PATH):
+    corpus = regression.load_corpus(corpus_path)
+    shard_index, shards = regression.parse_shard(shard)
+    items = regression.select(corpus.items, shard_index, shards, categories, limit)
+    if not items:
+        raise RuntimeError("❌ No question selected: check --shard, --categories and --limit.")
+    print(f"🚀 Running {len(items)} of {len(corpus.items)} questions (corpus v{corpus.version}, shard {shard}, "
+          f"{processes} process{'es' if processes > 1 else ''})...")
+    started = time.perf_counter()
+
+    # Answering and judging are pipelined across questions; the limiters pace each provider.
+    # Several processes each take a sub-shard and share the provider limits.
+    if processes > 1:
+        parts = [regression.select(items, part, processes) for part in range(processes)]
+        with ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context("spawn"),
+                                 initializer=_init_worker, initargs=(processes,)) as executor:
+            done = {}
+            for part_rows in executor.map(run_shard, [part for part in parts if part], [max_workers] * processes):
+                done.update((row["Id"], row) for row in part_rows)
+        results = [done[item.id] for item in items]
+    else:
+        results = run_shard(items, max_workers)
+
+    avg = statistics.fmean(result["Score"] for result in results)
+    wall_time = time.perf_counter() - started
+    date = datetime.now().strftime('%Y-%m-%d')
+    summary = regression.with_deltas(regression.summarize(results), regression.previous_trends(), corpus.version)
 
     # Add average score to the CSV file
-    results.append({
+    rows = results + [{
         "Question": "Average",
         "Answer": "",
         "Score": avg,
-        "Comment": "Average score over all questions"
-    })
-
-    df = pd.DataFrame(results)
-    filename = f"euclidia_test_results_{datetime.now().strftime('%Y-%m-%d')}.csv"
-    df.to_csv(filename, index=False)
-    print(f"\n📄 Results saved to euclidia_test_results.csv")
+        "Comment": "Average score over all questions",
+        "Latency": round(wall_time, 2)
+    }]
+
+    suffix = "" if shards == 1 else f"_shard-{shard_index + 1}-of-{shards}"
+    filename = f"euclidia_test_results_{date}{suffix}.csv"
+    pd.DataFrame(rows).to_csv(filename, index=False)
+    judged = sum(1 for result in results if result.get("Judgment") in ("single", "batch"))
+    report = {
+        "date": date,
+        "corpus": {"version": corpus.version, "digest": corpus.digest, "questions": len(corpus.items)},
+        "shard": shard,
+        "processes": processes,
+        "questions": len(results),
+        "average_score": round(avg, 2),
+        "wall_seconds": round(wall_time, 2),
+        "judgments": {"judged": judged, "cached": sum(1 for result in results if result.get("Judgment") == "cached")},
+        "categories": summary,
+        "results": results,
+    }
+    with open(filename.replace(".csv", ".json"), "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    if shards == 1 and limit is None:
+        regression.append_trends(summary, date, corpus.version)  # Partial runs would skew the trends
+
+    print(f"\n📄 Results saved to {filename} and {filename.replace('.csv', '.json')}")
     print(f"📊 Average score: {avg:.2f}/10")
+    print(f"⏱️ Wall time: {wall_time:.1f}s for {len(results)} questions ({processes} process(es) × {max_workers} workers), "
+          f"{judged} judged, {report['judgments']['cached']} judgments reused")
+    print(f"\n   {'category':<18} {'n':>4} {'score':>6} {'Δ':>6} {'latency':>8} {'p95':>6}")
+    for category, row in summary.items():
+        delta = f"{row['delta_score']:+.2f}" if "delta_score" in row else "—"
+        print(f"   {category:<18} {row['questions']:>4} {row['mean_score']:>6.2f} {delta:>6} {row['mean_latency_s']:>7.2f}s {row['p95_latency_s']:>5.1f}s")
+    stages = {}
+    for result in results:
+        for key, seconds in result.items():
+            if key.endswith("_s") and isinstance(seconds, (int, float)):
+                stages.setdefault(key[:-2], []).append(seconds)
+    for stage, values in sorted(stages.items()):
+        print(f"   {stage:<28} n={len(values):<3} mean={statistics.fmean(values):.2f}s p95≤{regression.p95(values)}s")
     print("✅ EuclidIA test completed.\n")
 
     # Raise error if average score is too low
-    if avg < threshold_score:
-        raise RuntimeError(f"❌ Test FAILED — average score {avg:.2f}/10 is below the threshold ({threshold_score}/10)")
+    if avg < THRESHOLD_SCORE:
+        raise RuntimeError(f"❌ Test FAILED — average score {avg:.2f}/10 is below the threshold ({THRESHOLD_SCORE}/10)")
+
+
+def propose_questions(corpus_path=regression.CORPUS_PATH):
+    """Prints Mistral's candidate questions as corpus lines, to review and append by hand."""
+    corpus = regression.load_corpus(corpus_path)
+    categories = ["explanation", "explanation_typo", "proof", "proof_typo", "problem", "problem", "off_topic", "impossible", "ambiguous", "ambiguous"]
+    known = {item.question for item in corpus.items}
+    prefixes = {item.category: item.id.rsplit("-", 1)[0] for item in corpus.items}
+    counts = {category: sum(1 for item in corpus.items if item.category == category) for category in prefixes}
+    for category, question in zip(categories, generate_test_questions()):
+        if question in known:
+            continue
+        counts[category] = counts.get(category, 0) + 1
+        item_id = f"{prefixes.get(category, category)}-{counts[category]:03d}"
+        print(json.dumps({"id": item_id, "category": category, "question": question, "since": corpus.version + 1}, ensure_ascii=False))
+
 
 if __name__ == "__main__":
-    run_test_suite()
+    parser = argparse.ArgumentParser(description="EuclidIA regression suite (answers judged by Mistral).")
+    parser.add_argument("--shard", default="1/1", help="run only shard i of N (e.g. 2/4), for CI matrices")
+    parser.add_argument("--processes", type=int, default=PROCESSES, help="worker processes sharing the shard")
+    parser.add_argument("--workers", type=int, default=MAX_WORKERS, help="concurrent questions per process")
+    parser.add_argument("--categories", nargs="+", help="only these categories")
+    parser.add_argument("--limit", type=int, help="at most this many questions per category")
+    parser.add_argument("--corpus", default=regression.CORPUS_PATH)
+    parser.add_argument("--propose", action="store_true", help="ask Mistral for candidate questions instead of testing")
+    args = parser.parse_args()
+    if args.propose:
+        propose_questions(args.corpus)
+        sys.exit(0)
+    run_test_suite(args.workers, max(1, args.processes), args.shard, args.categories, args.limit, args.corpus)
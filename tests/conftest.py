@@ -0,0 +1,5 @@
+"""Offline unit tests: no API key, no network (the live regression suite is test_euclidia.py)."""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
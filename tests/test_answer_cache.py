@@ -0,0 +1,25 @@
+import pytest
+from answer_cache import normalize_question
+
+
+@pytest.mark.parametrize("question, expected", [
+    ("What is 5!", "what is 5!"),
+    ("what is 5!?", "what is 5!"),
+    ("What is (n+1)!", "what is(n+1)!"),
+    ("Compute 3!!", "compute 3!!"),
+    ("What is 5", "what is 5"),
+    ("What is 5?", "what is 5"),
+    ("Prove Fermat's little theorem!", "prove fermat's little theorem"),
+    ("Hello!?!", "hello"),
+    ("  Solve   x ^ 2 = 4 ?  ", "solve x^2=4"),
+    ("is x != 2.", "is x!=2"),
+    ("√2 × π", "sqrt 2*pi"),
+    ("Prove the pythagorian teorem", "prove the pythagorean theorem"),
+    ("...why?", "why"),
+])
+def test_normalize_question(question, expected):
+    assert normalize_question(question) == expected
+
+
+def test_factorial_and_plain_number_have_different_keys():
+    assert normalize_question("what is 5!") != normalize_question("what is 5")
@@ -0,0 +1,56 @@
+import pytest
+import compute
+
+
+def answer(question):
+    result = compute.compute(question)
+    return result.answer if result else None
+
+
+# --- Periodic equations: infinitely many solutions, left to the models ---
+@pytest.mark.parametrize("question", ["solve sin(x)=0", "solve tan(x)=1", "solve x*sin(x)=0"])
+def test_periodic_equations_are_not_computed(question):
+    assert compute.compute(question) is None
+
+
+def test_no_real_solution_is_not_reported_as_complex():
+    text = answer("solve cos(x)=2")
+    assert "no real solution" in text
+    assert "Complex" not in text
+
+
+def test_transcendental_equation_with_finitely_many_roots():
+    assert r"x = \ln{\left(5 \right)}" in answer("solve e^x=5")
+
+
+# --- Cheap in-process check before dispatching to a worker ---
+@pytest.mark.parametrize("question", [
+    "what is a prime number", "What is the derivative of the function?", "compute the eigenvalues of A",
+])
+def test_words_are_rejected_without_sympy(question):
+    assert compute.match_question(question) is None
+
+
+@pytest.mark.parametrize("question", [
+    "what is 2+3*4", "solve x + y = 3 and x - y = 1", "integrate x^2 from 0 to 3",
+    "limit of sin(x)/x as x tends to positive infinity",
+])
+def test_expressions_are_dispatched(question):
+    assert compute.match_question(question) is not None
+
+
+# --- Readable results ---
+def test_cubic_roots_are_labelled_and_approximated():
+    text = answer("solve x^3-2x-5=0")
+    assert r"**Real solution:** $$x \approx 2.09455$$" in text
+    assert r"**Complex solutions:** $$x \approx -1.04728 - 1.13594 i" in text
+
+
+def test_exact_rational_gets_a_decimal():
+    assert r"$$\frac{10}{3} \approx 3.33333$$" in answer("compute 10/3")
+
+
+def test_parametric_solution_states_its_condition():
+    text = answer("solve a*x+b=0")
+    assert r"x = - \frac{b}{a}" in text
+    assert r"Valid when $a \neq 0$" in text
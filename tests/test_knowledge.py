@@ -0,0 +1,33 @@
+import pytest
+from langchain_core.messages import HumanMessage, SystemMessage
+import agent_logic
+import compute
+import knowledge_index
+import stub_llms
+from config import SYSTEM_PROMPT
+
+
+@pytest.fixture
+def pipeline(monkeypatch, tmp_path):
+    """Stub LLMs, the knowledge index on (in a temporary directory), no cache and no SymPy fast path."""
+    stub_llms.install(gemini_latency=0.0, deepseek_latency=0.0, tokens_per_second=0)
+    monkeypatch.setattr(knowledge_index, "KNOWLEDGE_ENABLED", True)
+    monkeypatch.setattr(compute, "COMPUTE_ENABLED", False)
+    monkeypatch.setattr(agent_logic, "knowledge_index", knowledge_index.KnowledgeIndex(index_dir=str(tmp_path / "index")))
+
+    def ask(question):
+        messages = [SystemMessage(content=SYSTEM_PROMPT), HumanMessage(content=question)]
+        response = agent_logic.prompt_ai(messages, use_cache=False, speculative=False, hedge_after=0)
+        return response.response_metadata["route"]
+    return ask
+
+
+def test_standard_definition_is_answered_from_the_index(pipeline):
+    assert pipeline("What is a derivative?")["source"] == "knowledge"
+
+
+@pytest.mark.parametrize("question", ["Prove that sqrt(5) is irrational", "What is the Riemann hypothesis?"])
+def test_non_matching_question_still_reaches_the_router(pipeline, question):
+    route = pipeline(question)
+    assert route["source"] in ("local", "agent")
+    assert not any(reason.startswith("knowledge:") for reason in route["reasons"])
@@ -0,0 +1,70 @@
+import pytest
+from latex_utils import StreamingLatexFormatter, normalize_latex, split_blocks
+
+SAMPLES = [
+    "The derivative is \\(f'(x) = 2x\\), so the slope at 1 is 2.",
+    "We have\n\\[\n\\int_0^1 x^2\\,dx = \\frac{1}{3}\n\\]\nwhich ends the proof.",
+    "Inline $a^2 + b^2 = c^2$ and display $$\\sum_{k=1}^{n} k = \\frac{n(n+1)}{2}$$ done.",
+    "It costs $5 and $10 in total, and $x = 3$ solves it.",
+    "Solve:\n\\begin{align}\nx + y &= 2 \\\\\nx - y &= 0\n\\end{align}\nso $x = y = 1$.",
+    "First paragraph with $\\{1, 2\\}$.\n\nSecond paragraph:\n\n$$\n\\begin{pmatrix} 1 & 0 \\\\ 0 & 1 \\end{pmatrix}\n$$\n\nEnd.",
+    "Code `a $b$ c` stays, and\n```python\nprint('$x$ \\\\(y\\\\)')\n```\nthen \\(z\\).",
+    "An escaped \\$ sign, then \\(\\frac{\\sqrt{2}}{2}\\) and \\\\ a line break.",
+    "**Answer:** $$x = \\frac{-b \\pm \\sqrt{b^2 - 4ac}}{2a}$$",
+]
+
+
+def _stream(chunks):
+    formatter = StreamingLatexFormatter()
+    pieces = [formatter.feed(chunk) for chunk in chunks]
+    pieces.append(formatter.flush())
+    return pieces
+
+
+def _math_is_closed(text):
+    """A released piece never leaves a $ / $$ span or an environment open."""
+    return normalize_latex(text).text == text and normalize_latex(text).balanced
+
+
+@pytest.mark.parametrize("text", SAMPLES)
+def test_batch_output_is_balanced(text):
+    assert normalize_latex(text).balanced
+
+
+@pytest.mark.parametrize("text", SAMPLES)
+def test_two_chunks_match_batch_at_every_offset(text):
+    expected = normalize_latex(text).text
+    for offset in range(len(text) + 1):
+        pieces = _stream([text[:offset], text[offset:]])
+        assert "".join(pieces) == expected, f"split at offset {offset}"
+        assert all(_math_is_closed(piece) for piece in pieces), f"split at offset {offset}"
+
+
+@pytest.mark.parametrize("text", SAMPLES)
+def test_character_stream_matches_batch(text):
+    pieces = _stream(list(text))
+    assert "".join(pieces) == normalize_latex(text).text
+    assert all(_math_is_closed(piece) for piece in pieces)
+
+
+@pytest.mark.parametrize("text", SAMPLES)
+def test_split_blocks_round_trips(text):
+    blocks = split_blocks(text)
+    assert "".join(blocks) == text
+    assert all(normalize_latex(block).balanced for block in blocks)
+
+
+def test_split_blocks_keeps_display_math_with_blank_lines_together():
+    text = "Intro.\n\n$$\nx = 1\n\ny = 2\n$$\n\nOutro."
+    assert split_blocks(text) == ["Intro.\n\n", "$$\nx = 1\n\ny = 2\n$$\n\n", "Outro."]
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("\\(x\\)", "$x$"),
+    ("\\[x\\]", "$$x$$"),
+    ("costs $5 and $10", "costs \\$5 and \\$10"),
+    ("\\begin{cases} 1 \\end{cases}", "$$\n\\begin{cases} 1 \\end{cases}\n$$"),
+    ("line \\\\(not math)", "line \\\\(not math)"),
+])
+def test_normalize_latex(text, expected):
+    assert normalize_latex(text).text == expected
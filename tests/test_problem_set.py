@@ -0,0 +1,75 @@
+import pytest
+import problem_set
+from problem_set import dedupe, parse_problem_set, split_questions
+
+
+@pytest.mark.parametrize("text", [
+    "1. Solve x^2 = 4\n2. Differentiate sin(x)\n3) Integrate x dx",
+    "(1) Solve x^2 = 4\n(2) Differentiate sin(x)\n(3) Integrate x dx",
+    "- Solve x^2 = 4\n* Differentiate sin(x)\n• Integrate x dx",
+    "Exercise 1: Solve x^2 = 4\nExercise 2: Differentiate sin(x)\nQ3. Integrate x dx",
+])
+def test_numbered_items(text):
+    assert split_questions(text) == ["Solve x^2 = 4", "Differentiate sin(x)", "Integrate x dx"]
+
+
+def test_lettered_items_without_a_parent():
+    assert split_questions("a) Factor x^2 - 1\nb. Expand (x + 1)^2\n(c) Simplify 2x + 3x") == [
+        "Factor x^2 - 1", "Expand (x + 1)^2", "Simplify 2x + 3x"]
+
+
+def test_lettered_sub_questions_carry_their_parent():
+    text = "1. Let f(x) = x^2 + 1.\na) Find f'(x)\nb) Find f(2)\n2. Solve x + 1 = 0"
+    assert split_questions(text) == [
+        "Let f(x) = x^2 + 1.\nFind f'(x)",
+        "Let f(x) = x^2 + 1.\nFind f(2)",
+        "Solve x + 1 = 0",
+    ]
+
+
+def test_text_before_the_first_item_is_a_shared_premise():
+    text = "Let f(x) = x^3 - 3x.\n1. Find f'(x)\n2. Find the critical points of f"
+    assert split_questions(text) == [
+        "Let f(x) = x^3 - 3x.\nFind f'(x)",
+        "Let f(x) = x^3 - 3x.\nFind the critical points of f",
+    ]
+
+
+def test_multi_line_items_stay_one_question():
+    text = "1. Solve the system\nx + y = 2\nx - y = 0\n\n2. Factor x^2 - 1"
+    assert split_questions(text) == ["Solve the system\nx + y = 2\nx - y = 0", "Factor x^2 - 1"]
+
+
+def test_multi_line_sub_question():
+    text = "1. Consider the matrix A.\na) Compute\ndet(A)\nb) Invert A"
+    assert split_questions(text) == ["Consider the matrix A.\nCompute\ndet(A)", "Consider the matrix A.\nInvert A"]
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("What is the derivative of x^2?", ["What is the derivative of x^2?"]),
+    ("Solve the system\nx + y = 2\nx - y = 0", ["Solve the system\nx + y = 2\nx - y = 0"]),
+    ("  Prove that sqrt(2) is irrational.  \n", ["Prove that sqrt(2) is irrational."]),
+    ("1. Solve x + 1 = 0", ["1. Solve x + 1 = 0"]),  # A lone marker is part of the question
+])
+def test_single_problem(text, expected):
+    assert split_questions(text) == expected
+
+
+def test_blank_lines_separate_unnumbered_questions():
+    assert split_questions("Solve x + 1 = 0\n\n\nFactor x^2 - 1\n\nok") == ["Solve x + 1 = 0", "Factor x^2 - 1"]
+
+
+@pytest.mark.parametrize("text", ["", "   ", "\n\n", None])
+def test_empty_input(text):
+    assert split_questions(text) == []
+
+
+def test_dedupe_keeps_first_occurrences():
+    assert dedupe(["Solve x + 1 = 0", "solve x+1=0?", "Factor x^2 - 1"]) == (["Solve x + 1 = 0", "Factor x^2 - 1"], 1)
+
+
+def test_parse_problem_set_limit(monkeypatch):
+    monkeypatch.setattr(problem_set, "MAX_BATCH_QUESTIONS", 2)
+    assert parse_problem_set("1. Solve x = 1\n2. Solve x = 2\n2. Solve x = 2") == (["Solve x = 1", "Solve x = 2"], 1)
+    with pytest.raises(ValueError):
+        parse_problem_set("1. Solve x = 1\n2. Solve x = 2\n3. Solve x = 3")
@@ -0,0 +1,218 @@
+import asyncio
+import types
+import pytest
+import resilience
+import stub_llms
+import tools
+from config import llms_config
+from resilience import CircuitBreaker, CircuitOpen, DeadlineExceeded
+
+
+class ProviderError(Exception):
+    def __init__(self, status_code):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """The breakers' cool-down reads this clock."""
+    fake = FakeClock()
+    monkeypatch.setattr(resilience, "time", types.SimpleNamespace(monotonic=fake.monotonic))
+    return fake
+
+
+@pytest.fixture(autouse=True)
+def fast_retries(monkeypatch):
+    monkeypatch.setattr(resilience, "RETRY_BASE_DELAY", 0.001)
+    yield
+    resilience.reset()
+
+
+def _failing(error, calls):
+    async def make_call():
+        calls.append(1)
+        raise error
+    return make_call
+
+
+# --- Circuit breaker ---
+def test_breaker_opens_after_consecutive_failures(clock):
+    breaker = CircuitBreaker("test-open", consecutive=3, min_calls=10, open_seconds=30)
+    for _ in range(2):
+        assert breaker.allow()
+        breaker.record(False, 0.1)
+    assert breaker.state == "closed"
+    breaker.record(False, 0.1)
+    assert breaker.state == "open" and not breaker.allow() and breaker.is_open()
+
+
+def test_breaker_opens_on_failure_rate(clock):
+    breaker = CircuitBreaker("test-rate", window=4, min_calls=4, failure_rate=0.5, consecutive=10)
+    for ok in (True, False, True):
+        breaker.record(ok, 0.1)
+    assert breaker.state == "closed"
+    breaker.record(False, 0.1)
+    assert breaker.state == "open"
+
+
+def test_slow_calls_count_as_failures(clock):
+    breaker = CircuitBreaker("test-slow", slow_call=5.0, consecutive=2)
+    breaker.record(True, 6.0)
+    breaker.record(True, 6.0)
+    assert breaker.state == "open"
+
+
+def test_half_open_probe_closes_the_breaker(clock):
+    breaker = CircuitBreaker("test-close", consecutive=1, open_seconds=30)
+    breaker.record(False, 0.1)
+    clock.now += 29
+    assert not breaker.allow()
+    clock.now += 2
+    assert breaker.allow() and breaker.state == "half_open"
+    assert not breaker.allow()  # A single probe at a time
+    breaker.record(True, 0.1)
+    assert breaker.state == "closed" and breaker.allow() and breaker.allow()
+
+
+def test_half_open_probe_failure_reopens_the_breaker(clock):
+    breaker = CircuitBreaker("test-reopen", consecutive=1, open_seconds=30)
+    breaker.record(False, 0.1)
+    clock.now += 31
+    assert breaker.allow()
+    breaker.record(False, 0.1)
+    assert breaker.state == "open" and not breaker.allow()
+    clock.now += 31
+    assert breaker.allow() and breaker.state == "half_open"
+
+
+def test_released_probe_lets_the_next_one_through(clock):
+    breaker = CircuitBreaker("test-release", consecutive=1, open_seconds=30)
+    breaker.record(False, 0.1)
+    clock.now += 31
+    assert breaker.allow()
+    breaker.release()
+    assert breaker.allow() and breaker.state == "half_open"
+
+
+# --- Retries ---
+@pytest.mark.parametrize("attempt", [1, 2, 3, 6, 10])
+def test_backoff_stays_within_the_jitter_bounds(monkeypatch, attempt):
+    monkeypatch.setattr(resilience, "RETRY_BASE_DELAY", 0.5)
+    cap = min(resilience.RETRY_MAX_DELAY, 0.5 * 2 ** (attempt - 1))
+    delays = [resilience._backoff(attempt) for _ in range(500)]
+    assert all(0 <= delay <= cap for delay in delays)
+    assert max(delays) > cap / 2  # Full jitter spreads over the whole range
+
+
+def test_transient_errors_are_retried_and_open_the_breaker():
+    calls, record = [], {}
+    with pytest.raises(ProviderError):
+        asyncio.run(resilience.call("test-transient", _failing(ProviderError(503), calls), record=record))
+    assert len(calls) == resilience.RETRY_ATTEMPTS
+    assert record["retries"] == resilience.RETRY_ATTEMPTS - 1
+    assert resilience.get_breaker("test-transient").snapshot()["recent_failures"] == resilience.RETRY_ATTEMPTS
+
+
+def test_non_transient_errors_are_not_retried_nor_counted():
+    calls = []
+    with pytest.raises(ProviderError):
+        asyncio.run(resilience.call("test-client-error", _failing(ProviderError(400), calls)))
+    assert len(calls) == 1
+    snapshot = resilience.get_breaker("test-client-error").snapshot()
+    assert snapshot["recent_calls"] == 0 and snapshot["state"] == "closed"
+
+
+def test_open_breaker_fails_fast():
+    breaker = resilience.get_breaker("test-fail-fast")
+    for _ in range(breaker.consecutive):
+        breaker.record(False, 0.1)
+    calls = []
+    with pytest.raises(CircuitOpen):
+        asyncio.run(resilience.call("test-fail-fast", _failing(ProviderError(503), calls)))
+    assert calls == []
+
+
+# --- Deadlines ---
+def test_call_is_cut_at_the_request_deadline():
+    async def slow():
+        await asyncio.sleep(5)
+
+    async def scenario():
+        with resilience.request_scope(0.05):
+            await resilience.call("test-deadline", slow)
+    with pytest.raises(DeadlineExceeded):
+        asyncio.run(scenario())
+
+
+def test_expired_deadline_rejects_the_call():
+    calls = []
+
+    async def scenario():
+        with resilience.request_scope(0):
+            await resilience.call("test-expired", _failing(ProviderError(503), calls))
+    with pytest.raises(DeadlineExceeded):
+        asyncio.run(scenario())
+    assert calls == []
+
+
+def _stream(first_chunk_delay):
+    async def make_stream():
+        await asyncio.sleep(first_chunk_delay)
+        for word in ("a ", "b"):
+            yield word
+    return make_stream
+
+
+@pytest.mark.parametrize("delay, failures", [(0.0, 0), (0.05, 1)])
+def test_stream_first_chunk_latency_counts_toward_the_breaker(monkeypatch, delay, failures):
+    provider = f"test-stream-{delay}"
+    monkeypatch.setitem(resilience.SLOW_CALLS, provider, 0.02)
+
+    async def scenario():
+        return [chunk async for chunk in resilience.stream(provider, _stream(delay))]
+    assert asyncio.run(scenario()) == ["a ", "b"]
+    snapshot = resilience.get_breaker(provider).snapshot()
+    assert snapshot["recent_calls"] == 1 and snapshot["recent_failures"] == failures
+
+
+# --- Fallbacks ---
+@pytest.fixture
+def failing_deepseek():
+    stub_llms.install()
+    llms_config.override(
+        gemini=stub_llms.StubChatModel(name="stub-gemini", latency=0.0, tokens_per_second=0, reply="gemini answer"),
+        deepseek=stub_llms.StubChatModel(name="stub-deepseek", latency=0.0, tokens_per_second=0, error_rate=1.0),
+    )
+    yield
+    stub_llms.install()
+
+
+def test_failing_deepseek_falls_back_to_gemini(failing_deepseek):
+    async def scenario():
+        with resilience.request_scope(30) as scope:
+            answer = await tools.adeepseek("Prove that sqrt(2) is irrational")
+            return answer, scope.fallbacks, resilience.degraded()
+    answer, fallbacks, degraded = asyncio.run(scenario())
+    assert answer == "gemini answer"
+    assert degraded
+    assert [(f["stage"], f["from"], f["to"]) for f in fallbacks] == [("tool", "deepseek", "gemini")]
+
+
+def test_degraded_only_inside_a_request_with_a_tool_fallback():
+    assert not resilience.degraded()
+    with resilience.request_scope(30):
+        assert not resilience.degraded()
+        resilience.note_fallback("router", "gemini", "local", "timeout")
+        assert not resilience.degraded()
+        resilience.note_fallback("tool", "deepseek", "gemini", "503")
+        assert resilience.degraded()
+    assert not resilience.degraded()
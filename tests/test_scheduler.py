@@ -0,0 +1,127 @@
+import asyncio
+import types
+import pytest
+import rate_limit
+import scheduler
+from scheduler import ProviderScheduler, SchedulerBusy, EXPLAIN, REASON
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Queue aging and the token bucket read this clock; asyncio keeps the real one."""
+    fake = FakeClock()
+    monkeypatch.setattr(scheduler, "time", types.SimpleNamespace(monotonic=fake.monotonic))
+    monkeypatch.setattr(rate_limit, "time", types.SimpleNamespace(monotonic=fake.monotonic, sleep=None))
+    monkeypatch.setattr(scheduler, "POLL_INTERVAL", 0.01)
+    return fake
+
+
+async def _settle():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+async def _queue(provider, order, session, name, priority=EXPLAIN, tokens=0):
+    """Starts a call that records its name when it gets a slot; returns once it is queued."""
+    async def call():
+        with scheduler.use_session(session):
+            await provider.acquire(tokens, priority)
+        order.append(name)
+    task = asyncio.ensure_future(call())
+    await _settle()
+    return task
+
+
+async def _drain(provider, tasks):
+    """Releases the held slot, then each granted call's, in turn."""
+    for _ in tasks:
+        provider.release()
+        await _settle()
+    await asyncio.gather(*tasks)
+
+
+def test_sessions_take_turns(clock):
+    async def scenario():
+        provider, order = ProviderScheduler("test", concurrency=1), []
+        with scheduler.use_session("a"):
+            await provider.acquire()
+        tasks = [await _queue(provider, order, "a", f"a{index}") for index in (2, 3, 4)]
+        tasks.append(await _queue(provider, order, "b", "b1"))
+        await _drain(provider, tasks)
+        return order
+    # b has not been served yet, so its first call overtakes a's backlog; a's calls keep their order
+    assert asyncio.run(scenario()) == ["b1", "a2", "a3", "a4"]
+
+
+def test_session_queue_cap_rejects_without_blocking_others(clock):
+    async def scenario():
+        provider, order = ProviderScheduler("test", concurrency=1, max_per_session=4), []
+        await provider.acquire()
+        tasks = [await _queue(provider, order, "a", f"a{index}") for index in range(4)]
+        with scheduler.use_session("a"), pytest.raises(SchedulerBusy):
+            await provider.acquire()
+        tasks.append(await _queue(provider, order, "b", "b0"))
+        assert provider.get_stats()["rejected"] == 1
+        assert provider.get_stats()["waiting"] == 5
+        await _drain(provider, tasks)
+    asyncio.run(scenario())
+
+
+def test_provider_queue_cap(clock):
+    async def scenario():
+        provider, order = ProviderScheduler("test", concurrency=1, max_queue=2), []
+        await provider.acquire()
+        tasks = [await _queue(provider, order, session, session) for session in ("a", "b")]
+        with scheduler.use_session("c"), pytest.raises(SchedulerBusy):
+            await provider.acquire()
+        await _drain(provider, tasks)
+    asyncio.run(scenario())
+
+
+@pytest.mark.parametrize("waited, expected", [
+    (0.0, ["explain", "reason"]),                                # Explanations first
+    (scheduler.PRIORITY_AGING + 1, ["reason", "explain"]),       # An aged reasoning call is promoted
+])
+def test_priority_and_aging(clock, waited, expected):
+    async def scenario():
+        provider, order = ProviderScheduler("test", concurrency=1), []
+        await provider.acquire()
+        tasks = [await _queue(provider, order, "r", "reason", REASON)]
+        clock.now += waited
+        tasks.append(await _queue(provider, order, "e", "explain", EXPLAIN))
+        await _drain(provider, tasks)
+        return order
+    assert asyncio.run(scenario()) == expected
+
+
+def test_token_budget_refills(clock):
+    async def scenario():
+        provider, order = ProviderScheduler("test", concurrency=10, tokens_per_minute=60), []  # 1 token/s
+        await provider.acquire(tokens=60)            # The whole burst
+        task = await _queue(provider, order, "a", "a", tokens=30)
+        await asyncio.sleep(0.05)                    # Several polls: no budget yet
+        assert order == [] and provider.get_stats()["waiting"] == 1
+        clock.now += 29
+        await asyncio.sleep(0.05)
+        assert order == []
+        clock.now += 1                                # 30 tokens refilled
+        await asyncio.wait_for(task, 1)
+        assert order == ["a"]
+    asyncio.run(scenario())
+
+
+def test_release_charges_the_real_usage(clock):
+    async def scenario():
+        provider = ProviderScheduler("test", concurrency=10, tokens_per_minute=60)
+        reserved = await provider.acquire(tokens=10)
+        provider.release(reserved, used=40)          # 30 more than reserved
+        assert provider.bucket.tokens == pytest.approx(60 - 40)
+    asyncio.run(scenario())
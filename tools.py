@@ -1,20 +1,18 @@
+import time
 from langchain_core.tools import tool
-import streamlit as st
+import status
+import metrics
+import resilience
+from context_window import estimate_tokens
+from scheduler import EXPLAIN, REASON
+from async_utils import run_sync, iter_sync
 from config import llms_config
+import compute
 
-# --- Load LLM ---
-llm_gemini, llm_deepseek = llms_config.get_llms()
-
-# --- Tools ---
-@tool
-def use_gemini(question: str) -> str:
-    """Uses Gemini for definitions, clear explanations of mathematical concepts, established properties, formulas, or any factual response."""
-    if 'loading_placeholder' in st.session_state:
-        st.session_state.loading_placeholder.markdown("📘 **Explaining...**")
-
-    try:
-        # Enrich prompt with explicit formula instructions
-        prompt = f"""
+# --- Prompts ---
+def gemini_prompt(question: str) -> str:
+    # Enrich prompt with explicit formula instructions
+    return f"""
 You are a mathematics assistant.
 You must provide clear and concise explanations of mathematical concepts, definitions, properties, and formulas.
 
@@ -24,48 +22,190 @@ Ensure your response is accurate, pedagogical, and formatted cleanly.
 
 Question: {question}
 """
-        response = llm_gemini.invoke(prompt)
 
-        # Safe access to response content
-        if hasattr(response, 'content') and response.content:
-            return response.content
-        else:
-            return "[ERROR] Gemini returned empty or invalid response."
+def deepseek_prompt(question: str) -> str:
+    # Enrich prompt with explicit step-by-step and formula requirements
+    return f"""
+You are a mathematics assistant specialized in rigorous proofs, demonstrations, and problem solving.
+
+You must produce structured, step-by-step reasoning with clear justifications for each step.
+Do not provide only a conclusion — detailed reasoning is always required.
+
+Problem: {question}
+"""
+
+# --- Async implementations (the pipeline awaits these directly) ---
+# Provider calls go through `resilience`: deadline, retries on transient errors and
+# the provider's circuit breaker. When DeepSeek fails or its breaker is open, Gemini
+# answers with the reasoning prompt instead of returning an error.
+async def _ainvoke(provider: str, prompt: str, priority: int) -> str:
+    """Calls one provider and returns its text (raises on failure or empty output)."""
+    llm = llms_config.get_gemini() if provider == "gemini" else llms_config.get_deepseek()
+    with metrics.span("tool", provider=provider) as record:
+        response = await resilience.call(provider, lambda: llm.ainvoke(prompt), record=record,
+                                         tokens=estimate_tokens(prompt), priority=priority)
+        metrics.record_tokens(record, provider, response)
+
+    # Safe access to response content
+    if hasattr(response, 'content') and response.content:
+        return response.content
+    raise ValueError("empty or invalid response")
+
+
+async def agemini(question: str) -> str:
+    """Async implementation of `use_gemini`."""
+    status.set_status("📘 **Explaining...**")
+
+    try:
+        return await _ainvoke("gemini", gemini_prompt(question), EXPLAIN)
     except Exception as e:
-        st.error(f"Gemini failed: {e}")
+        status.error(f"Gemini failed: {e}")
         return f"[ERROR] Gemini failed: {e}"
     finally:
-        if 'loading_placeholder' in st.session_state:
-            st.session_state.loading_placeholder.empty()
+        status.clear_status()
+
+
+async def adeepseek(question: str) -> str:
+    """Async implementation of `use_deepseek` (degrades to Gemini with the same prompt)."""
+    status.set_status("🧠 **Reasoning...**")
+
+    try:
+        return await _ainvoke("deepseek", deepseek_prompt(question), REASON)
+    except Exception as e:
+        reason = e
+    finally:
+        status.clear_status()
+
+    status.warning(f"DeepSeek unavailable ({reason}), answering with Gemini instead.")
+    resilience.note_fallback("tool", "deepseek", "gemini", reason)
+    status.set_status("🧠 **Reasoning (Gemini)...**")
+    try:
+        return await _ainvoke("gemini", deepseek_prompt(question), REASON)
+    except Exception as e:
+        status.error(f"DeepSeek failed: {reason}; Gemini fallback failed: {e}")
+        return f"[ERROR] DeepSeek failed: {reason}"
+    finally:
+        status.clear_status()
+
+
+async def asympy(question: str) -> str:
+    """Async implementation of `use_sympy` (degrades to DeepSeek when the question can't be computed)."""
+    with metrics.span("compute"):
+        result = await compute.acompute(question)
+    if result:
+        return result.answer
+    resilience.note_fallback("tool", "sympy", "deepseek", "not computable locally")
+    return await adeepseek(question)
+
+
+# --- Tools (bound to the agent; sync wrappers around the async implementations) ---
+@tool
+def use_gemini(question: str) -> str:
+    """Uses Gemini for definitions, clear explanations of mathematical concepts, established properties, formulas, or any factual response."""
+    return run_sync(agemini(question))
 
 
 @tool
 def use_deepseek(question: str) -> str:
     """Uses DeepSeek for proofs, formal demonstrations, detailed reasoning, or problem solving that requires multiple logical steps."""
-    if 'loading_placeholder' in st.session_state:
-        st.session_state.loading_placeholder.markdown("🧠 **Reasoning...**")
+    return run_sync(adeepseek(question))
 
-    try:
-        # Enrich prompt with explicit step-by-step and formula requirements
-        prompt = f"""
-You are a mathematics assistant specialized in rigorous proofs, demonstrations, and problem solving.
 
-You must produce structured, step-by-step reasoning with clear justifications for each step.
-Do not provide only a conclusion — detailed reasoning is always required.
+@tool
+def use_sympy(question: str) -> str:
+    """Uses the local SymPy engine for purely computational questions (solve an equation, differentiate, integrate, a limit, simplify, an area...)."""
+    return run_sync(asympy(question))
 
-Problem: {question}
-"""
 
-        response = llm_deepseek.invoke(prompt)
+# --- Streaming variants (same prompts, tokens yielded as they arrive) ---
+def chunk_text(chunk) -> str:
+    """Extracts the text of a streamed message chunk (Gemini may send a list of parts)."""
+    content = getattr(chunk, "content", "")
+    if isinstance(content, list):
+        return "".join(part if isinstance(part, str) else part.get("text", "") for part in content)
+    return content or ""
 
-        # Safe access to response content
-        if hasattr(response, 'content') and response.content:
-            return response.content
-        else:
-            return "[ERROR] DeepSeek returned empty or invalid response."
+async def _astream_llm(provider: str, prompt: str, status_text: str, priority: int, fallback=None):
+    """Streams an LLM answer, keeping the status message up until the first token.
+
+    If the provider fails before its first token, `fallback` (a factory of another
+    stream) takes over. Cancelling the consumer (or closing the generator) aborts
+    the upstream request.
+    """
+    status.set_status(status_text)
+
+    received = False
+    reason = None
+    label = provider.lower()
+    started = time.perf_counter()
+    try:
+        llm = llms_config.get_gemini() if label == "gemini" else llms_config.get_deepseek()
+        with metrics.span("tool", provider=label, stream=True) as record:
+            chunks = resilience.stream(label, lambda: llm.astream(prompt), record=record,
+                                       tokens=estimate_tokens(prompt), priority=priority)
+            try:
+                async for chunk in chunks:
+                    metrics.record_tokens(record, label, chunk)
+                    text = chunk_text(chunk)
+                    if not text:
+                        continue
+                    if not received:
+                        status.clear_status()
+                        record["first_token_s"] = round(time.perf_counter() - started, 4)
+                        metrics.observe("euclidia_first_token_seconds", record["first_token_s"], provider=label)
+                    received = True
+                    yield text
+            finally:
+                await chunks.aclose()  # Frees the provider slot right away if the consumer stopped
+
+        if not received:
+            raise ValueError("empty or invalid response")
     except Exception as e:
-        st.error(f"DeepSeek failed: {e}")
-        return f"[ERROR] DeepSeek failed: {e}"
+        if received or fallback is None:
+            status.error(f"{provider} failed: {e}")
+            yield f"[ERROR] {provider} failed: {e}"
+            return
+        reason = e
+    finally:
+        status.clear_status()
+    if reason is None:
+        return
+
+    status.warning(f"{provider} unavailable ({reason}), answering with Gemini instead.")
+    resilience.note_fallback("tool", label, "gemini", reason)
+    stream = fallback()
+    try:
+        async for text in stream:
+            yield text
     finally:
-        if 'loading_placeholder' in st.session_state:
-            st.session_state.loading_placeholder.empty()
+        await stream.aclose()
+
+def astream_gemini(question: str):
+    """Streaming counterpart of `use_gemini` (async generator)."""
+    return _astream_llm("Gemini", gemini_prompt(question), "📘 **Explaining...**", EXPLAIN)
+
+def astream_deepseek(question: str):
+    """Streaming counterpart of `use_deepseek` (async generator, degrades to Gemini)."""
+    fallback = lambda: _astream_llm("Gemini", deepseek_prompt(question), "🧠 **Reasoning (Gemini)...**", REASON)
+    return _astream_llm("DeepSeek", deepseek_prompt(question), "🧠 **Reasoning...**", REASON, fallback)
+
+async def astream_sympy(question: str):
+    """Streaming counterpart of `use_sympy`: the computed answer in one chunk, or DeepSeek's stream."""
+    with metrics.span("compute"):
+        result = await compute.acompute(question)
+    if result:
+        yield result.answer
+        return
+    resilience.note_fallback("tool", "sympy", "deepseek", "not computable locally")
+    stream = astream_deepseek(question)
+    try:
+        async for text in stream:
+            yield text
+    finally:
+        await stream.aclose()
+
+def stream_gemini(question: str):
+    return iter_sync(astream_gemini(question))
+
+def stream_deepseek(question: str):
+    return iter_sync(astream_deepseek(question))
@@ -0,0 +1,115 @@
+"""Chat transcript: messages prepared once, pages of turns, collapsed long proofs.
+
+Preparing a message for display (normalizing its LaTeX, cutting a long answer
+into a preview and the rest at a block boundary, never inside a formula) is
+cached by the hash of its content, so a rerun only pays for messages it has
+not shown yet. The page only draws one page of turns and only sends a long
+proof in full once it is expanded, so its render time and payload stay flat
+however long the conversation gets.
+"""
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from langchain_core.messages import HumanMessage
+import metrics
+from latex_utils import normalize_latex, split_blocks
+
+PAGE_TURNS = int(os.getenv("EUCLIDIA_TRANSCRIPT_PAGE", "5"))  # Question/answer pairs per page
+PREVIEW_CHARS = 1200      # Longer messages are collapsed to about this much
+RENDER_CACHE_SIZE = 512   # Prepared messages kept in memory (shared by every session)
+
+
+@dataclass
+class RenderedMessage:
+    key: str
+    role: str        # "human" or "ai"
+    preview: str     # Shown when collapsed (the whole text for short messages)
+    rest: str        # The remainder, empty when the message is not collapsible
+
+    @property
+    def collapsible(self) -> bool:
+        return bool(self.rest)
+
+    @property
+    def full(self) -> str:
+        return self.preview + self.rest
+
+
+def message_key(message) -> str:
+    return hashlib.sha1(f"{message.type}\0{message.content}".encode("utf-8")).hexdigest()
+
+
+def prepare(message, key: str = None) -> RenderedMessage:
+    """Normalized text of the message, cut after the block that reaches PREVIEW_CHARS."""
+    text = normalize_latex(message.content).text
+    preview, rest = text, ""
+    if len(text) > PREVIEW_CHARS * 1.5:  # Collapsing only pays off if enough is hidden
+        blocks = split_blocks(text)
+        size = 0
+        for index, block in enumerate(blocks):
+            size += len(block)
+            if size >= PREVIEW_CHARS:
+                preview, rest = "".join(blocks[:index + 1]), "".join(blocks[index + 1:])
+                break
+    return RenderedMessage(key or message_key(message), message.type, preview, rest)
+
+
+class RenderCache:
+    """LRU of prepared messages, keyed by message hash."""
+
+    def __init__(self, max_entries=RENDER_CACHE_SIZE):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0}
+
+    def get(self, message) -> RenderedMessage:
+        key = message_key(message)
+        with self.lock:
+            rendered = self.entries.get(key)
+            if rendered is not None:
+                self.entries.move_to_end(key)
+                self.stats["hits"] += 1
+                return rendered
+        rendered = prepare(message, key)
+        with self.lock:
+            self.stats["misses"] += 1
+            self.entries[key] = rendered
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        return rendered
+
+    def get_stats(self) -> dict:
+        with self.lock:
+            return {"entries": len(self.entries), **self.stats}
+
+
+render_cache = RenderCache()
+
+
+def group_turns(history) -> list:
+    """Groups `(seq, message)` pairs (oldest first) into turns: `(seq, [RenderedMessage, ...])`, newest turn first."""
+    turns = []
+    for seq, message in history:
+        if isinstance(message, HumanMessage) or not turns:
+            turns.append((seq, []))
+        turns[-1][1].append(render_cache.get(message))
+    return turns[::-1]
+
+
+def page(store, session_id: str, before: int = None):
+    """One page of the transcript, the turns stored before position `before` (None: the latest ones).
+
+    Returns `(turns, older)`, where `older` is the `before` of the previous page (None if there is none).
+    A page never starts in the middle of a turn: a leading answer is left to the older page.
+    """
+    history = store.history(session_id, limit=PAGE_TURNS * 2, before=before)
+    if len(history) > 1 and not isinstance(history[0][1], HumanMessage):
+        history = history[1:]
+    older = history[0][0] if history and history[0][0] > 0 else None
+    return group_turns(history), older
+
+
+metrics.metrics.register_collector(lambda: {f"euclidia_transcript_{key}": value for key, value in render_cache.get_stats().items()})